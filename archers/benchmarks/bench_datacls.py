@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Slotted records with generated wire tuples against the former plain
+dataclasses serialized with asdict(): memory per 10k players and the
+per-snapshot encode time.
+
+    python -m benchmarks.bench_datacls [n_players ...]
+"""
+import sys
+import random
+import timeit
+import tracemalloc
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict
+import umsgpack
+from common.core import MOVE_MAP
+from common.datacls import PlayerData, GameData
+
+SEED = 1234
+MEM_PLAYERS = 10000
+
+
+@dataclass
+class PlayerDataLegacy:
+    id: int
+    ts: float
+    position: List
+    keys_pressed: Dict
+    speed: int
+    facing: int = 0
+    seq: int = 0
+
+
+@dataclass
+class GameDataLegacy:
+    players: List[PlayerDataLegacy] = field(default_factory=lambda: [])
+    updated_at: float = .0
+    evt: int = 0
+    tick: int = 0
+    srv_time: float = .0
+
+
+def make_players(klass, n):
+    rnd = random.Random(SEED)
+    return [klass(i, rnd.uniform(0, 1e9), [rnd.uniform(0, 800), rnd.uniform(0, 600)],
+                  {k: rnd.random() < 0.3 for k in MOVE_MAP}, 100, rnd.randrange(1, 5), i)
+            for i in range(n)]
+
+
+def measure_memory(klass, n):
+    # size of the records alone, their position lists and keys dicts are
+    # the same in both layouts
+    players = make_players(klass, n)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = [klass(p.id, p.ts, p.position, p.keys_pressed, p.speed, p.facing, p.seq)
+               for p in players]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(s.size_diff for s in after.compare_to(before, 'filename'))
+    del records
+    return size
+
+
+def bench_encode(n):
+    legacy = GameDataLegacy(players=make_players(PlayerDataLegacy, n), tick=1, srv_time=1.0)
+    slotted = GameData(players=make_players(PlayerData, n), tick=1, srv_time=1.0)
+    assert [tuple(d.values()) for d in asdict(legacy)['players']] == \
+        [tuple(t) for t in slotted.to_wire()[0]]
+    number = max(1, 20000 // max(n, 1))
+    res = {}
+    for name, fn in (('asdict', lambda: asdict(legacy)), ('to_wire', slotted.to_wire)):
+        res[name] = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    wire = slotted.to_wire()
+    packed = umsgpack.packb(wire)
+    res['from_wire'] = min(timeit.repeat(lambda: GameData.from_wire(wire), number=number, repeat=5)) / number
+    res['dict_bytes'] = len(umsgpack.packb(asdict(legacy)))
+    res['wire_bytes'] = len(packed)
+    return res
+
+
+def main(sizes):
+    legacy = measure_memory(PlayerDataLegacy, MEM_PLAYERS)
+    slotted = measure_memory(PlayerData, MEM_PLAYERS)
+    print('memory per %d players: dataclass %.0f KB, slotted %.0f KB (%.0f / %.0f bytes each)'
+          % (MEM_PLAYERS, legacy / 1024, slotted / 1024, legacy / MEM_PLAYERS, slotted / MEM_PLAYERS))
+    print()
+    print('%8s %12s %12s %12s %12s %12s' % ('players', 'asdict us', 'to_wire us', 'from_wire us',
+                                             'dict bytes', 'wire bytes'))
+    for n in sizes:
+        r = bench_encode(n)
+        print('%8d %12.1f %12.1f %12.1f %12d %12d' % (
+            n, r['asdict'] * 1e6, r['to_wire'] * 1e6, r['from_wire'] * 1e6,
+            r['dict_bytes'], r['wire_bytes']))
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [2, 10, 50, 200])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Frame update time of the remote players: per-player JitterBuffer path
+against the batched NumPy path (RemoteSnapshots).
+
+    python -m benchmarks.bench_interp [n_players ...]
+"""
+import sys
+import time
+import random
+from types import SimpleNamespace
+from common.vector2 import Vector2
+from common.datacls import PlayerData, ClientPlayerData
+from common.entities import EntityTable
+from common.jitterbuffer import JitterBuffer
+from common.batchinterp import HAVE_NUMPY, RemoteSnapshots
+
+SEED = 1234
+FRAMES = 300
+SNAPSHOT_EVERY = 4  # frames, i.e. 15 Hz snapshots at 60 fps
+DT = 1 / 60
+
+
+def make_entities(n):
+    entities = EntityTable()
+    for i in range(1, n + 1):
+        data = ClientPlayerData(id=i, ts=0, position=[0.0, 0.0], keys_pressed=None, speed=None)
+        sprite = SimpleNamespace(center_x=0.0, center_y=0.0, change_x=0.0, change_y=0.0, state=1)
+        entities.add(data, sprite)
+    return entities
+
+
+def make_snapshots(n, count):
+    rnd = random.Random(SEED)
+    players = [PlayerData(id=i, ts=0, position=[rnd.uniform(0, 800), rnd.uniform(0, 600)],
+                          keys_pressed={}, speed=100) for i in range(1, n + 1)]
+    snapshots = []
+    for k in range(count):
+        for p in players:
+            p.position = [p.position[0] + rnd.uniform(-2, 2), p.position[1] + rnd.uniform(-2, 2)]
+        snapshots.append([PlayerData.from_wire(p.to_wire()) for p in players])
+    return snapshots
+
+
+def move_sprites(entities):
+    # what SpriteList.update() does for these sprites
+    for e in entities:
+        e.sprite.center_x += e.sprite.change_x
+        e.sprite.center_y += e.sprite.change_y
+
+
+def bench_per_entity(n, snapshots):
+    entities = make_entities(n)
+    for e in entities:
+        e.data.snap_buffer = JitterBuffer(adaptive=False)
+    now = 1000.0
+    total = 0.0
+    for frame in range(FRAMES):
+        now += DT
+        if frame % SNAPSHOT_EVERY == 0:
+            for p in snapshots[frame // SNAPSHOT_EVERY]:
+                e = entities.get(p.id)
+                e.data.snap_buffer.push(now - 0.05, p.position, local_time=now)
+        t0 = time.perf_counter()
+        for e in entities:
+            # ArcadeGame.update_calc_pos_client for a remote player
+            last_pos = Vector2(e.sprite.center_x, e.sprite.center_y)
+            new_pos = Vector2(e.data.snap_buffer.sample(now)[1])
+            e.sprite.change_x, e.sprite.change_y = new_pos - last_pos
+            e.data.position = new_pos.as_list
+            e.data.facing = e.sprite.state
+        total += time.perf_counter() - t0
+        move_sprites(entities)
+    return total / FRAMES
+
+
+def bench_batch(n, snapshots):
+    entities = make_entities(n)
+    batch = RemoteSnapshots(adaptive=False)
+    now = 1000.0
+    total = 0.0
+    for frame in range(FRAMES):
+        now += DT
+        if frame % SNAPSHOT_EVERY == 0:
+            batch.push(now - 0.05, snapshots[frame // SNAPSHOT_EVERY], local_time=now)
+        t0 = time.perf_counter()
+        batch.update_sprites(entities, now)
+        total += time.perf_counter() - t0
+        move_sprites(entities)
+    return total / FRAMES
+
+
+def main(sizes):
+    print('%8s %14s %14s' % ('players', 'per-entity ms', 'batched ms'))
+    for n in sizes:
+        snapshots = make_snapshots(n, FRAMES // SNAPSHOT_EVERY + 1)
+        per_entity = bench_per_entity(n, snapshots) * 1000
+        batched = bench_batch(n, snapshots) * 1000 if HAVE_NUMPY else float('nan')
+        print('%8d %14.3f %14.3f' % (n, per_entity, batched))
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [50, 200, 1000])
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+apply_movement microbenchmark: the direction table against the former
+Vector2 sum + normalize, checking the results are identical.
+
+    python -m benchmarks.bench_movement
+"""
+import random
+import timeit
+from common.vector2 import Vector2
+from common.core import MOVE_MAP, KEY_BITS, apply_movement, apply_movement_batch
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEED = 1234
+N = 20000
+
+
+def apply_movement_legacy(speed, dt, current_position, kp, normalize=True):
+    if isinstance(kp, dict):
+        _v = sum(kp[k] * MOVE_MAP[k] for k in kp)
+    else:
+        _v = sum(kp.keys[k] * MOVE_MAP[k] for k in kp.keys)
+    if normalize:
+        _delta_position = _v.get_normalized()
+    else:
+        _delta_position = _v
+    return current_position + (_delta_position * speed * dt)
+
+
+def make_cases(n):
+    rnd = random.Random(SEED)
+    cases = []
+    for _ in range(n):
+        mask = rnd.randrange(1, 16)
+        kp = {k: bool(mask & bit) for k, bit in KEY_BITS.items()}
+        pos = Vector2(rnd.uniform(0, 800), rnd.uniform(0, 600))
+        cases.append((rnd.choice((100, 150)), rnd.uniform(0.001, 0.05), pos, kp, mask))
+    return cases
+
+
+def check(cases):
+    for speed, dt, pos, kp, mask in cases:
+        for normalize in (True, False):
+            ref = apply_movement_legacy(speed, dt, pos, kp, normalize)
+            assert apply_movement(speed, dt, pos, kp, normalize) == ref
+            assert apply_movement(speed, dt, pos, mask, normalize) == ref
+    if np is not None:
+        positions = np.array([tuple(c[2]) for c in cases])
+        res = apply_movement_batch([c[0] for c in cases], 0.016, positions, [c[4] for c in cases])
+        for (speed, _, pos, kp, _), r in zip(cases, res):
+            assert tuple(r) == tuple(apply_movement_legacy(speed, 0.016, pos, kp))
+
+
+def main():
+    cases = make_cases(N)
+    check(cases)
+    legacy = timeit.timeit(lambda: [apply_movement_legacy(s, dt, p, kp) for s, dt, p, kp, _ in cases], number=5)
+    table = timeit.timeit(lambda: [apply_movement(s, dt, p, kp) for s, dt, p, kp, _ in cases], number=5)
+    masks = timeit.timeit(lambda: [apply_movement(s, dt, p, m) for s, dt, p, _, m in cases], number=5)
+    per_call = 1e9 / (5 * N)
+    print('legacy          %8.1f ns/call' % (legacy * per_call))
+    print('table (dict)    %8.1f ns/call' % (table * per_call))
+    print('table (mask)    %8.1f ns/call' % (masks * per_call))
+    if np is not None:
+        positions = np.array([tuple(c[2]) for c in cases])
+        speeds = np.array([c[0] for c in cases], dtype=float)
+        mask_arr = np.array([c[4] for c in cases])
+        out = np.empty_like(positions)
+        batch = timeit.timeit(lambda: apply_movement_batch(speeds, 0.016, positions, mask_arr, out=out), number=5)
+        print('batch (numpy)   %8.1f ns/entity' % (batch * per_call))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Server startup cost: import time and peak RSS of a fresh interpreter
+importing the game server, against one that also loads the graphics
+stack as the server used to do through common.helpers.
+
+    python -m benchmarks.bench_server_startup [runs]
+"""
+import sys
+import json
+import statistics
+import subprocess
+
+RUNS = 5
+GRAPHICS = ('arcade', 'pyglet', 'PIL')
+
+PROBE = '''
+import json, resource, sys, time
+t0 = time.perf_counter()
+%s
+t1 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'graphics': sorted(m for m in %r if m in sys.modules),
+}))
+'''
+
+CASES = (
+    ('gameserver', 'import gameserver'),
+    ('gameserver + arcade', 'import arcade, PIL.Image, gameserver'),
+)
+
+
+def probe(code):
+    out = subprocess.run([sys.executable, '-c', PROBE % (code, GRAPHICS)],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(runs):
+    print('%-22s %10s %10s  %s' % ('', 'import ms', 'RSS MB', 'graphics modules'))
+    for name, code in CASES:
+        try:
+            res = [probe(code) for _ in range(runs)]
+        except subprocess.CalledProcessError as e:
+            print('%-22s failed: %s' % (name, e.stderr.strip().splitlines()[-1]))
+            continue
+        print('%-22s %10.1f %10.1f  %s' % (
+            name,
+            statistics.median(r['import_ms'] for r in res),
+            statistics.median(r['maxrss_kb'] for r in res) / 1024,
+            ', '.join(res[0]['graphics']) or '-'))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else RUNS)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Vector2 operator chains against the in-place / out-parameter variants and
+against Vector2Array bulk operations.
+
+    python -m benchmarks.bench_vector2
+"""
+import random
+import timeit
+from common.vector2 import Vector2, Vector2Array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEED = 1234
+N = 10000
+REPEAT = 5
+
+
+def make_points(n):
+    rnd = random.Random(SEED)
+    return [(rnd.uniform(0, 800), rnd.uniform(0, 600)) for _ in range(n)]
+
+
+def chained(a, b):
+    # interp_pos-like chain: lerp towards 2*b - a and measure the distance
+    res = []
+    for p, q in zip(a, b):
+        p = Vector2(p)
+        q = Vector2(q)
+        target = 2*q - p
+        new = p.get_interpolated_to(target, 0.5)
+        res.append((new - q).get_length())
+    return res
+
+
+def in_place(a, b):
+    res = []
+    tmp = Vector2(0., 0.)
+    for (px, py), q in zip(a, b):
+        tmp.set(px, py)
+        tmp.lerp((2*q[0] - px, 2*q[1] - py), 0.5)
+        res.append(tmp.get_distance(q))
+    return res
+
+
+def packed(va, vb, out):
+    # out = lerp(a, 2*b - a, 0.5), then |out - b|
+    vb.scale(2., out)
+    out.sub(va)
+    va.lerp(out, 0.5, out)
+    out.sub(vb)
+    return out.lengths()
+
+
+def main():
+    a = make_points(N)
+    b = make_points(N)[::-1]
+    ref = chained(a, b)
+    assert in_place(a, b) == ref
+    per_op = 1e9 / (REPEAT * N)
+    print('chained operators   %8.1f ns/vector' % (timeit.timeit(lambda: chained(a, b), number=REPEAT) * per_op))
+    print('in-place / out      %8.1f ns/vector' % (timeit.timeit(lambda: in_place(a, b), number=REPEAT) * per_op))
+    for use_numpy in ((False, True) if np is not None else (False,)):
+        va = Vector2Array(a, use_numpy=use_numpy)
+        vb = Vector2Array(b, use_numpy=use_numpy)
+        out = Vector2Array.zeros(N, use_numpy=use_numpy)
+        res = packed(va, vb, out)
+        assert max(abs(x - y) for x, y in zip(res, ref)) < 1e-9
+        name = 'Vector2Array numpy' if use_numpy else 'Vector2Array array'
+        t = timeit.timeit(lambda: packed(va, vb, out), number=REPEAT)
+        print('%-19s %8.1f ns/vector' % (name, t * per_op))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+"""
+Benchmark suite of the protocol, simulation and client frame hot paths,
+with fixed seeds and JSON results compared against a stored baseline.
+
+    python -m benchmarks.suite                        # run and compare
+    python -m benchmarks.suite -k snapshot -o out.json
+    python -m benchmarks.suite --save-baseline        # update baseline.json
+
+Each case reports the best time per call over REPEAT runs. The baseline
+times are first scaled by how much faster or slower the reference case
+ran than when the baseline was saved, so that the comparison holds across
+machines and load. A case slower than its scaled baseline by more than
+--threshold is flagged as a regression and the exit status is 1.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import timeit
+from pathlib import Path
+from dataclasses import asdict
+import umsgpack
+from common.core import MOVE_MAP, KEY_BITS, FACE_RIGHT, KeysPressed, apply_movement
+from common.vector2 import Vector2
+from common.datacls import PlayerData, GameData, ClientPlayerData, GameState
+from common.entities import EntityTable
+from common.protocol import RPCProtocol
+from benchmarks.bench_datacls import make_players, PlayerDataLegacy, GameDataLegacy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEED = 1234
+REPEAT = 15
+THRESHOLD = 0.25  # flag cases more than 25% slower than the baseline
+BASELINE = Path(__file__).with_name('baseline.json')
+REFERENCE = 'reference.interpreter'  # always run, the others are scaled by it
+# metadata which must match the baseline for the comparison to mean much
+META_KEYS = ('python', 'implementation', 'machine', 'system', 'numpy')
+SNAPSHOT_PLAYERS = (10, 50, 200)
+SERVER_PLAYERS = (100, 1000)
+REPLAY_PLAYERS = 100
+REPLAY_TICKS = 600
+DISPATCH_BATCH = 200
+DT = 1 / 60
+
+CASES = []  # (name, setup), setup() returns the function to time
+
+
+def case(name):
+    def deco(setup):
+        CASES.append((name, setup))
+        return setup
+    return deco
+
+
+def random_keys(rnd):
+    mask = rnd.randrange(16)
+    return {k: bool(mask & bit) for k, bit in KEY_BITS.items()}
+
+
+# -- reference --------------------------------------------------------------
+
+@case(REFERENCE)
+def setup_reference():
+    # plain interpreter work (dict iteration, float math) which doesn't
+    # change with the game code, it only tracks the speed of the machine
+    data = {i: float(i) for i in range(256)}
+
+    def run():
+        total = 0.0
+        for k, v in data.items():
+            total += v * 0.5 + k
+        return total
+    return run
+
+
+# -- protocol ---------------------------------------------------------------
+
+class NullEndpoint:
+    def send(self, data, addr=None):
+        pass
+
+
+class BenchProtocol(RPCProtocol):
+    def __init__(self):
+        super().__init__(NullEndpoint())
+        self.calls = 0
+
+    def rpc_ff_ping(self, sender, payload):
+        self.calls += 1
+
+    def rpc_echo(self, sender, payload):
+        self.calls += 1
+        return payload
+
+
+def player_wire():
+    return make_players(PlayerData, 1)[0].to_wire()
+
+
+@case('protocol.encode_ff')
+def setup_encode():
+    proto = BenchProtocol()
+    payload = player_wire()
+    addr = ('127.0.0.1', 1234)
+    return lambda: proto.ff_set_player_state(addr, payload)
+
+
+def setup_dispatch(kind):
+    proto = BenchProtocol()
+    sender = BenchProtocol()
+    sent = []
+    sender._endpoint.send = lambda data, addr=None: sent.append(data)
+    call = sender.ff_ping if kind == 'ff' else sender.echo
+    call(('127.0.0.1', 1234), player_wire())
+    datagram = sent[0]
+    loop = asyncio.new_event_loop()
+    addr = ('127.0.0.1', 4321)
+
+    async def batch():
+        target = proto.calls + DISPATCH_BATCH
+        for _ in range(DISPATCH_BATCH):
+            proto.datagram_received(datagram, addr)
+        while proto.calls < target:
+            await asyncio.sleep(0)
+        # let the response sends run too
+        await asyncio.sleep(0)
+
+    def run():
+        loop.run_until_complete(batch())
+    return run, DISPATCH_BATCH
+
+
+case('protocol.dispatch_ff')(lambda: setup_dispatch('ff'))
+case('protocol.dispatch_request')(lambda: setup_dispatch('request'))
+
+
+@case('metrics.histogram_record')
+def setup_histogram_record():
+    from common.metrics import Histogram
+    rnd = random.Random(SEED)
+    h = Histogram()
+    values = [rnd.expovariate(1 / 0.002) for _ in range(64)]
+
+    def run():
+        for v in values:
+            h.record(v)
+    return run, len(values)
+
+
+def setup_profiler_zone(enabled):
+    from common.profiler import Profiler
+    p = Profiler(enabled=enabled)
+    outer, inner = p.zone('outer'), p.zone('inner')
+
+    def run():
+        with outer:
+            with inner:
+                pass
+    return run, 2
+
+
+case('profiler.zone[disabled]')(lambda: setup_profiler_zone(False))
+case('profiler.zone[enabled]')(lambda: setup_profiler_zone(True))
+
+
+# -- snapshots --------------------------------------------------------------
+
+def setup_snapshot_asdict(n):
+    gd = GameDataLegacy(players=make_players(PlayerDataLegacy, n), tick=1, srv_time=1.0)
+    return lambda: umsgpack.packb(['listen_for_game_state_or_event', [asdict(gd)]])
+
+
+def setup_snapshot_wire(n):
+    gd = GameData(players=make_players(PlayerData, n), tick=1, srv_time=1.0)
+    return lambda: umsgpack.packb(['listen_for_game_state_or_event', [gd.evt, gd.to_wire()]])
+
+
+def setup_snapshot_apply(n):
+    gd = GameData(players=make_players(PlayerData, n), tick=1, srv_time=1.0)
+    packed = umsgpack.packb(['listen_for_game_state_or_event', [gd.evt, gd.to_wire()]])
+    gamestate = GameState()
+
+    def run():
+        _, (_, wire) = umsgpack.unpackb(packed)
+        gamestate.apply_snapshot(wire)
+        gamestate.acquire_gamedata()
+    return run
+
+
+for _n in SNAPSHOT_PLAYERS:
+    case('snapshot.asdict_pack[%d]' % _n)(lambda n=_n: setup_snapshot_asdict(n))
+    case('snapshot.wire_pack[%d]' % _n)(lambda n=_n: setup_snapshot_wire(n))
+    case('snapshot.unpack_apply[%d]' % _n)(lambda n=_n: setup_snapshot_apply(n))
+
+
+# -- server simulation ------------------------------------------------------
+
+def setup_server_update(n):
+    from gameserver import ServerState
+    rnd = random.Random(SEED)
+    gd = GameData(players=make_players(PlayerData, n))
+    for p in gd.players:
+        p.keys_pressed = random_keys(rnd)
+    server_state = ServerState(gd)
+
+    def run():
+        gd.updated_at = time.time() - DT
+        server_state.update()
+    return run
+
+
+for _n in SERVER_PLAYERS:
+    case('server.update[%d]' % _n)(lambda n=_n: setup_server_update(n))
+
+
+@case('server.set_player_state')
+def setup_set_player_state():
+    # one input datagram as handled by the server, past the RPC dispatch
+    from replay import headless_server
+    _, protocol = headless_server(SEED)
+    sender = ('127.0.0.1', 40000)
+    protocol.rpc_create_player(sender, 1, 5000)
+    rnd = random.Random(SEED)
+    payload = PlayerData(id=1, ts=0.0, position=[0, 0], keys_pressed=random_keys(rnd),
+                         speed=100, seq=1).to_wire()
+    pending = protocol.gs_state.server_state.pending_inputs
+
+    def run():
+        protocol.rpc_ff_set_player_state(sender, payload)
+        # as if update() had run, or it is a duplicate the next time
+        pending.clear()
+    return run
+
+
+@case('server.replay_tick[%d]' % REPLAY_PLAYERS)
+def setup_replay():
+    """replay.py throughput on a synthetic recording, per tick"""
+    import replay
+    path = Path(tempfile.gettempdir()) / 'archers-replay-synth.log'
+    replay.synthesize(path, REPLAY_PLAYERS, REPLAY_TICKS, SEED)
+    return lambda: replay.replay(path), REPLAY_TICKS
+
+
+# -- movement and vectors ---------------------------------------------------
+
+@case('movement.apply_movement')
+def setup_apply_movement():
+    rnd = random.Random(SEED)
+    keys = [random_keys(rnd) for _ in range(64)]
+    pos = Vector2(400.0, 300.0)
+
+    def run():
+        for kp in keys:
+            apply_movement(100, DT, pos, kp)
+    return run, len(keys)
+
+
+@case('vector2.operators')
+def setup_vector2_ops():
+    a = Vector2(3.0, 4.0)
+    b = Vector2(1.5, -2.0)
+    return lambda: ((a + b) * 0.5 - b).get_length()
+
+
+@case('vector2.lerp_in_place')
+def setup_vector2_lerp():
+    a = Vector2(3.0, 4.0)
+    target = (10.0, -2.0)
+
+    def run():
+        a.set(3.0, 4.0)
+        a.lerp(target, 0.25)
+        return a.get_distance(target)
+    return run
+
+
+@case('vector2.normalize')
+def setup_vector2_normalize():
+    a = Vector2(3.0, 4.0)
+    return a.get_normalized
+
+
+# -- client frame -----------------------------------------------------------
+
+def setup_client_update(kind, n=50):
+    """ArcadeGame.update_calc_pos_client on a headless stand-in, n entities"""
+    import arcade
+    from common.arcadegame import ArcadeGame
+
+    class StandInSprite(arcade.Sprite):
+        def __init__(self):
+            super().__init__()
+            self.movement_speed = 100
+            self.state = FACE_RIGHT
+
+    class HeadlessGame:
+        interp_pos = ArcadeGame.interp_pos
+        update_calc_pos_client = ArcadeGame.update_calc_pos_client
+
+        def __init__(self):
+            self.keys_pressed = KeysPressed()
+
+    rnd = random.Random(SEED)
+    game = HeadlessGame()
+    game.keys_pressed.keys.update(random_keys(rnd))
+    entities = EntityTable()
+    now = time.time()
+    for i in range(n):
+        pos = [rnd.uniform(0, 800), rnd.uniform(0, 600)]
+        data = ClientPlayerData(id=i, ts=now, position=pos[:], keys_pressed=random_keys(rnd), speed=100)
+        sprite = StandInSprite()
+        sprite.position = pos
+        for k in range(2):
+            data.pos_buffer.append(([pos[0] + k, pos[1] + k], now + k * 0.05))
+        if kind == 'remote':
+            for k in range(8):
+                data.snap_buffer.push(now - 0.4 + k * 0.05, (pos[0] + k, pos[1]), local_time=now - 0.35 + k * 0.05)
+        entities.add(data, sprite, local=(kind == 'local'))
+    ents = list(entities)
+
+    def run():
+        for e in ents:
+            game.update_calc_pos_client(DT, e)
+            e.sprite.update()
+    return run, n
+
+
+case('client.update_calc_pos[local]')(lambda: setup_client_update('local'))
+case('client.update_calc_pos[remote]')(lambda: setup_client_update('remote'))
+
+
+# -- runner -----------------------------------------------------------------
+
+def measure(setup, repeat=REPEAT):
+    res = setup()
+    fn, ops = res if isinstance(res, tuple) else (res, 1)
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number / ops
+
+
+def run_cases(pattern=None, repeat=REPEAT):
+    results = {}
+    for name, setup in CASES:
+        if pattern and pattern not in name and name != REFERENCE:
+            continue
+        random.seed(SEED)
+        try:
+            results[name] = measure(setup, repeat)
+        except ImportError as e:
+            print('%-36s skipped (%s)' % (name, e))
+            continue
+        print('%-36s %12.3f us' % (name, results[name] * 1e6))
+    return results
+
+
+def metadata():
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'machine': platform.machine(), 'system': platform.system(),
+            'numpy': np.__version__ if np is not None else None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'seed': SEED}
+
+
+def check_metadata(meta, baseline_meta):
+    """Returns the metadata differing from the baseline's, as strings"""
+    return ['%s %s (baseline %s)' % (k, meta.get(k), baseline_meta.get(k))
+            for k in META_KEYS if meta.get(k) != baseline_meta.get(k)]
+
+
+def compare(results, baseline, threshold=THRESHOLD, normalize=True):
+    """Returns the names of the cases slower than baseline by more than
+    threshold, after scaling the baseline by the reference case"""
+    regressions = []
+    scale = 1.0
+    if normalize and results.get(REFERENCE) and baseline.get(REFERENCE):
+        scale = results[REFERENCE] / baseline[REFERENCE]
+    print()
+    print('%s time %.2fx the baseline\'s' % (REFERENCE, scale))
+    print('%-36s %12s %12s %8s' % ('vs baseline', 'baseline us', 'current us', 'ratio'))
+    for name, t in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print('%-36s %12s %12.3f %8s' % (name, '-', t * 1e6, 'new'))
+            continue
+        if name == REFERENCE:
+            continue
+        base *= scale
+        ratio = t / base
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            flag = '  faster'
+        print('%-36s %12.3f %12.3f %8.2f%s' % (name, base * 1e6, t * 1e6, ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-k', dest='pattern', help='only run the cases containing this string')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=str(BASELINE))
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--absolute', action='store_true',
+                        help="compare the raw times, don't scale by %s" % REFERENCE)
+    args = parser.parse_args()
+
+    results = run_cases(args.pattern, args.repeat)
+    doc = {'meta': metadata(), 'unit': 'seconds per op', 'results': results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(doc, indent=2, sort_keys=True) + '\n')
+    if args.save_baseline:
+        baseline_path = Path(args.baseline)
+        if baseline_path.exists() and args.pattern:
+            # only replace the cases that were run
+            old = json.loads(baseline_path.read_text())
+            old['results'].update(results)
+            old['meta'] = doc['meta']
+            doc = old
+        baseline_path.write_text(json.dumps(doc, indent=2, sort_keys=True) + '\n')
+        print('baseline saved to %s' % baseline_path)
+        return 0
+    baseline_path = Path(args.baseline)
+    if not baseline_path.exists():
+        print('no baseline at %s' % baseline_path)
+        return 0
+    baseline = json.loads(baseline_path.read_text())
+    mismatch = check_metadata(doc['meta'], baseline.get('meta', {}))
+    if mismatch:
+        print('\nwarning: the baseline was saved on a different setup: %s' % ', '.join(mismatch))
+    regressions = compare(results, baseline['results'], args.threshold, not args.absolute)
+    if regressions:
+        print('\n%d regression(s) above %.0f%%: %s' % (len(regressions), args.threshold * 100,
+                                                      ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
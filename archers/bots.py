@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+"""
+Headless bots to load test the game server: many simulated players in a
+single asyncio process, each one running the regular client network code
+(GameThreadManager / RPCProtocol) without arcade, driven by a scripted
+input pattern.
+
+    python gameserver.py &
+    python bots.py -n 200 --duration 30
+
+Reports the server tick and publish times and snapshot size (from the
+server), packets per second and the input -> acknowledgement latency and
+clock sync RTT observed by the bots.
+
+With --loopback the server runs in the same process and the datagrams go
+through the in-memory fabric of common.loopback, in virtual time:
+
+    python bots.py -n 100 --duration 300 --loopback --latency 0.04 --loss 0.02
+"""
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict
+from common.core import KEY_UP, KEY_DOWN, KEY_LEFT, KEY_RIGHT, MOVE_MAP, PROJECTILE
+from common.core import TOPIC_PLAYERX_FIRE_WEAPON, SERVER_PORT
+from common.datacls import Event, GameState, ClientGameData, ClientPlayerData, ProjectileData
+from common.gamethreads import GameThreadManager, RPCServer2ClientProtocol
+from common.tracing import Tracer, TRACE_SAMPLE
+from common import logsetup
+
+BOTS = 50
+FIRST_PLAYER_ID = 1000
+FIRST_PORT = 5000
+DURATION = 30.0
+RAMP_UP = 5.0          # seconds to connect all the bots
+REPORT_PERIOD = 5.0
+DRIVE_PERIOD = 1/20    # how often the bots look at their script
+FIRE_PERIOD = 1.0
+SPEED = 100
+SEED = 1234
+PROBES = 32            # bots decoding snapshots to measure the latency
+
+PATTERNS = ('walk', 'circle', 'fire')
+
+
+def keys_state(*pressed):
+    return {k: k in pressed for k in MOVE_MAP}
+
+
+class Pattern:
+    """Scripted input: step() returns the new key state or None if unchanged"""
+
+    def __init__(self, rnd):
+        self.rnd = rnd
+        self.until = 0.0
+
+    def step(self, now):
+        return None
+
+    def fire(self, now):
+        return False
+
+
+class RandomWalk(Pattern):
+    CHOICES = ((), (KEY_UP,), (KEY_DOWN,), (KEY_LEFT,), (KEY_RIGHT,),
+               (KEY_UP, KEY_LEFT), (KEY_UP, KEY_RIGHT), (KEY_DOWN, KEY_LEFT), (KEY_DOWN, KEY_RIGHT))
+
+    def step(self, now):
+        if now < self.until:
+            return None
+        self.until = now + self.rnd.uniform(0.3, 2.0)
+        return keys_state(*self.rnd.choice(self.CHOICES))
+
+
+class Circle(Pattern):
+    TURN = (KEY_UP, KEY_RIGHT, KEY_DOWN, KEY_LEFT)
+
+    def __init__(self, rnd):
+        super().__init__(rnd)
+        self.i = rnd.randrange(len(self.TURN))
+        self.period = rnd.uniform(0.5, 1.5)
+
+    def step(self, now):
+        if now < self.until:
+            return None
+        self.until = now + self.period
+        self.i = (self.i + 1) % len(self.TURN)
+        return keys_state(self.TURN[self.i])
+
+
+class Firing(Pattern):
+    # stands still and shoots, with a short move now and then
+
+    def __init__(self, rnd):
+        super().__init__(rnd)
+        self.next_fire = rnd.uniform(0, FIRE_PERIOD)
+        self.moving = False
+
+    def step(self, now):
+        if now < self.until:
+            return None
+        self.moving = not self.moving and self.rnd.random() < 0.3
+        self.until = now + (0.3 if self.moving else self.rnd.uniform(1.0, 3.0))
+        return keys_state(self.rnd.choice(Circle.TURN)) if self.moving else keys_state()
+
+    def fire(self, now):
+        if now < self.next_fire:
+            return False
+        self.next_fire = now + FIRE_PERIOD
+        return True
+
+
+PATTERN_CLASSES = {'walk': RandomWalk, 'circle': Circle, 'fire': Firing}
+
+
+def percentiles(samples, ps=(50, 90, 99)):
+    if not samples:
+        return [float('nan')] * (len(ps) + 1)
+    s = sorted(samples)
+    return [s[min(len(s) - 1, int(len(s) * p / 100))] for p in ps] + [s[-1]]
+
+
+class LoadStats:
+    """Counters shared by all the bots of the process"""
+
+    def __init__(self):
+        self.snapshots = 0
+        self.events = 0
+        self.inputs = 0
+        self.shots = 0
+        self.skipped = 0  # datagrams counted but not decoded
+        self.latencies_ms = []  # input sent -> acknowledged in a snapshot
+
+    def reset_window(self):
+        latencies, self.latencies_ms = self.latencies_ms, []
+        return latencies
+
+
+@dataclass(slots=True)
+class BotGameData(ClientGameData):
+    # input seq -> perf_counter() when it was queued
+    input_sent: Dict = field(default_factory=dict)
+    stats: Any = None
+    probe: bool = False
+
+
+class BotProtocol(RPCServer2ClientProtocol):
+    # Bots only follow their own player, the rest of the snapshot isn't
+    # applied and events are just counted. Unpacking every snapshot for
+    # every bot would saturate this process long before the server, so
+    # unless full_decode is set only the probe bots decode them, and only
+    # while they have an input waiting for its acknowledgement. The other
+    # bots just count the datagrams.
+    full_decode = False
+
+    def datagram_received(self, data, addr):
+        cgamedata = self.cgamedata
+        if self.full_decode or cgamedata is None or (cgamedata.probe and cgamedata.input_sent) \
+                or (cgamedata.tracer is not None and cgamedata.tracer.active):
+            super().datagram_received(data, addr)
+            return
+        self.rx_packets += 1
+        self.rx_bytes += len(data)
+        self.cgamedata.stats.skipped += 1
+
+    def rpc_ff_listen_for_game_state_or_event(self, sender, evt, state_or_event):
+        if self.cgamedata is None:
+            return
+        stats = self.cgamedata.stats
+        if evt == 0:
+            stats.snapshots += 1
+            self.set_own_state(state_or_event)
+        else:
+            stats.events += 1
+
+    def set_own_state(self, gamedata_wire):
+        player = self.cgamedata.players[0]
+        last_ack = player.last_ack_seq
+        super().set_own_state(gamedata_wire)
+        if player.pos_buffer:
+            # no prediction or rendering, just follow the server
+            player.position[:] = player.pos_buffer[-1][0]
+        if player.last_ack_seq > last_ack:
+            now = time.perf_counter()
+            sent = self.cgamedata.input_sent
+            latencies = self.cgamedata.stats.latencies_ms
+            for seq in range(last_ack + 1, player.last_ack_seq + 1):
+                t = sent.pop(seq, None)
+                if t is not None:
+                    latencies.append((now - t) * 1000)
+
+
+class Bot(GameThreadManager):
+    server2client_protocol = BotProtocol
+
+    def __init__(self, player_id, remote_address, port, pattern, stats, loop, probe=False,
+                 remote_port=SERVER_PORT, tracer=None):
+        gamestate = GameState()
+        cgamedata = BotGameData(remote_address=remote_address, remote_port=remote_port,
+                                local_address_port=port, tracer=tracer,
+                                stats=stats, probe=probe)
+        cgamedata.players.append(ClientPlayerData(id=player_id, ts=time.time(), position=[0, 0],
+                                                  keys_pressed=keys_state(), speed=SPEED))
+        super().__init__(gamestate, cgamedata, loop=loop)
+        self.pattern = pattern
+        self.stats = stats
+        self.tasks = []
+        self.joined = False
+
+    async def init_player_state(self, gamestate, cgamedata):
+        self.joined = await super().init_player_state(gamestate, cgamedata)
+        return self.joined
+
+    def send_input(self, keys):
+        player = self._cgamedata.players[0]
+        # seq set_player_state will give this input
+        seq = player.seq + len(player.input_buffer) + 1
+        if self._cgamedata.probe or BotProtocol.full_decode:
+            self._cgamedata.input_sent[seq] = time.perf_counter()
+        tracer = self._cgamedata.tracer
+        player.input_buffer.append((keys, tracer.start() if tracer is not None else None))
+        self.stats.inputs += 1
+
+    def fire(self):
+        player = self._cgamedata.players[0]
+        projectile = ProjectileData(id=self.stats.shots, src_id=0, ts=time.time(),
+                                    position=player.position, speed=SPEED)
+        self._cgamedata.client_eventq.append(Event(Event.get_new_id(), ts=time.time(),
+            topic=TOPIC_PLAYERX_FIRE_WEAPON % player.id,
+            params=({'src': player.id, 'klass': PROJECTILE, 'obj': projectile.to_wire()},)))
+        self.stats.shots += 1
+
+    async def drive(self):
+        while self._running:
+            if self.joined:
+                now = time.perf_counter()
+                keys = self.pattern.step(now)
+                if keys is not None:
+                    self.send_input(keys)
+                if self.pattern.fire(now):
+                    self.fire()
+            await asyncio.sleep(DRIVE_PERIOD)
+
+    def start(self):
+        self.tasks = self.start_tasks()
+        self.tasks.append(self._loop.create_task(self.drive()))
+
+    async def shutdown(self):
+        self._running = False
+        for task in self.tasks:
+            task.cancel()
+        if self.joined:
+            await self.remove_player(self._gamestate, self._cgamedata)
+        for ep in (self.remote_ep, self.local_ep):
+            if ep is not None:
+                ep.close()
+
+    @property
+    def rtt_ms(self):
+        rtt = self._cgamedata.clock.rtt
+        return None if rtt is None else rtt * 1000
+
+    @property
+    def rx(self):
+        p = self.protocol2
+        return (0, 0) if p is None else (p.rx_packets, p.rx_bytes)
+
+    @property
+    def tx(self):
+        p = self.protocol
+        return (0, 0) if p is None else (p.tx_packets, p.tx_bytes)
+
+
+def traffic(bots):
+    rx_packets = rx_bytes = tx_packets = tx_bytes = 0
+    for bot in bots:
+        rp, rb = bot.rx
+        tp, tb = bot.tx
+        rx_packets += rp
+        rx_bytes += rb
+        tx_packets += tp
+        tx_bytes += tb
+    return rx_packets, rx_bytes, tx_packets, tx_bytes
+
+
+async def server_stats(bots, remote_address):
+    for bot in bots:
+        if bot.joined:
+            result = await bot.protocol.get_server_stats(remote_address)
+            if result[0]:
+                return result[1]
+            return None
+    return None
+
+
+def report(elapsed, window, bots, stats, latencies, traffic_delta, srv):
+    rx_packets, rx_bytes, tx_packets, tx_bytes = traffic_delta
+    p50, p90, p99, pmax = percentiles(latencies)
+    rtts = [bot.rtt_ms for bot in bots if bot.rtt_ms is not None]
+    r50, r90, r99, rmax = percentiles(rtts)
+    print('[%6.1fs] bots %d/%d  rx %.0f pkt/s %.1f KB/s  tx %.0f pkt/s %.1f KB/s' % (
+        elapsed, sum(bot.joined for bot in bots), len(bots),
+        rx_packets / window, rx_bytes / window / 1024, tx_packets / window, tx_bytes / window / 1024))
+    print('          input ack latency ms p50 %.1f p90 %.1f p99 %.1f max %.1f (%d samples)'
+          '  rtt ms p50 %.1f p99 %.1f' % (p50, p90, p99, pmax, len(latencies), r50, r99))
+    if srv:
+        print('          server tick ms %.3f avg %.3f max  publish ms %.2f avg %.2f max'
+              '  snapshot %d B (max %d)  players %d  eventq %d' % (
+            srv['tick_ms_avg'], srv['tick_ms_max'], srv['publish_ms_avg'], srv['publish_ms_max'],
+            srv['snapshot_bytes'], srv['snapshot_bytes_max'], srv['players'], srv['eventq_backlog']))
+    return {'elapsed': elapsed, 'bots': len(bots), 'joined': sum(bot.joined for bot in bots),
+            'rx_pps': rx_packets / window, 'rx_Bps': rx_bytes / window,
+            'tx_pps': tx_packets / window, 'tx_Bps': tx_bytes / window,
+            'latency_ms': {'p50': p50, 'p90': p90, 'p99': p99, 'max': pmax, 'n': len(latencies)},
+            'rtt_ms': {'p50': r50, 'p90': r90, 'p99': r99, 'max': rmax},
+            'inputs': stats.inputs, 'shots': stats.shots,
+            'snapshots': stats.snapshots, 'events': stats.events, 'skipped': stats.skipped,
+            'server': srv}
+
+
+async def run(n=BOTS, server='127.0.0.1', first_port=FIRST_PORT, first_id=FIRST_PLAYER_ID,
+              duration=DURATION, ramp_up=RAMP_UP, patterns=PATTERNS, report_period=REPORT_PERIOD,
+              seed=SEED, probes=PROBES, server_port=SERVER_PORT, trace=None, trace_sample=TRACE_SAMPLE):
+    """Run n bots against server for duration seconds, returns the reports.
+    trace: file the probe bots write the latency traces of their inputs to"""
+    loop = asyncio.get_running_loop()
+    rnd = random.Random(seed)
+    stats = LoadStats()
+    bots = []
+    for i in range(n):
+        pattern = PATTERN_CLASSES[patterns[i % len(patterns)]](random.Random(rnd.random()))
+        tracer = None
+        if trace is not None and i < probes:
+            tracer = Tracer(trace, sample=trace_sample, render=False, player_id=first_id + i,
+                            seed=first_id + i)
+        bots.append(Bot(first_id + i, server, first_port + i, pattern, stats, loop, probe=i < probes,
+                        remote_port=server_port, tracer=tracer))
+
+    t_start = time.perf_counter()
+    for i, bot in enumerate(bots):
+        bot.start()
+        # spread the connections over the ramp up
+        await asyncio.sleep(ramp_up / n)
+
+    reports = []
+    last = traffic(bots)
+    t_last = time.perf_counter()
+    stats.reset_window()
+    while time.perf_counter() - t_start < duration:
+        await asyncio.sleep(min(report_period, max(0.0, duration - (time.perf_counter() - t_start))))
+        now = time.perf_counter()
+        current = traffic(bots)
+        srv = await server_stats(bots, bots[0].remote_address)
+        reports.append(report(now - t_start, now - t_last, bots, stats, stats.reset_window(),
+                              [c - l for c, l in zip(current, last)], srv))
+        last = current
+        t_last = now
+
+    await asyncio.gather(*(bot.shutdown() for bot in bots), return_exceptions=True)
+    return reports
+
+
+def run_loopback(profile, seed=SEED, **kwargs):
+    """run() against an in-process server over a LoopbackFabric with the
+    LinkProfile profile, on a virtual clock"""
+    import gameserver
+    from common import loopback, gamethreads, datacls, jitterbuffer, clocksync, tracing
+    clock = loopback.VirtualClock()
+    loop = loopback.VirtualTimeLoop(clock)
+    fabric = loopback.LoopbackFabric(profile, seed=seed)
+    random.seed(seed)
+    game_state = datacls.GameData()
+    server_state = gameserver.ServerState(game_state)
+
+    async def simulate():
+        gs_state = gameserver.GameServerState(game_state, server_state)
+        tasks = [asyncio.create_task(gameserver.main(gs_state)),
+                 asyncio.create_task(gameserver.publish_game_state(gs_state))]
+        await asyncio.sleep(0.1)
+        try:
+            return await run(seed=seed, **kwargs)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    # the server tick durations are measured on the real clock (common.core
+    # isn't patched), everything else runs on the virtual one
+    modules = (sys.modules[__name__], gameserver, gamethreads, datacls, jitterbuffer, clocksync, tracing)
+    t0 = time.perf_counter()
+    with loopback.install(fabric), clock.patch(*modules):
+        try:
+            reports = loop.run_until_complete(simulate())
+        finally:
+            loop.close()
+    print('%.1f s simulated in %.1f s, fabric %s' % (
+        kwargs.get('duration', DURATION), time.perf_counter() - t0, fabric.stats()))
+    counters = server_state.metrics.snapshot()['counters']
+    print('server inputs: %d duplicate, %d recovered from the history, %d lost, %d merged' % tuple(
+        counters.get(name, 0) for name in ('duplicate_inputs', 'recovered_inputs', 'lost_inputs',
+                                           'merged_inputs')))
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--bots', type=int, default=BOTS)
+    parser.add_argument('--server', default='127.0.0.1', help='server address')
+    parser.add_argument('--server-port', type=int, default=SERVER_PORT,
+                        help='server port, e.g. the one of a netproxy.py in front of the server')
+    parser.add_argument('--port', type=int, default=FIRST_PORT,
+                        help='local port of the first bot, the others use the next ones')
+    parser.add_argument('--first-id', type=int, default=FIRST_PLAYER_ID)
+    parser.add_argument('--duration', type=float, default=DURATION)
+    parser.add_argument('--ramp-up', type=float, default=RAMP_UP)
+    parser.add_argument('--report', type=float, default=REPORT_PERIOD, help='report period (s)')
+    parser.add_argument('--patterns', default=','.join(PATTERNS),
+                        help='comma separated patterns given to the bots in turn (%s)' % ', '.join(PATTERNS))
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--probes', type=int, default=PROBES,
+                        help='number of bots measuring the input latency')
+    parser.add_argument('--full-decode', action='store_true',
+                        help='decode every snapshot (costs a lot of CPU in this process)')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='append latency traces of the probe bots inputs to FILE (see tracereport.py)')
+    parser.add_argument('--trace-sample', type=float, default=TRACE_SAMPLE)
+    parser.add_argument('--loopback', action='store_true',
+                        help='run the server in process over an in-memory network, in virtual time')
+    parser.add_argument('--latency', type=float, default=0.0, help='loopback one way latency (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='loopback jitter (s)')
+    parser.add_argument('--loss', type=float, default=0.0, help='loopback loss probability')
+    parser.add_argument('--bandwidth', type=float, default=None, help='loopback bytes/s per link')
+    args = parser.parse_args()
+    BotProtocol.full_decode = args.full_decode
+    logsetup.setup(logging.ERROR)
+
+    patterns = args.patterns.split(',')
+    for p in patterns:
+        if p not in PATTERN_CLASSES:
+            parser.error('unknown pattern %s' % p)
+    kwargs = dict(n=args.bots, first_port=args.port, first_id=args.first_id,
+                  duration=args.duration, ramp_up=args.ramp_up, patterns=patterns,
+                  report_period=args.report, probes=args.probes, trace_sample=args.trace_sample)
+    if args.trace:
+        kwargs['trace'] = open(args.trace, 'a')
+    try:
+        if args.loopback:
+            from common.loopback import LinkProfile
+            profile = LinkProfile(latency=args.latency, jitter=args.jitter, loss=args.loss,
+                                  bandwidth=args.bandwidth)
+            run_loopback(profile, seed=args.seed, **kwargs)
+        else:
+            asyncio.run(run(server=args.server, server_port=args.server_port, seed=args.seed, **kwargs))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.trace:
+            kwargs['trace'].close()
+
+
+if __name__ == "__main__":
+    main()
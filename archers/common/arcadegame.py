@@ -1,20 +1,47 @@
 import arcade
+import logging
 import sys
 import time
 from common.helpers import KeysPressed, MOVE_MAP, apply_movement, MeasureDuration
 from common.playercharacter import PlayerCharacter
-from common.projectile import Projectile
+from common.entities import EntityTable
+from common.batchinterp import HAVE_NUMPY, RemoteSnapshots
+from common.projectile import Projectile, ProjectileManager
 from common.vector2 import Vector2
 from common.datacls import PlayerData, GameData, ClientPlayerData, ClientGameData
 from common.datacls import ClientProjectileData
 from collections import deque
 from pubsub import pub
-from common.helpers import ROOT_PLAYER_ID, TOPIC_GSUPDATE, TOPIC_NEWPLAYER
+from common.helpers import ROOT_PLAYER_ID, TOPIC_NEWPLAYER
 from common.helpers import FACE_RIGHT, FACE_LEFT, FACE_UP, FACE_DOWN
 from common.helpers import TOPIC_PLAYERX_WEAPON_OUT, TOPIC_PLAYERX_WEAPON_SHOOT
 from common.helpers import TOPIC_PLAYERX_FIRE_WEAPON
 from common.helpers import PROJECTILE
 from common.datacls import Event
+from common.tracing import RECV, UPDATE, DRAWN
+from common.profiler import PROFILER
+from common.profileroverlay import ProfilerOverlay
+from common.logsetup import HotLog
+
+LOG = logging.getLogger(__name__)
+EVENTS_LOG = HotLog(LOG, rate=1, burst=1)
+
+# Server events handled per frame, whichever limit is hit first
+EVENTS_PER_FRAME = 64
+EVENTS_BUDGET_S = 0.004
+# Move all the remote players in one NumPy batch per frame (if available)
+BATCH_REMOTE_UPDATE = True
+# fraction of the distance to the server position covered each frame
+CORRECTION_BLEND = 0.5
+
+Z_UPDATE = PROFILER.zone('on_update')
+Z_DRAW = PROFILER.zone('on_draw')
+Z_SNAPSHOT = PROFILER.zone('snapshot')
+Z_EVENTS = PROFILER.zone('process_events')
+Z_CALC_POS = PROFILER.zone('calc_pos')
+Z_SPRITES = PROFILER.zone('sprites')
+Z_ANIMATION = PROFILER.zone('animation')
+Z_CORRECTION = PROFILER.zone('correction')
 
 
 class ArcadeGame(arcade.Window):
@@ -28,15 +55,32 @@ class ArcadeGame(arcade.Window):
         self.game_thread_manager = None
         self.srv_eventq = None
         self.client_eventq = None
-
-        pub.subscribe(self.on_gamestate_update, TOPIC_GSUPDATE)
-        pub.subscribe(self.on_new_player, TOPIC_NEWPLAYER)
+        self.events_per_frame = EVENTS_PER_FRAME
+        self.events_budget_s = EVENTS_BUDGET_S
+        # srv_eventq depth left after draining, and its maximum
+        self.srv_eventq_backlog = 0
+        self.srv_eventq_max_backlog = 0
+        # perf_counter time the last server correction of the local player
+        # was queued, it is applied to the sprite by the next frame
+        self.corr_queued_at = None
+        self.profiler_overlay = None
+
+        # topics handled here are dispatched directly, the others (player
+        # and weapon topics) still go through pubsub
+        self.event_handlers = {
+            TOPIC_NEWPLAYER: self.on_new_player,
+        }
 
     def setup(self, gamestate, cgamedata):
         self.gamestate = gamestate
         self.cgamedata = cgamedata
         self.all_sprites = arcade.SpriteList()
+        self.projectiles = ProjectileManager()
         self.players = []
+        self.entities = EntityTable()
+        self.remote_snapshots = None
+        if BATCH_REMOTE_UPDATE and HAVE_NUMPY:
+            self.remote_snapshots = RemoteSnapshots()
 
         player0_sprite = PlayerCharacter(ROOT_PLAYER_ID, self.picsdir, scale=1.5)
         player0_sprite.setup()
@@ -51,6 +95,7 @@ class ArcadeGame(arcade.Window):
         self.cgamedata.players[0].keys_pressed = self.keys_pressed.keys
         self.cgamedata.players[0].speed = player0_sprite.movement_speed
 
+        self.entities.add(self.cgamedata.players[0], player0_sprite, local=True)
         self.all_sprites.append(player0_sprite)
 
         self.srv_eventq = cgamedata.srv_eventq
@@ -60,16 +105,16 @@ class ArcadeGame(arcade.Window):
     def set_game_thread_manager(self, game_thread_manager):
         self.game_thread_manager = game_thread_manager
 
-    def interp_pos(self, player_sprite, idx):
-        pos_buff = self.cgamedata.players[idx].pos_buffer
+    def interp_pos(self, player_sprite, pdata):
+        pos_buff = pdata.pos_buffer
 
         if len(pos_buff) < 2:
             return False, None
 
         # These are the last two positions. p1 is the latest, p0 is the
         # one immediately preceding it.
-        p0, t0 = Vector2(pos_buff[0][0]), pos_buff[0][1]
-        p1, t1 = Vector2(pos_buff[1][0]), pos_buff[1][1]
+        (x0, y0), t0 = pos_buff[0]
+        (x1, y1), t1 = pos_buff[1]
         deltat = t1 - t0
 
         if deltat == 0:
@@ -77,137 +122,237 @@ class ArcadeGame(arcade.Window):
 
         #v = (p1 - p0) / deltat
         #predicted_future_pos = v * deltat + p1
-        predicted_future_pos = (2*p1 - p0)
+        predicted_future_pos = (2*x1 - x0, 2*y1 - y0)
 
-        x = self.cgamedata.players[idx].time_since_state_update / deltat
+        x = pdata.time_since_state_update / deltat
         x = min(x, 1)
-        _last_position = Vector2(player_sprite.position)
-        interpolated = _last_position.get_interpolated_to(predicted_future_pos, x)
+        interpolated = Vector2(player_sprite.position)
+        interpolated.lerp(predicted_future_pos, x)
         return True, interpolated
 
-    def update_calc_pos_client(self, dt, player_sprite, idx, interpolate=True):
+    def update_calc_pos_client(self, dt, entity, interpolate=True):
+        player_sprite = entity.sprite
+        pdata = entity.data
         last_pos = Vector2(player_sprite.position)
 
-        pos_corr_buff = self.cgamedata.players[idx].pos_corr_buff
+        pos_corr_buff = pdata.pos_corr_buff
+        snap_buffer = pdata.snap_buffer
+        corrected = False
 
-        if len(pos_corr_buff) > 0:
+        if not entity.local and interpolate and len(snap_buffer) > 0:
+            # remote players are rendered interp_delay behind the server
+            new_pos = last_pos.get_interpolated_to(snap_buffer.sample()[1], CORRECTION_BLEND)
+        elif len(pos_corr_buff) > 0:
+            corrected = True
             _new_pos = pos_corr_buff[0]
-            new_pos = last_pos.get_interpolated_to(_new_pos, 0.5)
-            if (_new_pos - new_pos).get_length() < 1.0:
+            new_pos = last_pos.get_interpolated_to(_new_pos, CORRECTION_BLEND)
+            if new_pos.get_distance(_new_pos) < 1.0:
                 pos_corr_buff.popleft()
         else:
-            _keys_pressed = self.keys_pressed if idx == 0 else self.cgamedata.players[idx].keys_pressed
+            _keys_pressed = self.keys_pressed if entity.local else pdata.keys_pressed
             if _keys_pressed is None:
                 return
             new_pos = apply_movement(player_sprite.movement_speed, dt, last_pos, _keys_pressed)
 
-            diff_pos = None
             if interpolate:
-                _interpolated = self.interp_pos(player_sprite, idx)
-                if _interpolated[0]:
-                    diff_pos = new_pos - _interpolated[1]
-
-            if (diff_pos is not None):
-                if diff_pos.get_length() > 10.0:
+                _interpolated = self.interp_pos(player_sprite, pdata)
+                if _interpolated[0] and new_pos.get_distance(_interpolated[1]) > 10.0:
                     new_pos = _interpolated[1]
 
-        player_sprite.change_x, player_sprite.change_y = new_pos - last_pos
+        player_sprite.change_x = new_pos.x - last_pos.x
+        player_sprite.change_y = new_pos.y - last_pos.y
 
-        self.cgamedata.players[idx].time_since_state_update += dt
+        pdata.time_since_state_update += dt
 
         if not isinstance(new_pos, list):
             _new_pos = new_pos.as_list
         else:
             _new_pos = new_pos
-        self.cgamedata.players[idx].position = _new_pos
-        self.cgamedata.players[idx].facing = player_sprite.state
+        pdata.position = _new_pos
+        pdata.facing = player_sprite.state
+        return corrected
 
     def on_draw(self):
-        arcade.start_render()
-        self.all_sprites.draw()
+        with Z_DRAW:
+            arcade.start_render()
+            self.all_sprites.draw()
+            self.projectiles.draw()
+        if self.profiler_overlay is not None:
+            self.profiler_overlay.draw(self.height)
+        tracer = self.cgamedata.tracer
+        if tracer is not None and tracer.active:
+            tracer.frame(UPDATE, DRAWN)
 
     def on_new_player(self, params):
         new_player_id = params[0]
-        print("on_new_player new_player_id = %d" % new_player_id)
-        if new_player_id == self.cgamedata.players[0].id:
+        LOG.info('on_new_player new_player_id = %d', new_player_id)
+        if new_player_id == self.cgamedata.players[0].id or new_player_id in self.entities:
             return
         _, p = self.gamestate.get_player_from_id(new_player_id)
         if p is None:
             return
+        self.add_remote_player(p)
 
+    def add_remote_player(self, p):
         new_player_sprite = PlayerCharacter(1, self.picsdir, scale=1.5)
         new_player_sprite.setup()
         self.players.append(new_player_sprite)
 
-        new_player = ClientPlayerData(id=new_player_id,ts=p.ts,position=p.position[:],keys_pressed=None, speed=None)
+        new_player = ClientPlayerData(id=p.id,ts=p.ts,position=p.position[:],keys_pressed=None, speed=None)
         self.cgamedata.players.append(new_player)
         new_player_sprite.position = new_player.position
 
         self.all_sprites.append(new_player_sprite)
-
-    def on_gamestate_update(self, params):
-        gd = params[0]
+        return self.entities.add(new_player, new_player_sprite)
+
+    def remove_remote_player(self, player_id):
+        entity = self.entities.remove(player_id)
+        if entity is None:
+            return False
+        LOG.info('player %d left', player_id)
+        self.all_sprites.remove(entity.sprite)
+        self.players.remove(entity.sprite)
+        self.cgamedata.players.remove(entity.data)
+        if self.remote_snapshots:
+            self.remote_snapshots.release(player_id)
+        return True
+
+    def on_gamestate_update(self, gd):
+        clock = self.cgamedata.clock
+        # jitter buffers want local - server time
+        clock_offset = -clock.offset if clock.synced else None
+        local_id = self.cgamedata.players[0].id
+        entities = self.entities
+        batch = self.remote_snapshots
+        if batch:
+            batch.set_clock_offset(clock_offset)
+            batch.push(gd.srv_time, gd.players, gd.tick, skip_id=local_id)
+        seen = 0
         for ps in gd.players:
-            for i, pd in enumerate(self.cgamedata.players):
-                if i != 0 and (ps.id == pd.id):
-                    pd.pos_buffer.append((ps.position[:], time.time()))
-                    pd.time_since_state_update = 0
-                    pd.position_snapshot = pd.position[:]
+            if ps.id == local_id:
+                seen += 1
+                continue
+            e = entities.get(ps.id)
+            if e is None:
+                # joined without us getting its TOPIC_NEWPLAYER event
+                e = self.add_remote_player(ps)
+            seen += 1
+            pd = e.data
+            pd.pos_buffer.append((ps.position[:], time.time()))
+            if not batch:
+                pd.snap_buffer.set_clock_offset(clock_offset)
+                pd.snap_buffer.push(gd.srv_time, ps.position, gd.tick)
+            pd.time_since_state_update = 0
+            pd.position_snapshot = pd.position[:]
+        if seen < len(entities):
+            for e in entities.missing_from(gd.players):
+                self.remove_remote_player(e.id)
 
     def process_events(self):
-        if len(self.srv_eventq) > 0:
-            e = self.srv_eventq.popleft()
-            pub.sendMessage(e.topic, params=e.params)
+        srv_eventq = self.srv_eventq
+        handlers = self.event_handlers
+        deadline = time.perf_counter() + self.events_budget_s
+        n = 0
+        while srv_eventq and n < self.events_per_frame:
+            e = srv_eventq.popleft()
+            handler = handlers.get(e.topic)
+            if handler is not None:
+                handler(e.params)
+            else:
+                pub.sendMessage(e.topic, params=e.params)
+            n += 1
+            if time.perf_counter() > deadline:
+                break
+        self.srv_eventq_backlog = len(srv_eventq)
+        if self.srv_eventq_backlog > self.srv_eventq_max_backlog:
+            self.srv_eventq_max_backlog = self.srv_eventq_backlog
+        if self.srv_eventq_backlog:
+            EVENTS_LOG.warning('srv_eventq backlog %d (max %d)',
+                               self.srv_eventq_backlog, self.srv_eventq_max_backlog)
+        return n
 
     def server_to_client_pos_corr_buff(self, delta_time):
-        for i, p in enumerate(self.players):
+        for e in self.entities:
+            p = e.sprite
             do_corr = False
             p.set_skip_facing_change(False)
-            pos_buff = self.cgamedata.players[i].pos_buffer
+            if not e.local and (self.remote_snapshots or len(e.data.snap_buffer) > 0):
+                # already following the server through the jitter buffer
+                continue
+            pos_buff = e.data.pos_buffer
             if len(pos_buff) == 2:
                 server_x, server_y = pos_buff[1][0]
                 do_corr = True
 
-            if i == 0 and not self.keys_pressed.hasKeyPressed():
+            if e.local and not self.keys_pressed.hasKeyPressed():
                 p.set_skip_facing_change(True)
 
             if do_corr:
-                self.cgamedata.players[i].pos_corr_buff.append([server_x, server_y])
+                e.data.pos_corr_buff.append([server_x, server_y])
+                if e.local:
+                    self.corr_queued_at = time.perf_counter()
 
     def on_update(self, dt):
+        with Z_UPDATE:
+            self._on_update(dt)
+
+    def _on_update(self, dt):
         self.debug_counter += 1
         if self.debug_counter > 1000:
             self.debug_counter = 0
 
-        self.process_events()
-
-        for idx, p in enumerate(self.players):
-            self.update_calc_pos_client(dt, p, idx)
-
-        for s in self.all_sprites:
-            if isinstance(s, Projectile):
-                if s.is_too_far():
-                    for i, p in enumerate(self.cgamedata.projectiles):
-                        if (s.id == p.src_id):
-                            del self.cgamedata.projectiles[i]
-                    self.all_sprites.remove(s)
-
-        self.all_sprites.update()
-
-        self.server_to_client_pos_corr_buff(dt)
-
-        if not self.keys_pressed.hasKeyPressed():
-            if (self.debug_counter % 100 == 0):
+        gd = self.gamestate.acquire_gamedata()
+        if gd is not None:
+            with Z_SNAPSHOT:
+                self.on_gamestate_update(gd)
+
+        with Z_EVENTS:
+            self.process_events()
+
+        with Z_CALC_POS:
+            if self.remote_snapshots:
+                corrected = self.update_calc_pos_client(dt, self.entities.local)
+                self.remote_snapshots.update_sprites(self.entities, blend=CORRECTION_BLEND)
+            else:
+                corrected = False
+                for e in self.entities:
+                    if self.update_calc_pos_client(dt, e) and e.local:
+                        corrected = True
+
+        expired = self.projectiles.despawn_expired()
+        if expired:
+            # projectiles expire in the order they were fired
+            last_id = max(expired)
+            projectiles = self.cgamedata.projectiles
+            while projectiles and projectiles[0].id <= last_id:
+                projectiles.popleft()
+
+        with Z_SPRITES:
+            self.all_sprites.update()
+            self.projectiles.update()
+
+        tracer = self.cgamedata.tracer
+        if corrected and tracer is not None and tracer.active:
+            # the local sprite has just moved with the correction queued by
+            # the previous frame, it covers the inputs acked before that
+            tracer.frame(RECV, UPDATE, self.corr_queued_at)
+
+        with Z_CORRECTION:
+            self.server_to_client_pos_corr_buff(dt)
+
+        if self.debug_counter % 100 == 0 and LOG.isEnabledFor(logging.DEBUG):
+            if not self.keys_pressed.hasKeyPressed():
                 for i, p in enumerate(self.players):
-                        print('s #i:', i, 'pos:', self.players[i].position)
+                    LOG.debug('s #i: %d pos: %s', i, tuple(p.position))
 
-        self.all_sprites.update_animation()
+        with Z_ANIMATION:
+            self.all_sprites.update_animation()
+            self.projectiles.update_animation(dt)
 
     def on_fire_weapon(self, src_id):
         projectile_id = Projectile.get_new_id()
-        projectile_sprite = Projectile()
-        projectile_sprite.setup(projectile_id, src_id, facing=self.players[src_id].facing, position=self.players[src_id].position)
-        self.all_sprites.append(projectile_sprite)
+        projectile_sprite = self.projectiles.spawn(projectile_id, src_id, facing=self.players[src_id].facing,
+                        position=self.players[src_id].position)
 
         projectile = ClientProjectileData(id=projectile_id, src_id=src_id, ts=time.time(), position=self.players[src_id].position,
                         speed=projectile_sprite.speed, facing=projectile_sprite.facing)
@@ -216,14 +361,18 @@ class ArcadeGame(arcade.Window):
         self.cgamedata.projectiles.append(projectile)
 
         _event = Event(Event.get_new_id(),ts=time.time(), topic=TOPIC_PLAYERX_FIRE_WEAPON % _src_player_id,
-                        params=({'src': _src_player_id, 'klass': PROJECTILE, 'obj_as_dict': projectile.to_dict()},))
+                        params=({'src': _src_player_id, 'klass': PROJECTILE, 'obj': projectile.to_wire()},))
         self.client_eventq.append(_event)
 
+    def queue_input(self):
+        tracer = self.cgamedata.tracer
+        trace_id = tracer.start() if tracer is not None else None
+        self.cgamedata.players[0].input_buffer.append((self.keys_pressed.keys.copy(), trace_id))
+
     def on_key_press(self, key, key_modifiers):
         if key in MOVE_MAP:
             self.keys_pressed.keys[key] = True
-            _keys = self.keys_pressed.keys.copy()
-            self.cgamedata.players[0].input_buffer.append(_keys)
+            self.queue_input()
         elif key == arcade.key.R:
             pub.sendMessage(TOPIC_PLAYERX_WEAPON_OUT % ROOT_PLAYER_ID, params=None)
         elif key == arcade.key.SPACE:
@@ -244,13 +393,22 @@ class ArcadeGame(arcade.Window):
             self.players[0].set_run_mode(False)
             self.cgamedata.players[0].speed = self.players[0].movement_speed
             print('Walk mode')
+        elif key == arcade.key.P:
+            self.toggle_profiler_overlay()
+
 
+    def toggle_profiler_overlay(self):
+        if self.profiler_overlay is None:
+            if not PROFILER.enabled:
+                PROFILER.enable()
+            self.profiler_overlay = ProfilerOverlay(PROFILER)
+        else:
+            self.profiler_overlay = None
 
     def on_key_release(self, key, key_modifiers):
         if key in MOVE_MAP:
             self.keys_pressed.keys[key] = False
-            _keys = self.keys_pressed.keys.copy()
-            self.cgamedata.players[0].input_buffer.append(_keys)
+            self.queue_input()
 
 
     def run(self):
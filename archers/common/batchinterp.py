@@ -0,0 +1,186 @@
+"""
+Batched interpolation of the remote players with NumPy.
+
+All the remote players come in the same game state snapshots, so they
+share the snapshot times: positions are stored in (snapshots x players)
+arrays and the whole set is interpolated, extrapolated and blended in a
+few array operations per frame instead of per-player Vector2 math.
+"""
+import time
+from common.jitterbuffer import JitterBuffer, SNAPSHOTS, INTERP_DELAY, MAX_EXTRAPOLATION
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAVE_NUMPY = np is not None
+
+CAPACITY = 64  # initial number of player columns, doubled when needed
+
+
+class RemoteSnapshots:
+
+    def __init__(self, size=SNAPSHOTS, capacity=CAPACITY, interp_delay=INTERP_DELAY,
+                 adaptive=True, max_extrapolation=MAX_EXTRAPOLATION):
+        if np is None:
+            raise RuntimeError('RemoteSnapshots needs numpy')
+        # only used for its clock offset / interpolation delay estimates
+        self.timing = JitterBuffer(size=1, interp_delay=interp_delay, adaptive=adaptive,
+                                   max_extrapolation=max_extrapolation)
+        self._size = size
+        self._capacity = 0
+        self._times = np.zeros(size)
+        self._xs = np.empty((size, 0))
+        self._ys = np.empty((size, 0))
+        self._outx = np.empty(0)
+        self._outy = np.empty(0)
+        self._count = 0
+        self._slots = {}  # player id -> column
+        self._free = []
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        old = self._capacity
+        xs = np.full((self._size, capacity), np.nan)
+        ys = np.full((self._size, capacity), np.nan)
+        xs[:, :old] = self._xs
+        ys[:, :old] = self._ys
+        self._xs = xs
+        self._ys = ys
+        self._outx = np.empty(capacity)
+        self._outy = np.empty(capacity)
+        self._free.extend(range(capacity - 1, old - 1, -1))
+        self._capacity = capacity
+
+    def __len__(self):
+        return min(self._count, self._size)
+
+    def slot(self, player_id):
+        col = self._slots.get(player_id)
+        if col is None:
+            if not self._free:
+                self._grow(self._capacity * 2)
+            col = self._free.pop()
+            self._slots[player_id] = col
+        return col
+
+    def release(self, player_id):
+        col = self._slots.pop(player_id, None)
+        if col is not None:
+            self._xs[:, col] = np.nan
+            self._ys[:, col] = np.nan
+            self._free.append(col)
+
+    def set_clock_offset(self, offset):
+        self.timing.set_clock_offset(offset)
+
+    def push(self, srv_time, players, tick=0, local_time=None, skip_id=None):
+        if local_time is None:
+            local_time = time.time()
+        t_last = None
+        if self._count > 0:
+            t_last = self._times[(self._count - 1) % self._size]
+            if srv_time <= t_last:
+                self.timing.late += 1
+                return False
+        cols = []
+        px = []
+        py = []
+        for p in players:
+            if p.id == skip_id:
+                continue
+            cols.append(self.slot(p.id))
+            px.append(p.position[0])
+            py.append(p.position[1])
+        row = self._count % self._size
+        self._times[row] = srv_time
+        xs_row = self._xs[row]
+        ys_row = self._ys[row]
+        xs_row.fill(np.nan)
+        ys_row.fill(np.nan)
+        xs_row[cols] = px
+        ys_row[cols] = py
+        self._count += 1
+        self.timing.observe(srv_time, t_last, local_time)
+        return True
+
+    def _lerp(self, r0, r1, k):
+        # out = x0 + (x1 - x0) * k, players missing from one of the two
+        # snapshots take the position from the other one
+        for xs, out in ((self._xs, self._outx), (self._ys, self._outy)):
+            x0 = xs[r0]
+            x1 = xs[r1]
+            np.subtract(x1, x0, out=out)
+            out *= k
+            out += x0
+            np.copyto(out, x1, where=np.isnan(x0))
+            np.copyto(out, x0, where=np.isnan(x1))
+        return self._outx, self._outy
+
+    def sample(self, local_now=None):
+        """Returns the (x, y) arrays of all the columns at render time (NaN
+        for unused columns), or None when no snapshot was received yet.
+        The arrays are reused by the next call."""
+        n = len(self)
+        if n == 0:
+            return None
+        size = self._size
+        times = self._times
+        t = self.timing.render_time(local_now)
+        newest = (self._count - 1) % size
+
+        if t >= times[newest]:
+            if n == 1:
+                return self._lerp(newest, newest, 0.0)
+            prev = (self._count - 2) % size
+            ahead = min(t - times[newest], self.timing.max_extrapolation)
+            if ahead > 0:
+                self.timing.extrapolated += 1
+            # x1 + (x1 - x0) * k == lerp(x1, x0, -k)
+            return self._lerp(newest, prev, -ahead / (times[newest] - times[prev]))
+
+        j = self._count - 1
+        oldest = self._count - n
+        while j > oldest:
+            i1 = j % size
+            i0 = (j - 1) % size
+            if times[i0] <= t:
+                return self._lerp(i0, i1, (t - times[i0]) / (times[i1] - times[i0]))
+            j -= 1
+        i = oldest % size
+        return self._lerp(i, i, 0.0)
+
+    def update_sprites(self, entities, local_now=None, blend=1.0):
+        """
+        Set the remote entities' sprite change_x/change_y so that the next
+        sprite update() lands them on their interpolated positions, and
+        store those positions in their data. blend < 1 only covers that
+        fraction of the distance each frame, to smooth out corrections.
+        """
+        res = self.sample(local_now)
+        if res is None:
+            return 0
+        x, y = res
+        remote = [e for e in entities if not e.local and e.id in self._slots]
+        if not remote:
+            return 0
+        cols = [self._slots[e.id] for e in remote]
+        sx = np.fromiter((e.sprite.center_x for e in remote), float, len(remote))
+        sy = np.fromiter((e.sprite.center_y for e in remote), float, len(remote))
+        tx = x[cols]
+        ty = y[cols]
+        # players without any position yet stay where they are
+        np.copyto(tx, sx, where=np.isnan(tx))
+        np.copyto(ty, sy, where=np.isnan(ty))
+        dx = (tx - sx) * blend
+        dy = (ty - sy) * blend
+        sx += dx
+        sy += dy
+        for e, _x, _y, _dx, _dy in zip(remote, sx.tolist(), sy.tolist(), dx.tolist(), dy.tolist()):
+            sprite = e.sprite
+            sprite.change_x = _dx
+            sprite.change_y = _dy
+            e.data.position = [_x, _y]
+            e.data.facing = sprite.state
+        return len(remote)
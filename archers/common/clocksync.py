@@ -0,0 +1,52 @@
+import time
+from collections import deque
+
+SYNC_SAMPLES = 5       # request/response samples per sync burst
+SYNC_SPACING = 0.05    # seconds between the samples of a burst
+RESYNC_PERIOD = 10.0   # seconds between bursts
+MAX_SAMPLES = 16       # samples kept for the min-RTT filter
+
+
+class ClockSync:
+    """
+    NTP-style estimate of the server clock.
+
+    Each sample is a request sent at t0 (client clock), received at t1 and
+    answered at t2 (server clock) and received back at t3 (client clock):
+
+        rtt = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2    # server - client
+
+    The offset of the sample with the smallest RTT among the last
+    MAX_SAMPLES is used, it is the one least disturbed by queuing delays.
+    The clock is time.time() looked up at each call, unless one is given.
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES, clock=None):
+        self._samples = deque(maxlen=max_samples)  # (rtt, offset)
+        self._clock = clock
+        self.offset = 0.0
+        self.rtt = None
+        self.synced = False
+
+    def now(self):
+        return self._clock() if self._clock is not None else time.time()
+
+    def add_sample(self, t0, t1, t2, t3):
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt < 0:
+            return False
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        self._samples.append((rtt, offset))
+        self.rtt, self.offset = min(self._samples)
+        self.synced = True
+        return True
+
+    def server_now(self):
+        return self.now() + self.offset
+
+    def to_local(self, server_time):
+        return server_time - self.offset
+
+    def to_server(self, local_time):
+        return local_time + self.offset
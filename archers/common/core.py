@@ -0,0 +1,143 @@
+"""
+Simulation code shared by the server, the client and the bots: key
+constants, movement, topics. Must not import arcade, pyglet or PIL.
+"""
+import time
+from common.vector2 import Vector2
+from dataclasses import dataclass, field
+from typing import Dict
+
+ROOT_PLAYER_ID = 0
+
+# UDP port the game server listens on
+SERVER_PORT = 1234
+
+FACE_RIGHT = 1
+FACE_LEFT = 2
+FACE_UP = 3
+FACE_DOWN = 4
+
+TOPIC_GSUPDATE = 'root.game.gamestate_update'
+TOPIC_NEWPLAYER = 'root.game.new_player'
+TOPIC_PLAYERX  = "root.game.player.%d"
+TOPIC_PLAYERX_WEAPON_OUT = TOPIC_PLAYERX + '.weapon_out'
+TOPIC_PLAYERX_WEAPON_SHOOT = TOPIC_PLAYERX + '.weapon_shoot'
+TOPIC_PLAYERX_FIRE_WEAPON = TOPIC_PLAYERX + '.fire_weapon'
+
+# Same values as arcade.key (pyglet key symbols), kept as plain ints so the
+# server and the bots don't have to load the graphics stack
+KEY_UP = 65362
+KEY_DOWN = 65364
+KEY_LEFT = 65361
+KEY_RIGHT = 65363
+
+MOVE_MAP = {
+    KEY_UP: Vector2(0, 1),
+    KEY_DOWN: Vector2(0, -1),
+    KEY_LEFT: Vector2(-1, 0),
+    KEY_RIGHT: Vector2(1, 0),
+}
+
+# Bit of each movement key in a key state bitmask
+KEY_BITS = {k: 1 << i for i, k in enumerate(MOVE_MAP)}
+
+
+def _build_move_dirs(normalize):
+    # direction for every key combination, computed once with the same
+    # Vector2 operations apply_movement used to do on every call
+    dirs = []
+    for mask in range(1 << len(MOVE_MAP)):
+        _v = sum((bool(mask & KEY_BITS[k]) * MOVE_MAP[k] for k in MOVE_MAP), Vector2(0, 0))
+        if normalize:
+            _v = _v.get_normalized()
+        dirs.append((_v.x, _v.y))
+    return tuple(dirs)
+
+
+# key state bitmask -> (dx, dy)
+MOVE_DIRS = _build_move_dirs(normalize=True)
+MOVE_DIRS_RAW = _build_move_dirs(normalize=False)
+# the same tables as numpy arrays, built by the first apply_movement_batch
+_MOVE_DIRS_NP = {}
+
+# Client event to server object
+PROJECTILE = 10  # 'ProjectileData'
+
+@dataclass
+class KeysPressed:
+    keys: Dict = field(default_factory=lambda: {k: False for k in MOVE_MAP})
+
+    def reset(self):
+        for k in MOVE_MAP:
+            self.keys[k] = False
+
+    def hasKeyPressed(self):
+        return any(self.keys.values())
+
+
+def keys_to_mask(kp):
+    """Key state (dict, KeysPressed or bitmask) to a bitmask"""
+    if isinstance(kp, int):
+        return kp
+    if not isinstance(kp, dict):
+        kp = kp.keys
+    mask = 0
+    for k, pressed in kp.items():
+        if pressed:
+            mask |= KEY_BITS.get(k, 0)
+    return mask
+
+
+def mask_to_keys(mask):
+    """Bitmask to a key state dict of the MOVE_MAP keys"""
+    return {k: bool(mask & bit) for k, bit in KEY_BITS.items()}
+
+
+def apply_movement(speed, dt, current_position, kp, normalize=True):
+    dx, dy = (MOVE_DIRS if normalize else MOVE_DIRS_RAW)[keys_to_mask(kp)]
+    return Vector2(current_position[0] + dx * speed * dt,
+                   current_position[1] + dy * speed * dt)
+
+
+def apply_movement_batch(speeds, dt, positions, masks, normalize=True, out=None):
+    """
+    apply_movement over many entities: positions is a (n, 2) array, speeds
+    and masks arrays of n values. Returns the new (n, 2) positions (in out
+    if given). Without numpy, lists of (x, y) are accepted and returned.
+    """
+    # numpy is imported here so that the server and the bots don't load it
+    try:
+        import numpy as np
+    except ImportError:
+        dirs = MOVE_DIRS if normalize else MOVE_DIRS_RAW
+        res = []
+        for (x, y), speed, mask in zip(positions, speeds, masks):
+            dx, dy = dirs[mask]
+            res.append((x + dx * speed * dt, y + dy * speed * dt))
+        return res
+    table = _MOVE_DIRS_NP.get(normalize)
+    if table is None:
+        table = _MOVE_DIRS_NP[normalize] = np.array(MOVE_DIRS if normalize else MOVE_DIRS_RAW, dtype=float)
+    dirs = table[np.asarray(masks)]
+    dirs *= np.asarray(speeds, dtype=float)[:, None]
+    dirs *= dt
+    return np.add(positions, dirs, out=out)
+
+
+
+class MeasureDuration:
+    def __init__(self):
+        self.start = None
+        self.end = None
+        self.duration = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.end = time.perf_counter()
+        self.duration = self.end - self.start
+
+    def get_duration_ms(self):
+        return self.duration * 1000
@@ -1,11 +1,67 @@
 import dataclasses
+import threading
 import time
 from dataclasses import dataclass, field
-from dataclasses import asdict
 from typing import List, Dict, Any, Tuple
 from collections import deque
-
-@dataclass
+from common.ringbuffer import RingBuffer, DROP_OLDEST, DROP_NEWEST
+from common.jitterbuffer import JitterBuffer
+from common.clocksync import ClockSync
+from common.core import SERVER_PORT
+
+# Capacities of the channels shared between the arcade and network threads
+POS_BUFFER_SIZE = 2
+INPUT_BUFFER_SIZE = 64
+INPUT_HISTORY_SIZE = 8  # unacknowledged inputs repeated in each input packet
+PROJECTILES_SIZE = 256
+SRV_EVENTQ_SIZE = 1024
+CLIENT_EVENTQ_SIZE = 256
+
+
+def wire(skip=(), nested=None):
+    """
+    Class decorator generating to_wire() and from_wire() for a dataclass:
+    the wire format is a tuple of the fields in declaration order (minus
+    skip), nested records listed in nested ({field: class}) are encoded
+    with their own to_wire. The functions are compiled once at import, so
+    encoding is a single tuple display instead of an asdict() deep copy.
+    """
+    nested = nested or {}
+
+    def deco(cls):
+        names = tuple(f.name for f in dataclasses.fields(cls) if f.name not in skip)
+        env = {}
+        enc = []
+        dec = []
+        positional = True
+        for f in dataclasses.fields(cls):
+            if f.name in skip:
+                positional = False
+                continue
+            j = names.index(f.name)
+            if f.name in nested:
+                env['_to_%s' % f.name] = nested[f.name].to_wire
+                env['_from_%s' % f.name] = nested[f.name].from_wire
+                enc.append('[_to_%s(x) for x in o.%s]' % (f.name, f.name))
+                value = '[_from_%s(x) for x in t[%d]]' % (f.name, j)
+            else:
+                enc.append('o.%s' % f.name)
+                value = 't[%d]' % j
+            dec.append(value if positional else '%s=%s' % (f.name, value))
+        src = ('def to_wire(o):\n'
+               '    return (%s,)\n'
+               'def from_wire(cls, t):\n'
+               '    return cls(%s)\n') % (', '.join(enc), ', '.join(dec))
+        exec(src, env)
+        cls.WIRE_FIELDS = names
+        cls.to_wire = env['to_wire']
+        cls.from_wire = classmethod(env['from_wire'])
+        return cls
+    return deco
+
+
+@wire(skip=('evt',))
+@dataclass(slots=True)
 class Event:
     _id = 0
 
@@ -22,7 +78,8 @@ class Event:
             cls._id = 0
         return cls._id
 
-@dataclass
+@wire()
+@dataclass(slots=True)
 class PlayerData:
     id: int
     ts: float
@@ -30,8 +87,23 @@ class PlayerData:
     keys_pressed: Dict
     speed: int
     facing: int = 0  # FACE_UP...
+    seq: int = 0  # last input sequence number (sent by client, acked by server once applied)
+
+    def update_from_wire(self, t):
+        # Refresh this record in place (reuses the position list and keys dict)
+        _, self.ts, position, keys_pressed, self.speed, self.facing, self.seq = t
+        if self.position is None:
+            self.position = list(position)
+        else:
+            self.position[:] = position
+        if self.keys_pressed is None:
+            self.keys_pressed = dict(keys_pressed)
+        else:
+            self.keys_pressed.clear()
+            self.keys_pressed.update(keys_pressed)
 
-@dataclass
+@wire()
+@dataclass(slots=True)
 class ProjectileData:
     id: int
     src_id: int
@@ -40,11 +112,14 @@ class ProjectileData:
     speed: int
     facing: int = 0
 
-@dataclass
+@wire(skip=('evt',), nested={'players': PlayerData})
+@dataclass(slots=True)
 class GameData:
     players: List[PlayerData] = field(default_factory=lambda: [])
     updated_at: float = .0
     evt: int = 0  # event type 0=GameData
+    tick: int = 0  # server tick number
+    srv_time: float = .0  # server time when the snapshot was sent
 
     def get_player_from_id(self, player_id):
         if not isinstance(player_id, int):
@@ -56,69 +131,115 @@ class GameData:
             return (None, None)
         return (i, p)
 
-    def set_from_dict(self, indict):
-        del self.players[:]
-        for p in indict['players']:
-            self.players.append(PlayerData(**p))
+    def set_from_wire(self, t, index=None):
+        # Apply a snapshot in place: records are looked up by id in index
+        # (id -> PlayerData) and reused across snapshots, only players seen
+        # for the first time are allocated.
+        if index is None:
+            index = {p.id: p for p in self.players}
+        players = self.players
+        del players[:]
+        wire_players, _, self.tick, self.srv_time = t
+        for p in wire_players:
+            rec = index.get(p[0])
+            if rec is None:
+                rec = PlayerData.from_wire(p)
+                index[rec.id] = rec
+            else:
+                rec.update_from_wire(p)
+            players.append(rec)
+        if len(index) > len(players):
+            # some players left, forget their records
+            live = {p.id for p in players}
+            for pid in [pid for pid in index if pid not in live]:
+                del index[pid]
         self.updated_at = time.time()
 
 class GameState:
+    # Three GameData buffers are rotated so that the network thread never
+    # writes into the frame the render thread is reading:
+    # - back: written by the network thread (apply_snapshot)
+    # - ready: last complete snapshot, swapped with back on publish
+    # - front: read by the render thread, swapped with ready on acquire
+    # Each buffer keeps its own id -> PlayerData index so records are
+    # reused from one snapshot to the next.
+    FRONT, BACK, READY = range(3)
+
     def __init__(self):
-        self._last_gamedata = None
-        self._gamedata = GameData()
+        self._buffers = [GameData(), GameData(), GameData()]
+        self._indexes = [{}, {}, {}]
+        self._slots = [0, 1, 2]  # front, back, ready
+        self._fresh = False
+        self._lock = threading.Lock()
 
     @property
     def gamedata(self):
-        return self._gamedata
-
-    @property
-    def last_gamedata(self):
-        return self._last_gamedata
-
-    @gamedata.setter
-    def gamedata(self, value):
-        if self._last_gamedata is None:
-            self._last_gamedata = value
-        else:
-            self._last_gamedata = self._gamedata
-        self._gamedata = value
+        return self._buffers[self._slots[self.FRONT]]
+
+    def apply_snapshot(self, t):
+        # Network thread: write the wire snapshot t into the back buffer and publish it.
+        back = self._slots[self.BACK]
+        self._buffers[back].set_from_wire(t, self._indexes[back])
+        with self._lock:
+            slots = self._slots
+            slots[self.BACK], slots[self.READY] = slots[self.READY], slots[self.BACK]
+            self._fresh = True
+
+    def acquire_gamedata(self):
+        # Render thread, once per frame: make the latest published snapshot
+        # the front buffer. Returns it, or None if none was published since
+        # the last call (the front buffer is still self.gamedata).
+        if not self._fresh:
+            return None
+        with self._lock:
+            slots = self._slots
+            slots[self.FRONT], slots[self.READY] = slots[self.READY], slots[self.FRONT]
+            self._fresh = False
+        return self.gamedata
 
     def get_player_from_id(self, player_id):
-        return self._gamedata.get_player_from_id(player_id)
+        return self.gamedata.get_player_from_id(player_id)
 
-@dataclass
+@dataclass(slots=True)
 class ClientPlayerData(PlayerData):
-    pos_buffer: Any = field(default_factory=lambda: deque(maxlen=2))
+    # (position, ts) received from the server, network or arcade thread -> arcade thread
+    pos_buffer: Any = field(default_factory=lambda: RingBuffer(POS_BUFFER_SIZE, DROP_OLDEST))
     time_since_state_update: float = .0
     position_snapshot: List = field(default_factory=lambda: [])
-    input_buffer: Any = field(default_factory=lambda: deque(maxlen=5))
+    # (key states, trace id or None), arcade thread -> network thread.
+    # Inputs are absolute key states so on overflow the oldest ones can go.
+    input_buffer: Any = field(default_factory=lambda: RingBuffer(INPUT_BUFFER_SIZE, DROP_OLDEST))
     pos_corr_buff: Any = field(default_factory=lambda: deque(maxlen=2))
-
-    def to_dict(self) -> Dict[str, Any]:
-        return {k: v for k, v in asdict(self).items() if (
-                k not in ['pos_buffer', 'time_since_state_update',
-                'position_snapshot', 'input_buffer', 'pos_corr_buff'])}
-
-@dataclass
+    last_ack_seq: int = 0  # last input seq the server has applied
+    # (seq, key mask) of the inputs sent and not acknowledged yet, network
+    # thread only
+    input_history: Any = field(default_factory=lambda: deque(maxlen=INPUT_HISTORY_SIZE))
+    # server-time stamped snapshots, remote players are rendered from it
+    snap_buffer: Any = field(default_factory=lambda: JitterBuffer())
+    # to_wire() is inherited: only the PlayerData fields go on the wire, the
+    # client side buffers are neither copied nor sent
+
+@dataclass(slots=True)
 class ClientProjectileData(ProjectileData):
+    src_player_id: int = 0  # id of the player who fired it, client side only
     pos_buffer: Any = field(default_factory=lambda: deque(maxlen=2))
     time_since_state_update: float = .0
     position_snapshot: List = field(default_factory=lambda: [])
     pos_corr_buff: Any = field(default_factory=lambda: deque(maxlen=2))
 
-    def to_dict(self) -> Dict[str, Any]:
-        return {k: v for k, v in asdict(self).items() if (
-                k not in ['pos_buffer', 'time_since_state_update',
-                'position_snapshot', 'pos_corr_buff'])}
-
-@dataclass
+@dataclass(slots=True)
 class ClientGameData(GameData):
     remote_address: str = '127.0.0.1'
+    remote_port: int = SERVER_PORT
     local_address_port: int = 4321
     players: List[ClientPlayerData] = field(default_factory=lambda: [])
     #projectiles: List[Tuple] = field(default_factory=lambda: [])
-    projectiles: Any = field(default_factory=lambda: deque())
+    projectiles: Any = field(default_factory=lambda: RingBuffer(PROJECTILES_SIZE, DROP_OLDEST))
     # server to client
-    srv_eventq: Any = field(default_factory=lambda: deque())
+    srv_eventq: Any = field(default_factory=lambda: RingBuffer(SRV_EVENTQ_SIZE, DROP_NEWEST))
     # client to server
-    client_eventq: Any = field(default_factory=lambda: deque())
+    client_eventq: Any = field(default_factory=lambda: RingBuffer(CLIENT_EVENTQ_SIZE, DROP_NEWEST))
+    # server clock estimate, updated by the network thread
+    clock: Any = field(default_factory=lambda: ClockSync())
+    # common.tracing.Tracer of the sampled inputs, None when not tracing
+    tracer: Any = None
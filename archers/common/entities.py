@@ -0,0 +1,52 @@
+class PlayerEntity:
+    """A player as seen by the client: its data bound to its sprite"""
+
+    __slots__ = ['id', 'data', 'sprite', 'local']
+
+    def __init__(self, data, sprite, local=False):
+        self.id = data.id
+        self.data = data  # ClientPlayerData
+        self.sprite = sprite  # PlayerCharacter
+        self.local = local
+
+
+class EntityTable:
+    """
+    Client players keyed by player id. Snapshots are matched against it in
+    O(snapshot size), and players can be added and removed without the
+    data and sprite lists getting out of step.
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self.local = None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __contains__(self, player_id):
+        return player_id in self._by_id
+
+    def get(self, player_id):
+        return self._by_id.get(player_id)
+
+    def add(self, data, sprite, local=False):
+        entity = PlayerEntity(data, sprite, local)
+        self._by_id[entity.id] = entity
+        if local:
+            self.local = entity
+        return entity
+
+    def remove(self, player_id):
+        entity = self._by_id.pop(player_id, None)
+        if entity is not None and entity is self.local:
+            self.local = None
+        return entity
+
+    def missing_from(self, players):
+        """Remote entities that are not in the players of a snapshot"""
+        live = {p.id for p in players}
+        return [e for e in self._by_id.values() if not e.local and e.id not in live]
@@ -3,11 +3,11 @@ import asyncio
 import logging
 import time
 from copy import copy
-from dataclasses import asdict
-from common.helpers import MeasureDuration
-from common.datacls import Event, GameData, GameState
+from common.core import MeasureDuration, keys_to_mask
+from common.datacls import Event, GameData, GameState, PlayerData
 from common.protocol import EndpointHelper, RPCProtocol
-from common.helpers import TOPIC_GSUPDATE, TOPIC_NEWPLAYER
+from common.core import TOPIC_NEWPLAYER
+from common.clocksync import SYNC_SAMPLES, SYNC_SPACING, RESYNC_PERIOD
 
 UPS_PLAYER = 30  # updates per second
 UPS_PLAYER_60 = 60
@@ -17,6 +17,32 @@ UPS_PLAYER_SLEEPT_60 = 1/UPS_PLAYER_60
 UPS_PLAYER_SLEEPT_30 = 1/30
 UPS_GAME = 2
 UPS_GAME_SLEEPT = 1/UPS_GAME
+# Take the local player's authoritative position from the game state
+# snapshots pushed by the server instead of polling get_player_state
+PUSH_OWN_STATE = True
+# Period at which the last input is sent again until acknowledged, so that
+# a key release lost with its packet doesn't stay pressed on the server
+INPUT_RESEND_S = 0.05
+
+# Field positions in the wire tuples
+_GD_PLAYERS = GameData.WIRE_FIELDS.index('players')
+_P_ID = PlayerData.WIRE_FIELDS.index('id')
+_P_POSITION = PlayerData.WIRE_FIELDS.index('position')
+_P_SEQ = PlayerData.WIRE_FIELDS.index('seq')
+
+
+def acknowledge_inputs(cgamedata, player, seq):
+    """The server has applied the inputs of player up to seq, from a
+    snapshot or a get_player_state response. Returns False for an older
+    acknowledgement than the last one (reordered), which is ignored."""
+    if seq < player.last_ack_seq:
+        return False
+    player.last_ack_seq = seq
+    tracer = cgamedata.tracer
+    if tracer is not None and tracer.waiting:
+        tracer.acked(seq)
+    return True
+
 
 class RPCServer2ClientProtocol(RPCProtocol):
 
@@ -32,26 +58,56 @@ class RPCServer2ClientProtocol(RPCProtocol):
         if not isinstance(cgamedata, GameData):
             raise Exception("not a GameData")
 
-    def rpc_ff_listen_for_game_state_or_event(self, sender, state_or_event):
-        if self.cgamedata and state_or_event['evt'] == 1:
-            self.cgamedata.srv_eventq.append(Event(**state_or_event))
-        elif self.gamedata and state_or_event['evt'] == 0:
-            self.gamestate.gamedata = GameData()
-            self.gamestate.gamedata.set_from_dict(state_or_event)
-            self.cgamedata.srv_eventq.append(Event(Event.get_new_id(), time.time(), TOPIC_GSUPDATE, (self.gamestate.gamedata,)))
+    def rpc_ff_listen_for_game_state_or_event(self, sender, evt, state_or_event):
+        # evt is the event type (0=GameData, 1=Event) of the wire tuple
+        if self.cgamedata and evt == 1:
+            self.cgamedata.srv_eventq.append(Event.from_wire(state_or_event))
+        elif self.gamestate and evt == 0:
+            if PUSH_OWN_STATE and self.cgamedata:
+                self.set_own_state(state_or_event)
+            # snapshots are applied in place, the render thread picks up the
+            # latest one on its next frame
+            self.gamestate.apply_snapshot(state_or_event)
 
         self._counter += 1
         if (self._counter >= 1000):
             self._counter = 0
 
+    def rpc_ff_trace(self, sender, trace_id, durations):
+        # server stage durations of a traced input
+        if self.cgamedata and self.cgamedata.tracer is not None:
+            self.cgamedata.tracer.server(trace_id, durations)
+
+    def set_own_state(self, gamedata_wire):
+        if len(self.cgamedata.players) == 0:
+            return
+        player = self.cgamedata.players[0]
+        for p in gamedata_wire[_GD_PLAYERS]:
+            if p[_P_ID] == player.id:
+                break
+        else:
+            return
+        if not acknowledge_inputs(self.cgamedata, player, p[_P_SEQ]):
+            return
+        player.pos_buffer.append((p[_P_POSITION][:], time.time()))
+        player.time_since_state_update = 0
+        player.position_snapshot = player.position[:]
+
 
 class GameThreadManager:
-    def __init__(self, gamestate=None, cgamedata=None):
-        self._loop = asyncio.new_event_loop()
-        self._loop.set_debug(False)
-        asyncio.set_event_loop(self._loop)
+    # protocol of the local endpoint the server publishes to
+    server2client_protocol = RPCServer2ClientProtocol
+
+    def __init__(self, gamestate=None, cgamedata=None, loop=None):
+        # loop: run the client tasks on an existing event loop (see
+        # start_tasks), e.g. many headless clients in one process
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_debug(False)
+            asyncio.set_event_loop(loop)
+        self._loop = loop
         self._running = False
-        self.remote_address = (cgamedata.remote_address, 1234)  # For client to server coms
+        self.remote_address = (cgamedata.remote_address, cgamedata.remote_port)  # For client to server coms
         self.local_address = ('0.0.0.0', cgamedata.local_address_port) # For server to client coms
         self.endpoint_helper = EndpointHelper(RPCProtocol, None)
         self.logger = logging.getLogger(__name__)
@@ -78,37 +134,44 @@ class GameThreadManager:
         self.logger.debug('Stopped')
 
     def _main_loop_worker(self, gamestate, cgamedata):
-        self._running = True
         self.logger.debug("_main_loop_worker started")
-        self._loop.create_task(self.set_player_state(gamestate, cgamedata))
-        self._loop.create_task(self.get_player_state(gamestate, cgamedata))
-        self._loop.create_task(self.listen_for_game_state(gamestate, cgamedata))
+        self.start_tasks()
+        self._loop.run_forever()
 
-        self._loop.create_task(self.check_client2server_events(gamestate, cgamedata))
+    def start_tasks(self):
+        gamestate = self._gamestate
+        cgamedata = self._cgamedata
+        self._running = True
+        tasks = [self._loop.create_task(self.set_player_state(gamestate, cgamedata))]
+        if not PUSH_OWN_STATE:
+            tasks.append(self._loop.create_task(self.get_player_state(gamestate, cgamedata)))
+        tasks.append(self._loop.create_task(self.listen_for_game_state(gamestate, cgamedata)))
 
-        self._loop.run_forever()
+        tasks.append(self._loop.create_task(self.check_client2server_events(gamestate, cgamedata)))
+        tasks.append(self._loop.create_task(self.sync_clock(gamestate, cgamedata)))
+        return tasks
 
     async def init_player_state(self, gamestate, cgamedata):
         result = await self.protocol.create_player(self.remote_address, cgamedata.players[0].id, cgamedata.local_address_port)
         if result[0]:
-            cgamedata.players[0].id = result[1]['id']
+            cgamedata.players[0].id = PlayerData.from_wire(result[1]).id
         else:
-            print("init_player_state: create_player failed")
+            self.logger.error("init_player_state: create_player failed")
             return False
  
         result = await self.protocol.get_game_state(self.remote_address)
         if result[0]:
-            gamestate.gamedata = GameData()
-            gamestate.gamedata.set_from_dict(result[1])
+            gamestate.apply_snapshot(result[1])
         else:
-            print("init_player_state: get_game_state failed")
+            self.logger.error("init_player_state: get_game_state failed")
             return False
 
-        if len(cgamedata.players) < len(gamestate.gamedata.players):
-            for p in gamestate.gamedata.players:
-                if p.id != cgamedata.players[0].id:
-                    print("creating fake event for player %d" % p.id)
-                    cgamedata.srv_eventq.append(Event(Event.get_new_id(), time.time(), TOPIC_NEWPLAYER, (p.id,)))
+        players = result[1][_GD_PLAYERS]
+        if len(cgamedata.players) < len(players):
+            for p in players:
+                if p[_P_ID] != cgamedata.players[0].id:
+                    self.logger.info("creating fake event for player %d", p[_P_ID])
+                    cgamedata.srv_eventq.append(Event(Event.get_new_id(), time.time(), TOPIC_NEWPLAYER, (p[_P_ID],)))
                     break
 
         return True
@@ -118,24 +181,50 @@ class GameThreadManager:
         return res
 
     async def set_player_state(self, gamestate, cgamedata):
-        self.logger.info("set_player_state started (%s)" % str(self.remote_address))
+        self.logger.info("set_player_state started (%s)", self.remote_address)
         self.remote_ep, self.protocol = await self.endpoint_helper.open_remote_endpoint(*self.remote_address)
         _ = await self.init_player_state(gamestate, cgamedata)
+        last_sent = 0.0
         while (self._running):
             self._counter += 1
             if (self._counter >= 1000):
                 self._counter = 0
-            if (len(cgamedata.players) > 0) and (len(cgamedata.players[0].input_buffer) > 0):
-                _keys = cgamedata.players[0].input_buffer.popleft()
-                cgamedata.players[0].keys_pressed = _keys
-                cgamedata.players[0].ts = time.time()
-                _cplayer_state = cgamedata.players[0].to_dict()
-                self.protocol.ff_set_player_state(self.remote_address, _cplayer_state)
+            if len(cgamedata.players) > 0:
+                player = cgamedata.players[0]
+                history = player.input_history
+                while history and history[0][0] <= player.last_ack_seq:
+                    history.popleft()
+                # every input queued since the last round gets its own seq
+                # and packet, with the unacknowledged ones before it
+                while len(player.input_buffer) > 0:
+                    _keys, trace_id = player.input_buffer.popleft()
+                    player.keys_pressed = _keys
+                    player.ts = time.time()
+                    player.seq += 1
+                    if trace_id is not None:
+                        cgamedata.tracer.sent(trace_id, player.seq)
+                    self.send_player_state(player, trace_id)
+                    history.append((player.seq, keys_to_mask(_keys)))
+                    last_sent = time.perf_counter()
+                if history and time.perf_counter() - last_sent >= INPUT_RESEND_S:
+                    # the server drops it if it already has it
+                    self.send_player_state(player)
+                    last_sent = time.perf_counter()
             await asyncio.sleep(UPS_PLAYER_SLEEPT_60)
 
+    def send_player_state(self, player, trace_id=None):
+        # the history sent ends before the input in the packet
+        history = [[seq, mask] for seq, mask in player.input_history if seq < player.seq]
+        args = [player.to_wire()]
+        if history or trace_id is not None:
+            args.append(history)
+        if trace_id is not None:
+            args.append(trace_id)
+        self.protocol.ff_set_player_state(self.remote_address, *args)
+
     async def listen_for_game_state(self, gamestate, cgamedata):
         self.logger.debug("get_game_state started")
-        endpoint_helper = EndpointHelper(RPCServer2ClientProtocol, None)
+        endpoint_helper = EndpointHelper(self.server2client_protocol, None)
         self.local_ep, self.protocol2 = await endpoint_helper.open_local_endpoint(*self.local_address)
         self.protocol2.cgamedata = cgamedata
         self.protocol2.gamestate = gamestate
@@ -152,19 +241,40 @@ class GameThreadManager:
             result = await self.protocol.get_player_state(self.remote_address, cgamedata.players[0].id)
             if (len(cgamedata.players) > 0) and result[0]:
                 if result[1] is not None:
-                    pos = result[1][:]
-                    cgamedata.players[0].pos_buffer.append((pos, time.time()))
-                    cgamedata.players[0].time_since_state_update = 0
-                    cgamedata.players[0].position_snapshot = cgamedata.players[0].position[:]
+                    # [position, seq of the last input applied]
+                    pos, seq = result[1]
+                    player = cgamedata.players[0]
+                    if acknowledge_inputs(cgamedata, player, seq):
+                        player.pos_buffer.append((pos[:], time.time()))
+                        player.time_since_state_update = 0
+                        player.position_snapshot = player.position[:]
             elif not result[0]:
                 self.logger.debug('get_player_state: False from server')
 
             await asyncio.sleep(UPS_PLAYER_SLEEPT_30)
 
+    async def sync_clock(self, gamestate, cgamedata):
+        self.logger.debug("sync_clock started")
+        clock = cgamedata.clock
+        while self._running:
+            if not self.protocol:
+                await asyncio.sleep(0.1)
+                continue
+            for _ in range(SYNC_SAMPLES):
+                t0 = clock.now()
+                result = await self.protocol.clock_sync(self.remote_address, t0,
+                    cgamedata.players[0].id, clock.rtt, clock.offset)
+                if result[0] and result[1] is not None:
+                    _t0, t1, t2 = result[1]
+                    clock.add_sample(_t0, t1, t2, clock.now())
+                await asyncio.sleep(SYNC_SPACING)
+            self.logger.debug("clock offset %f rtt %s", clock.offset, clock.rtt)
+            await asyncio.sleep(RESYNC_PERIOD)
+
     async def check_client2server_events(self, gamestate, cgamedata):
         self.logger.debug("check_client2server_events started")
         while self._running:
             while len(cgamedata.client_eventq) > 0:
                 evt = cgamedata.client_eventq.popleft()
-                self.protocol.ff_process_client_events(self.remote_address, asdict(evt))
+                self.protocol.ff_process_client_events(self.remote_address, evt.to_wire())
             await asyncio.sleep(UPS_PLAYER_SLEEPT_60)
@@ -1,57 +1,16 @@
-import arcade
-import time
-from PIL import Image
-from common.vector2 import Vector2
-from dataclasses import dataclass, field
-from typing import Dict
+from common.core import ROOT_PLAYER_ID, FACE_RIGHT, FACE_LEFT, FACE_UP, FACE_DOWN
+from common.core import TOPIC_GSUPDATE, TOPIC_NEWPLAYER, TOPIC_PLAYERX
+from common.core import TOPIC_PLAYERX_WEAPON_OUT, TOPIC_PLAYERX_WEAPON_SHOOT, TOPIC_PLAYERX_FIRE_WEAPON
+from common.core import KEY_UP, KEY_DOWN, KEY_LEFT, KEY_RIGHT, MOVE_MAP, KEY_BITS
+from common.core import MOVE_DIRS, MOVE_DIRS_RAW, PROJECTILE
+from common.core import KeysPressed, keys_to_mask, apply_movement, apply_movement_batch
+from common.core import MeasureDuration
+import logging
 
-ROOT_PLAYER_ID = 0
+LOG = logging.getLogger(__name__)
 
-FACE_RIGHT = 1
-FACE_LEFT = 2
-FACE_UP = 3
-FACE_DOWN = 4
-
-TOPIC_GSUPDATE = 'root.game.gamestate_update'
-TOPIC_NEWPLAYER = 'root.game.new_player'
-TOPIC_PLAYERX  = "root.game.player.%d"
-TOPIC_PLAYERX_WEAPON_OUT = TOPIC_PLAYERX + '.weapon_out'
-TOPIC_PLAYERX_WEAPON_SHOOT = TOPIC_PLAYERX + '.weapon_shoot'
-TOPIC_PLAYERX_FIRE_WEAPON = TOPIC_PLAYERX + '.fire_weapon'
-
-MOVE_MAP = {
-    arcade.key.UP: Vector2(0, 1),
-    arcade.key.DOWN: Vector2(0, -1),
-    arcade.key.LEFT: Vector2(-1, 0),
-    arcade.key.RIGHT: Vector2(1, 0),
-}
-
-# Client event to server object
-PROJECTILE = 10  # 'ProjectileData'
-
-@dataclass
-class KeysPressed:
-    keys: Dict = field(default_factory=lambda: {k: False for k in MOVE_MAP})
-
-    def reset(self):
-        for k in MOVE_MAP:
-            self.keys[k] = False
-
-    def hasKeyPressed(self):
-        return any(self.keys.values())
-
-
-def apply_movement(speed, dt, current_position, kp, normalize=True):
-    if isinstance(kp, dict):
-        _v = sum(kp[k] * MOVE_MAP[k] for k in kp)
-    else:
-        _v = sum(kp.keys[k] * MOVE_MAP[k] for k in kp.keys)
-    if normalize:
-        _delta_position = _v.get_normalized()
-    else:
-        _delta_position = _v
-    res = current_position + (_delta_position * speed * dt)
-    return res
+# Rendering helpers, client only. arcade and PIL are imported when first
+# needed so that importing the constants above stays cheap.
 
 
 def getSpriteFromSpriteSheet(filename, width=None, height=None, rows=None, cols=None, rects=None):
@@ -77,8 +36,11 @@ def getSpriteFromSpriteSheet(filename, width=None, height=None, rows=None, cols=
     if argsType == '':
         raise ValueError('Only pass one set of args: width & height, rows & cols, *or* rects')
 
+    import arcade
+    from PIL import Image
+
     sheetImage = Image.open(filename)
-    print("sheetImage.size: {}".format(sheetImage.size))
+    LOG.debug('sheetImage.size: %s', sheetImage.size)
     sheetImage.close()
 
     if argsType == 'width/height':
@@ -103,25 +65,7 @@ def getSpriteFromSpriteSheet(filename, width=None, height=None, rows=None, cols=
 
                 rects.append([x, y, spriteWidth, spriteHeight])
 
-    print("#sprites: {}".format(len(rects)))
+    LOG.debug('#sprites: %d', len(rects))
     # create a list of textures objects from the sprite sheet
     textures = arcade.load_textures(filename, rects)
     return textures
-
-
-class MeasureDuration:
-    def __init__(self):
-        self.start = None
-        self.end = None
-        self.duration = 0
-
-    def __enter__(self):
-        self.start = time.time()
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.end = time.time()
-        self.duration = self.end - self.start
-
-    def get_duration_ms(self):
-        return self.duration * 1000
@@ -0,0 +1,107 @@
+"""
+Append-only binary log of the inputs the game server applies, to replay a
+session headlessly (see replay.py).
+
+The file starts with MAGIC, then holds records made of a RECORD header
+(payload size, tick, server time, kind) and a msgpack payload. The first
+record is a HEADER with the server settings, a TICK record precedes each
+ServerState.update() and close() writes an END record with the digest of
+the final player states, which a replay must reproduce.
+"""
+import hashlib
+import mmap
+import struct
+import umsgpack
+
+MAGIC = b'ARCHERS-INPUTLOG-1\n'
+RECORD = struct.Struct('<IIdB')  # payload size, tick, time, kind
+
+# record kinds
+HEADER = 0
+TICK = 1
+SET_PLAYER_STATE = 2
+CREATE_PLAYER = 3
+DELETE_PLAYER = 4
+CLIENT_EVENT = 5
+END = 6
+
+KIND_NAMES = {HEADER: 'header', TICK: 'tick', SET_PLAYER_STATE: 'set_player_state',
+              CREATE_PLAYER: 'create_player', DELETE_PLAYER: 'delete_player',
+              CLIENT_EVENT: 'client_event', END: 'end'}
+
+FLUSH_TICKS = 60  # flush the file every this many ticks
+
+
+def players_digest(game_state):
+    """Digest of the player states, to check a replay"""
+    return hashlib.sha1(umsgpack.packb([p.to_wire() for p in game_state.players])).hexdigest()
+
+
+class InputRecorder:
+    """Writes the records, buffered, flushed every FLUSH_TICKS ticks"""
+
+    def __init__(self, path, **settings):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._ticks = 0
+        self.records = 0
+        self.record(HEADER, 0, 0.0, settings)
+
+    def record(self, kind, tick, t, payload):
+        data = umsgpack.packb(payload)
+        self._file.write(RECORD.pack(len(data), tick, t, kind))
+        self._file.write(data)
+        self.records += 1
+
+    def tick(self, tick, t):
+        self.record(TICK, tick, t, None)
+        self._ticks += 1
+        if self._ticks % FLUSH_TICKS == 0:
+            self._file.flush()
+
+    def close(self, game_state=None):
+        if self._file.closed:
+            return
+        if game_state is not None:
+            self.record(END, game_state.tick, 0.0, players_digest(game_state))
+        self._file.close()
+
+
+class InputLog:
+    """Memory-mapped reader, iterating (kind, tick, time, payload). A
+    record cut short by a crash ends the iteration."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError('%s is not an input log' % path)
+        kind, _, _, self.header = next(iter(self))
+        if kind != HEADER:
+            raise ValueError('%s: no header record' % path)
+
+    def __iter__(self):
+        mm = self._mm
+        unpack_from = RECORD.unpack_from
+        header_size = RECORD.size
+        end = len(mm)
+        offset = len(MAGIC)
+        while offset + header_size <= end:
+            size, tick, t, kind = unpack_from(mm, offset)
+            offset += header_size
+            if offset + size > end:
+                return
+            yield kind, tick, t, umsgpack.unpackb(mm[offset:offset + size])
+            offset += size
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,160 @@
+import time
+
+SNAPSHOTS = 16            # number of snapshots kept per entity
+INTERP_DELAY = 0.1        # initial interpolation delay (s)
+MIN_INTERP_DELAY = 0.035  # about two server ticks
+MAX_INTERP_DELAY = 0.5
+MAX_EXTRAPOLATION = 0.1   # never extrapolate further than this (s)
+JITTER_MULT = 2.0         # delay = latency + snapshot interval + JITTER_MULT * jitter
+DELAY_ADAPT_RATE = 0.05   # how fast interp_delay follows its target
+EWMA_RATE = 0.1
+
+
+class JitterBuffer:
+    """
+    Keeps the last snapshots of one remote entity, stamped with the server
+    time, and renders it at server_now - interp_delay, so late or bunched
+    packets are absorbed by the delay instead of showing up as stutter.
+
+    server_now is estimated from the transit times of the received
+    snapshots (the fastest one gives the clock offset) unless an offset is
+    given with set_clock_offset(). The interpolation delay follows the
+    measured jitter when adaptive is True.
+    """
+
+    __slots__ = ['_size', '_times', '_xs', '_ys', '_ticks', '_count',
+                 'interp_delay', 'adaptive', 'max_extrapolation',
+                 'offset', '_offset_fixed', 'jitter', 'interval', 'latency',
+                 '_last_transit', 'late', 'extrapolated']
+
+    def __init__(self, size=SNAPSHOTS, interp_delay=INTERP_DELAY, adaptive=True,
+                 max_extrapolation=MAX_EXTRAPOLATION):
+        self._size = size
+        self._times = [0.0] * size
+        self._xs = [0.0] * size
+        self._ys = [0.0] * size
+        self._ticks = [0] * size
+        self._count = 0  # total number of snapshots pushed
+        self.interp_delay = interp_delay
+        self.adaptive = adaptive
+        self.max_extrapolation = max_extrapolation
+        self.offset = None  # local clock - server clock (+ min transit)
+        self._offset_fixed = False
+        self.jitter = 0.0
+        self.interval = 0.0
+        self.latency = 0.0  # transit time above the offset
+        self._last_transit = None
+        self.late = 0
+        self.extrapolated = 0
+
+    def __len__(self):
+        return min(self._count, self._size)
+
+    def set_clock_offset(self, offset):
+        # local time - server time, e.g. from a clock sync service. None goes
+        # back to estimating it from the snapshots.
+        if offset is None:
+            if self._offset_fixed:
+                self.offset = None
+            self._offset_fixed = False
+            return
+        self.offset = offset
+        self._offset_fixed = True
+
+    def push(self, srv_time, position, tick=0, local_time=None):
+        if local_time is None:
+            local_time = time.time()
+        size = self._size
+        t_last = None
+        if self._count > 0:
+            t_last = self._times[(self._count - 1) % size]
+            if srv_time <= t_last:
+                # duplicate or reordered snapshot, too late to be useful
+                self.late += 1
+                return False
+        i = self._count % size
+        self._times[i] = srv_time
+        self._xs[i] = position[0]
+        self._ys[i] = position[1]
+        self._ticks[i] = tick
+        self._count += 1
+        self.observe(srv_time, t_last, local_time)
+        return True
+
+    def observe(self, srv_time, last_srv_time, local_time):
+        # update the interval, offset, jitter and delay estimates with a
+        # snapshot sent at srv_time and received at local_time
+        if last_srv_time is not None:
+            delta = srv_time - last_srv_time
+            if self.interval:
+                self.interval += (delta - self.interval) * EWMA_RATE
+            else:
+                self.interval = delta
+
+        transit = local_time - srv_time
+        if not self._offset_fixed:
+            if self.offset is None or transit < self.offset:
+                self.offset = transit
+            else:
+                # let the offset drift up slowly so a single early packet
+                # or clock drift doesn't pin it forever
+                self.offset += (transit - self.offset) * EWMA_RATE * 0.1
+        self.latency += (transit - self.offset - self.latency) * EWMA_RATE
+        if self._last_transit is not None:
+            # interarrival jitter, as in RFC 3550
+            self.jitter += (abs(transit - self._last_transit) - self.jitter) * EWMA_RATE
+        self._last_transit = transit
+
+        if self.adaptive:
+            target = self.latency + self.interval + JITTER_MULT * self.jitter
+            target = min(max(target, MIN_INTERP_DELAY), MAX_INTERP_DELAY)
+            self.interp_delay += (target - self.interp_delay) * DELAY_ADAPT_RATE
+
+    def render_time(self, local_now=None):
+        if local_now is None:
+            local_now = time.time()
+        return local_now - (self.offset or 0.0) - self.interp_delay
+
+    def sample(self, local_now=None):
+        """Returns (True, (x, y)) at render time or (False, None) if empty."""
+        n = len(self)
+        if n == 0:
+            return False, None
+        size = self._size
+        times = self._times
+        xs = self._xs
+        ys = self._ys
+        t = self.render_time(local_now)
+        newest = (self._count - 1) % size
+
+        if t >= times[newest]:
+            if n == 1:
+                return True, (xs[newest], ys[newest])
+            prev = (self._count - 2) % size
+            dt = times[newest] - times[prev]
+            ahead = min(t - times[newest], self.max_extrapolation)
+            if ahead > 0:
+                self.extrapolated += 1
+            k = ahead / dt
+            return True, (xs[newest] + (xs[newest] - xs[prev]) * k,
+                          ys[newest] + (ys[newest] - ys[prev]) * k)
+
+        # walk back from the newest snapshot to the pair around t
+        j = self._count - 1
+        oldest = self._count - n
+        while j > oldest:
+            i1 = j % size
+            i0 = (j - 1) % size
+            if times[i0] <= t:
+                k = (t - times[i0]) / (times[i1] - times[i0])
+                return True, (xs[i0] + (xs[i1] - xs[i0]) * k,
+                              ys[i0] + (ys[i1] - ys[i0]) * k)
+            j -= 1
+        i = oldest % size
+        return True, (xs[i], ys[i])
+
+    def stats(self):
+        return {'len': len(self), 'interp_delay': self.interp_delay,
+                'jitter': self.jitter, 'interval': self.interval,
+                'latency': self.latency,
+                'late': self.late, 'extrapolated': self.extrapolated}
@@ -0,0 +1,110 @@
+"""
+Logging of the server and client processes: the records are put on a queue
+by the logging threads (event loop, render thread) and formatted and
+written by a QueueListener thread, so no formatting or I/O happens on them.
+
+    listener = logsetup.setup(logging.INFO)   # once, in __main__
+    ...
+    listener.stop()                           # flushes, also done at exit
+
+Hot paths (per packet, per frame) log through a HotLog: nothing is built
+below the logger level, and the records which pass are sampled and rate
+limited.
+
+    HOT = HotLog(LOG, rate=5)
+    HOT.info('input from %s: %s', sender, state)
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+HOT_RATE = 10.0    # records per second let through by a HotLog
+HOT_BURST = 20
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler leaving the formatting to the listener thread. The
+    arguments are formatted there, after the call: pass values which won't
+    change in the meantime."""
+
+    def prepare(self, record):
+        if record.exc_info:
+            # the traceback refers to frames which go on running
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup(level=logging.ERROR, stream=None, fmt=FORMAT):
+    """Routes the root logger through a queue to a stream handler (stderr by
+    default), returns the started QueueListener"""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(fmt))
+    q = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(q, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(LazyQueueHandler(q))
+    root.setLevel(level)
+    listener.start()
+    atexit.register(stop, listener)
+    return listener
+
+
+def stop(listener):
+    if listener._thread is not None:
+        listener.stop()
+
+
+class HotLog:
+    """
+    Logger for the hot paths: the level is checked before anything else,
+    then 1 call in every is kept (sampling) and at most rate records per
+    second go through (token bucket of burst records). The next record let
+    through tells how many were dropped by the rate limit.
+    """
+    __slots__ = ['logger', 'every', 'rate', 'burst', 'clock', 'calls', 'tokens', 'last', 'dropped']
+
+    def __init__(self, logger, every=1, rate=HOT_RATE, burst=HOT_BURST, clock=time.monotonic):
+        self.logger = logger
+        self.every = every
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.calls = 0
+        self.tokens = burst
+        self.last = None
+        self.dropped = 0
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        self.calls += 1
+        if self.every > 1 and self.calls % self.every:
+            return
+        now = self.clock()
+        if self.last is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            self.dropped += 1
+            return
+        self.tokens -= 1
+        if self.dropped:
+            msg += ' (%d rate limited)'
+            args += (self.dropped,)
+            self.dropped = 0
+        self.logger.log(level, msg, *args)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        self.log(logging.WARNING, msg, *args)
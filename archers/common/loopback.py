@@ -0,0 +1,378 @@
+"""
+In-memory datagram fabric: connects RPCProtocol endpoints in one process
+without sockets, with configurable latency, jitter, loss, duplication,
+reordering and bandwidth per link, and a virtual clock to run faster than
+real time. The Link impairments are also used by the netproxy.py UDP proxy.
+
+    clock = VirtualClock()
+    loop = VirtualTimeLoop(clock)
+    fabric = LoopbackFabric(LinkProfile(latency=0.05, jitter=0.01, loss=0.01), seed=1)
+    with install(fabric), clock.patch(gameserver, gamethreads):
+        loop.run_until_complete(...)
+
+With install(), every EndpointHelper opens its endpoints on the fabric.
+The VirtualTimeLoop never sleeps: when nothing is ready it jumps its clock
+to the next timer, so asyncio.sleep() and RPC timeouts cost no wall time.
+clock.patch() points the time module of the given game modules to the
+same clock, for the code that reads time.time() directly.
+"""
+import asyncio
+import contextlib
+import math
+import random
+import selectors
+import time as _time
+from dataclasses import dataclass
+from typing import Optional
+from common.protocol import EndpointHelper
+
+LOOPBACK_HOST = '127.0.0.1'
+WILDCARD_HOSTS = ('0.0.0.0', '')
+FIRST_EPHEMERAL_PORT = 49152
+CLOCK_RESOLUTION = 1e-6
+
+
+@dataclass
+class LinkProfile:
+    latency: float = 0.0      # one way delay (s)
+    jitter: float = 0.0       # extra delay, uniform in [0, jitter] (s)
+    loss: float = 0.0         # probability a datagram is dropped
+    burst_loss: float = 0.0   # probability a datagram starts a loss burst...
+    burst_length: float = 1.0  # ...of this mean number of datagrams
+    duplicate: float = 0.0    # probability a datagram is delivered twice
+    reorder: float = 0.0      # probability a datagram is held back...
+    reorder_delay: float = 0.0  # ...by this much more (s), overtaken by the next ones
+    bandwidth: Optional[float] = None  # bytes/s, None for unlimited
+    queue_limit: Optional[int] = None  # bytes waiting for the link before tail drop
+
+
+class LinkStats:
+    __slots__ = ['sent', 'delivered', 'lost', 'queue_dropped', 'duplicated', 'reordered', 'bytes']
+
+    def __init__(self):
+        self.sent = 0
+        self.delivered = 0
+        self.lost = 0
+        self.queue_dropped = 0
+        self.duplicated = 0
+        self.reordered = 0
+        self.bytes = 0
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class Link:
+    """One direction between two addresses: applies its LinkProfile to the
+    datagrams sent on it"""
+    __slots__ = ['profile', 'busy_until', 'in_burst', 'stats']
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.busy_until = 0.0
+        self.in_burst = False
+        self.stats = LinkStats()
+
+    def schedule(self, now, size, rnd):
+        """Returns the arrival times of a datagram of size bytes sent at now:
+        none if it's dropped, two if it's duplicated"""
+        profile = self.profile
+        stats = self.stats
+        stats.sent += 1
+        if self.in_burst:
+            self.in_burst = rnd.random() >= 1 / max(profile.burst_length, 1)
+            stats.lost += 1
+            return ()
+        if profile.burst_loss and rnd.random() < profile.burst_loss:
+            self.in_burst = profile.burst_length > 1
+            stats.lost += 1
+            return ()
+        if profile.loss and rnd.random() < profile.loss:
+            stats.lost += 1
+            return ()
+        start = now
+        if profile.bandwidth:
+            start = max(now, self.busy_until)
+            if profile.queue_limit is not None and (start - now) * profile.bandwidth > profile.queue_limit:
+                stats.queue_dropped += 1
+                return ()
+            self.busy_until = start + size / profile.bandwidth
+            start = self.busy_until
+        times = [start + self._delay(rnd)]
+        if profile.duplicate and rnd.random() < profile.duplicate:
+            stats.duplicated += 1
+            times.append(start + self._delay(rnd))
+        return times
+
+    def _delay(self, rnd):
+        profile = self.profile
+        delay = profile.latency
+        if profile.jitter:
+            delay += rnd.uniform(0, profile.jitter)
+        if profile.reorder and rnd.random() < profile.reorder:
+            delay += profile.reorder_delay
+            self.stats.reordered += 1
+        return delay
+
+
+class _Socket:
+    # what Endpoint.address expects from get_extra_info('socket')
+    def __init__(self, addr):
+        self._addr = addr
+
+    def getsockname(self):
+        return self._addr
+
+
+class LoopbackTransport(asyncio.DatagramTransport):
+
+    def __init__(self, fabric, protocol, local_addr, remote_addr=None):
+        super().__init__()
+        self._fabric = fabric
+        self._protocol = protocol
+        self._local_addr = local_addr
+        self._remote_addr = remote_addr
+        self._closing = False
+        self._extra = {'sockname': local_addr, 'peername': remote_addr,
+                       'socket': _Socket(local_addr)}
+
+    @property
+    def protocol(self):
+        return self._protocol
+
+    def get_extra_info(self, name, default=None):
+        return self._extra.get(name, default)
+
+    def sendto(self, data, addr=None):
+        if self._closing:
+            raise IOError('transport is closed')
+        if addr is None:
+            addr = self._remote_addr
+        self._fabric.send(self._local_addr, addr, bytes(data))
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._fabric.unbind(self._local_addr, self)
+        asyncio.get_event_loop().call_soon(self._protocol.connection_lost, None)
+
+    def abort(self):
+        self.close()
+
+
+class LoopbackFabric:
+    """
+    Datagram switch between LoopbackTransports. Each datagram goes through
+    the LinkProfile of its (src, dst) link, see set_profile(). Delivery is
+    scheduled on the running loop, so delays are in loop time (virtual with
+    VirtualTimeLoop). Random draws come from one seeded generator: the same
+    seed and traffic give the same drops and delays.
+    """
+
+    def __init__(self, profile=None, seed=None):
+        self.default_profile = profile or LinkProfile()
+        self._profiles = []  # (src, dst, profile), most recent first
+        self._bound = {}  # (host, port) -> transport
+        self._links = {}  # (src, dst) -> Link
+        self._next_port = FIRST_EPHEMERAL_PORT
+        self.rnd = random.Random(seed)
+
+    def set_profile(self, profile, src=None, dst=None):
+        """Use profile for the datagrams from src to dst. src and dst are an
+        address tuple, a port, or None for any."""
+        self._profiles.insert(0, (src, dst, profile))
+        for (s, d), link in self._links.items():
+            link.profile = self._profile(s, d)
+
+    @staticmethod
+    def _match(pattern, addr):
+        if pattern is None:
+            return True
+        if isinstance(pattern, int):
+            return addr[1] == pattern
+        return tuple(pattern) == addr
+
+    def _profile(self, src, dst):
+        for s, d, profile in self._profiles:
+            if self._match(s, src) and self._match(d, dst):
+                return profile
+        return self.default_profile
+
+    def _link(self, src, dst):
+        link = self._links.get((src, dst))
+        if link is None:
+            link = Link(self._profile(src, dst))
+            self._links[src, dst] = link
+        return link
+
+    def stats(self):
+        total = LinkStats()
+        for link in self._links.values():
+            for k in LinkStats.__slots__:
+                setattr(total, k, getattr(total, k) + getattr(link.stats, k))
+        return total.as_dict()
+
+    def link_stats(self):
+        return {(src, dst): link.stats.as_dict() for (src, dst), link in self._links.items()}
+
+    # -- endpoints
+
+    def bind(self, transport, addr):
+        host, port = addr
+        if not port:
+            while (LOOPBACK_HOST, self._next_port) in self._bound:
+                self._next_port += 1
+            port = self._next_port
+            self._next_port += 1
+        if host in WILDCARD_HOSTS:
+            host = LOOPBACK_HOST
+        addr = (host, port)
+        if addr in self._bound:
+            raise OSError(98, 'Address already in use: %s:%d' % addr)
+        self._bound[addr] = transport
+        return addr
+
+    def unbind(self, addr, transport):
+        if self._bound.get(addr) is transport:
+            del self._bound[addr]
+
+    async def create_datagram_endpoint(self, protocol_factory, local_addr=None,
+                                       remote_addr=None, **kwargs):
+        """Same interface as loop.create_datagram_endpoint"""
+        protocol = protocol_factory()
+        transport = LoopbackTransport(self, protocol, None, remote_addr)
+        addr = self.bind(transport, local_addr or (LOOPBACK_HOST, 0))
+        transport._local_addr = addr
+        transport._extra.update(sockname=addr, socket=_Socket(addr))
+        protocol.connection_made(transport)
+        return transport, protocol
+
+    # -- delivery
+
+    def send(self, src, dst, data):
+        host, port = dst
+        if host in WILDCARD_HOSTS or host == 'localhost':
+            dst = (LOOPBACK_HOST, port)
+        link = self._link(src, dst)
+        loop = asyncio.get_event_loop()
+        for when in link.schedule(loop.time(), len(data), self.rnd):
+            loop.call_at(when, self._deliver, src, dst, data, link)
+
+    def _deliver(self, src, dst, data, link):
+        transport = self._bound.get(dst)
+        if transport is None or transport.is_closing():
+            link.stats.lost += 1
+            return
+        link.stats.delivered += 1
+        link.stats.bytes += len(data)
+        transport.protocol.datagram_received(data, src)
+
+
+@contextlib.contextmanager
+def install(fabric):
+    """Open all the EndpointHelper endpoints on fabric while in the block"""
+    previous = EndpointHelper.fabric
+    EndpointHelper.fabric = fabric
+    try:
+        yield fabric
+    finally:
+        EndpointHelper.fabric = previous
+
+
+# -- virtual time -------------------------------------------------------------
+
+class VirtualClock:
+
+    def __init__(self, start=None):
+        self.now = _time.time() if start is None else start
+
+    def time(self):
+        return self.now
+
+    def advance(self, dt):
+        self.now += dt
+
+    @contextlib.contextmanager
+    def patch(self, *modules):
+        """Replace the time module imported by each of modules with one
+        reading this clock"""
+        shim = _TimeModule(self)
+        saved = [(m, m.time) for m in modules]
+        for m in modules:
+            m.time = shim
+        try:
+            yield self
+        finally:
+            for m, t in saved:
+                m.time = t
+
+
+class _TimeModule:
+    # the time functions the game code uses, on a VirtualClock; the rest
+    # comes from the real time module
+
+    def __init__(self, clock):
+        self._clock = clock
+
+    def time(self):
+        return self._clock.now
+
+    perf_counter = monotonic = time
+
+    def perf_counter_ns(self):
+        return int(self._clock.now * 1e9)
+
+    monotonic_ns = time_ns = perf_counter_ns
+
+    def __getattr__(self, name):
+        return getattr(_time, name)
+
+
+class _VirtualSelector(selectors.BaseSelector):
+    # never blocks: select(timeout) moves the clock forward instead
+
+    def __init__(self, clock):
+        self._clock = clock
+        self._map = {}
+
+    def register(self, fileobj, events, data=None):
+        key = selectors.SelectorKey(fileobj, selectors._fileobj_to_fd(fileobj), events, data)
+        self._map[fileobj] = key
+        return key
+
+    def unregister(self, fileobj):
+        return self._map.pop(fileobj)
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError('virtual time loop is idle with no timer scheduled')
+        if timeout > 0:
+            # at least one ulp, or a timer closer than that would never be due
+            now = self._clock.now
+            self._clock.now = max(now + timeout, math.nextafter(now, math.inf))
+        return []
+
+    def get_map(self):
+        return self._map
+
+    def close(self):
+        self._map.clear()
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop on a VirtualClock. Only for loopback endpoints, it can't
+    wait for real sockets."""
+
+    def __init__(self, clock=None):
+        self.clock = clock or VirtualClock()
+        super().__init__(_VirtualSelector(self.clock))
+        # timers due within this are run; the 1ns default of the monotonic
+        # clock is below the float resolution of an epoch based clock
+        self._clock_resolution = CLOCK_RESOLUTION
+
+    def time(self):
+        return self.clock.now
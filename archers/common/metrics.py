@@ -0,0 +1,180 @@
+"""
+Metrics registry of the game server: counters, log-linear (HDR style)
+histograms and collectors, cheap enough to leave on. snapshot() gives a
+JSON friendly dict, served on localhost by serve_stats() and written to a
+file by dump_every().
+
+    registry = Registry()
+    registry.histogram('tick').record(0.0021)   # seconds
+    registry.counter('datagrams_in').inc()
+    registry.add_collector('server', lambda: {'players': 12})
+"""
+import asyncio
+import json
+import logging
+import os
+
+LOG = logging.getLogger(__name__)
+
+SUB_BUCKET_BITS = 6    # 32 sub-buckets per power of two, < 3.2% error
+MAX_SHIFT = 35         # values up to 2**41 resolution units (~25 days in us)
+RESOLUTION = 1e-6      # histograms of seconds, counted in microseconds
+PERCENTILES = (50, 90, 99, 99.9)
+STATS_HOST = '127.0.0.1'
+DUMP_PERIOD = 10.0
+
+
+class Counter:
+    __slots__ = ['value']
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Histogram:
+    """
+    Fixed memory histogram of positive values: exact below 2**SUB_BUCKET_BITS
+    resolution units, then SUB_BUCKET_BITS significant bits per power of two.
+    record() is O(1), percentiles report the upper bound of their bucket.
+    """
+    __slots__ = ['resolution', 'counts', 'count', 'total', 'min', 'max']
+
+    SUB = 1 << SUB_BUCKET_BITS
+    HALF = SUB >> 1
+
+    def __init__(self, resolution=RESOLUTION):
+        self.resolution = resolution
+        self.counts = [0] * (self.SUB + MAX_SHIFT * self.HALF)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def record(self, value):
+        v = int(value / self.resolution)
+        if v < self.SUB:
+            idx = v if v > 0 else 0
+        else:
+            shift = v.bit_length() - SUB_BUCKET_BITS
+            if shift > MAX_SHIFT:
+                shift, v = MAX_SHIFT, (self.SUB << MAX_SHIFT) - 1
+            idx = self.SUB + (shift - 1) * self.HALF + (v >> shift) - self.HALF
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def bucket_upper(self, idx):
+        """Largest value counted in bucket idx"""
+        if idx < self.SUB:
+            v = idx
+        else:
+            k = idx - self.SUB
+            shift = k // self.HALF + 1
+            v = ((k % self.HALF + self.HALF + 1) << shift) - 1
+        return v * self.resolution
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = max(1, -(-self.count * p // 100))  # ceil
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self.bucket_upper(idx), self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def summary(self, scale=1000):
+        """count, mean, min, max and percentiles, in ms by default"""
+        res = {'count': self.count,
+               'mean': self.total / self.count * scale if self.count else 0.0,
+               'min': (self.min or 0.0) * scale, 'max': self.max * scale}
+        for p in PERCENTILES:
+            res['p%g' % p] = self.percentile(p) * scale
+        return res
+
+
+class Registry:
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = {}
+
+    def counter(self, name):
+        c = self.counters.get(name)
+        if c is None:
+            c = self.counters[name] = Counter()
+        return c
+
+    def histogram(self, name, resolution=RESOLUTION):
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histograms[name] = Histogram(resolution)
+        return h
+
+    def add_collector(self, name, fn):
+        """fn() returns a JSON friendly value, computed at snapshot time"""
+        self.collectors[name] = fn
+
+    def snapshot(self):
+        res = {'counters': {k: c.value for k, c in sorted(self.counters.items())},
+               'histograms_ms': {k: h.summary() for k, h in sorted(self.histograms.items())}}
+        for name, fn in self.collectors.items():
+            res[name] = fn()
+        return res
+
+
+async def serve_stats(registry, port, host=STATS_HOST):
+    """HTTP endpoint answering GET / with registry.snapshot() as JSON.
+    Only bind it to a local address, there is no authentication."""
+
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1] in (b'/', b'/metrics'):
+                status, body = b'200 OK', json.dumps(registry.snapshot()).encode()
+            else:
+                status, body = b'404 Not Found', b'{}'
+            writer.write(b'HTTP/1.0 %s\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: %d\r\n\r\n' % (status, len(body)) + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    LOG.info('stats on http://%s:%d/', host, port)
+    return server
+
+
+def dump(registry, path):
+    # write then rename so readers never see a partial file
+    tmp = '%s.tmp' % path
+    with open(tmp, 'w') as f:
+        json.dump(registry.snapshot(), f, indent=1)
+    os.replace(tmp, path)
+
+
+async def dump_every(registry, path, period=DUMP_PERIOD):
+    while True:
+        await asyncio.sleep(period)
+        dump(registry, path)
@@ -1,6 +1,6 @@
 import arcade
-from common.helpers import getSpriteFromSpriteSheet
-from common.vector2 import Vector2
+from common.textures import get_player_textures
+from common.textures import ANIM_STAND, ANIM_WALK, ANIM_TAKE_BOW, ANIM_FIRE_BOW
 from common.helpers import FACE_RIGHT, FACE_LEFT, FACE_UP, FACE_DOWN
 from pubsub import pub
 from common.helpers import TOPIC_PLAYERX_WEAPON_OUT, TOPIC_PLAYERX_WEAPON_SHOOT
@@ -9,6 +9,15 @@ RUN_SPEED = 150
 WALK_SPEED = 100
 MOVEMENT_SPEED = WALK_SPEED
 
+# (sign of change_x, sign of change_y) -> facing, only moves along one axis
+# change the facing
+FACING_FROM_MOVE = {
+    (1, 0): FACE_RIGHT,
+    (-1, 0): FACE_LEFT,
+    (0, -1): FACE_DOWN,
+    (0, 1): FACE_UP,
+}
+
 
 class PlayerCharacter(arcade.Sprite):
 
@@ -16,15 +25,11 @@ class PlayerCharacter(arcade.Sprite):
         self.picsdir = picsdir
         super().__init__(**kwargs)
         self.state = FACE_RIGHT
-        self.stand_right_textures = []
-        self.stand_left_textures = []
-        self.walk_left_textures = []
-        self.walk_right_textures = []
-        self.walk_up_textures = []
-        self.walk_down_textures = []
+        self.sequences = None  # (animation, facing) -> frames, shared by all the characters
         self.cur_texture_index = 0
         self.movement_speed = MOVEMENT_SPEED
         self.texture_change_distance = 10
+        self.texture_change_distance_sqrd = 100
         self.last_texture_change_center_x = 0
         self.last_texture_change_center_y = 0
         self.texture_change_frames = 3
@@ -35,22 +40,10 @@ class PlayerCharacter(arcade.Sprite):
         self.weapon_in_anim = False
         self.fire_weapon = False
         self.fire_weapon_anim = False
-        self.fire_weapon_anim_cb = None
+        self.fire_weapon_cb = None
         self.cb_params = None
-        self.cur_take_bow_texture_index = 0
-        self.stand_up_take_bow_textures = []
-        self.stand_left_take_bow_textures = []
-        self.stand_down_take_bow_textures = []
-        self.stand_right_take_bow_textures = []
-        self.stand_textures = None
-        self.walk_textures = None
-        self.take_bow_textures = None
-        self.fire_bow_textures = None
-        self.stand_up_fire_bow_textures = []
-        self.stand_left_fire_bow_textures = []
-        self.stand_down_fire_bow_textures = []
-        self.stand_right_fire_bow_textures = []
-        self.cur_fire_bow_texture_index = 0
+        # frame index of the weapon animations (take/put away bow, fire)
+        self.cur_weapon_texture_index = 0
 
         self.is_idle_cb = lambda: False
         self.skip_facing_change = False
@@ -77,6 +70,7 @@ class PlayerCharacter(arcade.Sprite):
         else:
             self.movement_speed = WALK_SPEED
             self.texture_change_distance = 10
+        self.texture_change_distance_sqrd = self.texture_change_distance ** 2
 
     def set_check_idle_cb(self, func):
         self.is_idle_cb = func
@@ -88,56 +82,8 @@ class PlayerCharacter(arcade.Sprite):
         pub.subscribe(self.on_weapon_out, TOPIC_PLAYERX_WEAPON_OUT % self.id)
         pub.subscribe(self.on_weapon_shoot, TOPIC_PLAYERX_WEAPON_SHOOT % self.id)
 
-        self.player_textures = getSpriteFromSpriteSheet(self.picsdir / 'playercharacter.png', width=64, height=64)
-        # stand right = 15
-        self.stand_right_textures.extend([self.player_textures[15]])
-        # stand left = 5
-        self.stand_left_textures.extend([self.player_textures[5]])
-        # walk up index = 60..64 (walk_up_textures)
-        self.walk_up_textures.extend(self.player_textures[60:65])
-        # walk left 65..69 (walk_left_textures)
-        self.walk_left_textures.extend(self.player_textures[65:70])
-        # walk down 70..74 (walk_down_textures)
-        self.walk_down_textures.extend(self.player_textures[70:75])
-        # walk right 75..79 (walk_right_textures)
-        self.walk_right_textures.extend(self.player_textures[75:80])
-
-        # stand up take bow
-        self.stand_up_take_bow_textures.extend(self.player_textures[120:125])
-        self.stand_left_take_bow_textures.extend(self.player_textures[125:130])
-        self.stand_down_take_bow_textures.extend(self.player_textures[130:135])
-        self.stand_right_take_bow_textures.extend(self.player_textures[135:140])
-
-        # stand up fire bow
-        self.stand_up_fire_bow_textures.extend(self.player_textures[140:145])
-        self.stand_left_fire_bow_textures.extend(self.player_textures[145:150])
-        self.stand_down_fire_bow_textures.extend(self.player_textures[150:155])
-        self.stand_right_fire_bow_textures.extend(self.player_textures[155:160])
-
-        self.stand_textures = {
-            FACE_LEFT: self.stand_left_textures[0],
-            FACE_RIGHT: self.stand_right_textures[0],
-            FACE_UP: self.walk_up_textures[0],
-            FACE_DOWN: self.walk_down_textures[0]
-        }
-        self.walk_textures = {
-            FACE_LEFT: self.walk_left_textures,
-            FACE_RIGHT: self.walk_right_textures,
-            FACE_UP: self.walk_up_textures,
-            FACE_DOWN: self.walk_down_textures
-        }
-        self.take_bow_textures = {
-            FACE_LEFT: self.stand_left_take_bow_textures,
-            FACE_RIGHT: self.stand_right_take_bow_textures,
-            FACE_UP: self.stand_up_take_bow_textures,
-            FACE_DOWN: self.stand_down_take_bow_textures
-        }
-        self.fire_bow_textures = {
-            FACE_LEFT: self.stand_left_fire_bow_textures,
-            FACE_RIGHT: self.stand_right_fire_bow_textures,
-            FACE_UP: self.stand_up_fire_bow_textures,
-            FACE_DOWN: self.stand_down_fire_bow_textures
-        }
+        # frame tables are loaded once and shared by all the characters
+        self.sequences = get_player_textures(self.picsdir).sequences
 
     def on_weapon_out(self, params):
         self.cb_params = params
@@ -156,12 +102,12 @@ class PlayerCharacter(arcade.Sprite):
             self.fire_weapon_cb = self.cb_params['cb']
 
     def _get_take_bow_out_or_in_texture(self):
-        _texture_list = self.take_bow_textures[self.state]
+        _texture_list = self.sequences[ANIM_TAKE_BOW, self.state]
         if self.weapon_out_anim:
-            _texture = _texture_list[self.cur_take_bow_texture_index]
-            self.cur_take_bow_texture_index += 1
-            if self.cur_take_bow_texture_index >= len(_texture_list):
-                self.cur_take_bow_texture_index = 0
+            _texture = _texture_list[self.cur_weapon_texture_index]
+            self.cur_weapon_texture_index += 1
+            if self.cur_weapon_texture_index >= len(_texture_list):
+                self.cur_weapon_texture_index = 0
                 self.weapon_out_anim = False
                 self.frame = 0
                 self.weapon_out = True
@@ -169,11 +115,11 @@ class PlayerCharacter(arcade.Sprite):
                     self.weapon_out_anim_cb(self.cb_params)
                     self.weapon_out_anim_cb = None
         elif self.weapon_in_anim:
-            if self.cur_take_bow_texture_index == 0:
-                self.cur_take_bow_texture_index = len(_texture_list) - 1
-            _texture = _texture_list[self.cur_take_bow_texture_index]
-            self.cur_take_bow_texture_index -= 1
-            if self.cur_take_bow_texture_index == 0:
+            if self.cur_weapon_texture_index == 0:
+                self.cur_weapon_texture_index = len(_texture_list) - 1
+            _texture = _texture_list[self.cur_weapon_texture_index]
+            self.cur_weapon_texture_index -= 1
+            if self.cur_weapon_texture_index == 0:
                 self.weapon_in_anim = False
                 self.frame = 0
                 self.weapon_out = False
@@ -182,11 +128,11 @@ class PlayerCharacter(arcade.Sprite):
         return _texture
 
     def _get_fire_bow_texture(self):
-        _texture_list = self.fire_bow_textures[self.state]
-        _texture = _texture_list[self.cur_fire_bow_texture_index]
-        self.cur_fire_bow_texture_index += 1
-        if self.cur_fire_bow_texture_index >= len(_texture_list):
-            self.cur_fire_bow_texture_index = 0
+        _texture_list = self.sequences[ANIM_FIRE_BOW, self.state]
+        _texture = _texture_list[self.cur_weapon_texture_index]
+        self.cur_weapon_texture_index += 1
+        if self.cur_weapon_texture_index >= len(_texture_list):
+            self.cur_weapon_texture_index = 0
             self.fire_weapon_anim = False
             self.frame = 0
             if self.fire_weapon_cb:
@@ -206,53 +152,45 @@ class PlayerCharacter(arcade.Sprite):
                 _texture = self._get_fire_bow_texture()
             self.frame += 1
         elif not self.weapon_out:
-            _texture = self.stand_textures[self.state]
+            _texture = self.sequences[ANIM_STAND, self.state][0]
 
         return _texture
 
-    def update_animation(self, delta_time):
-        _distance = (Vector2(self.last_texture_change_center_x, self.last_texture_change_center_y) -
-            Vector2(self.center_x, self.center_y)).get_length()
-        _texture_list = []
-        _curr_texture = None
+    def update_animation(self, delta_time=1/60):
+        change_x = self.change_x
+        change_y = self.change_y
         _change_direction = False
 
-        if self.change_x > 0 and self.change_y == 0 and self.state != FACE_RIGHT \
-                and len(self.walk_right_textures) > 0:
-            self.state = FACE_RIGHT
-            _change_direction = True
-        elif self.change_x < 0 and self.change_y == 0 and self.state != FACE_LEFT \
-                and len(self.walk_left_textures) > 0:
-            self.state = FACE_LEFT
-            _change_direction = True
-        elif self.change_y < 0 and self.change_x == 0 and self.state != FACE_DOWN \
-                and len(self.walk_down_textures) > 0:
-            self.state = FACE_DOWN
-            _change_direction = True
-        elif self.change_y > 0 and self.change_x == 0 and self.state != FACE_UP \
-                and len(self.walk_up_textures) > 0:
-            self.state = FACE_UP
-            _change_direction = True
+        if change_x or change_y:
+            facing = FACING_FROM_MOVE.get(((change_x > 0) - (change_x < 0),
+                                           (change_y > 0) - (change_y < 0)))
+            if facing is not None and facing != self.state:
+                self.state = facing
+                _change_direction = True
+
+        dx = self.center_x - self.last_texture_change_center_x
+        dy = self.center_y - self.last_texture_change_center_y
 
         if ((not self.skip_facing_change) and _change_direction) or \
-            (_distance >= self.texture_change_distance):
+                (dx*dx + dy*dy >= self.texture_change_distance_sqrd):
             self.weapon_out = False
             self.last_texture_change_center_x = self.center_x
             self.last_texture_change_center_y = self.center_y
-            texture_list = self.walk_textures[self.state]
+            texture_list = self.sequences[ANIM_WALK, self.state]
             self.cur_texture_index += 1
             if self.cur_texture_index >= len(texture_list):
                 self.cur_texture_index = 0
             _curr_texture = texture_list[self.cur_texture_index]
-        elif (not _change_direction and (self.change_x == 0 and self.change_y == 0)) \
+        elif (not _change_direction and not (change_x or change_y)) \
                 or self.is_idle_cb():
             _curr_texture = self.update_idle_animation(delta_time)
+        else:
+            _curr_texture = None
 
-        if _curr_texture:
+        # only touch the texture and size when the frame changes
+        if _curr_texture is not None and _curr_texture is not self.texture:
             self.texture = _curr_texture
-
-        if self.texture is None:
+            self.width = _curr_texture.width * self.scale
+            self.height = _curr_texture.height * self.scale
+        elif self.texture is None:
             raise RuntimeError("Error, no texture set")
-        else:
-            self.width = self.texture.width * self.scale
-            self.height = self.texture.height * self.scale
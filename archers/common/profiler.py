@@ -0,0 +1,135 @@
+"""
+Zone profiler: nested named zones timed with perf_counter_ns into a
+preallocated ring buffer, exported as Chrome trace events (chrome://tracing,
+https://ui.perfetto.dev).
+
+    Z_TICK = PROFILER.zone('tick')
+    Z_ENCODE = PROFILER.zone('encode')
+
+    PROFILER.enable()
+    with Z_TICK:
+        with Z_ENCODE:
+            ...
+    PROFILER.export_chrome('trace.json')
+
+Zones are made once and reused, a disabled profiler costs one attribute
+test per zone. A Profiler follows one thread: the zones of a profiler
+must only be entered by the thread using it.
+"""
+import json
+import os
+import threading
+from array import array
+from time import perf_counter_ns
+
+CAPACITY = 1 << 16  # zone events kept
+
+
+class Zone:
+    __slots__ = ['name', 'profiler']
+
+    def __init__(self, name, profiler):
+        self.name = name
+        self.profiler = profiler
+
+    def __enter__(self):
+        p = self.profiler
+        if p.enabled:
+            p._stack.append(perf_counter_ns())
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        p = self.profiler
+        if p.enabled and p._stack:
+            end = perf_counter_ns()
+            start = p._stack.pop()
+            i = p._next
+            p._names[i] = self.name
+            p._starts[i] = start
+            p._durs[i] = end - start
+            p._depths[i] = len(p._stack)
+            i += 1
+            p._next = 0 if i == p.capacity else i
+            p.count += 1
+
+
+class Profiler:
+
+    def __init__(self, capacity=CAPACITY, enabled=False):
+        self.capacity = capacity
+        self._names = [None] * capacity
+        self._starts = array('q', bytes(8 * capacity))
+        self._durs = array('q', bytes(8 * capacity))
+        self._depths = array('b', bytes(capacity))
+        self._next = 0
+        self._stack = []
+        self._zones = {}
+        self.count = 0  # events recorded since the start, some may be overwritten
+        self.epoch = perf_counter_ns()
+        self.tid = threading.get_ident()
+        self.enabled = enabled
+
+    def zone(self, name):
+        """The Zone called name, made on first use"""
+        z = self._zones.get(name)
+        if z is None:
+            z = self._zones[name] = Zone(name, self)
+        return z
+
+    def enable(self, enabled=True):
+        # zones entered before, exited after, aren't recorded
+        self._stack.clear()
+        self.tid = threading.get_ident()
+        self.enabled = enabled
+
+    def clear(self):
+        self._next = 0
+        self.count = 0
+
+    def events(self):
+        """(name, start_ns, duration_ns, depth) of the events kept, oldest
+        first, in the order the zones were exited"""
+        n = min(self.count, self.capacity)
+        first = (self._next - n) % self.capacity
+        for k in range(n):
+            i = (first + k) % self.capacity
+            yield self._names[i], self._starts[i], self._durs[i], self._depths[i]
+
+    def recent(self, name, n):
+        """Breakdowns of the last n occurrences of zone name, oldest first:
+        (duration_ns, {child zone: duration_ns}) of its direct children"""
+        res = []
+        kept = min(self.count, self.capacity)
+        i = self._next
+        # zones are exited after their children: going back, each
+        # occurrence comes first, then its children
+        for _ in range(kept):
+            i = (i - 1) % self.capacity
+            zname, start, dur, depth = self._names[i], self._starts[i], self._durs[i], self._depths[i]
+            if zname == name:
+                if len(res) == n:
+                    break
+                res.append((start, dur, depth, {}))
+            elif res:
+                pstart, pdur, pdepth, children = res[-1]
+                if depth == pdepth + 1 and pstart <= start <= pstart + pdur:
+                    children[zname] = children.get(zname, 0) + dur
+        res.reverse()
+        return [(dur, children) for _, dur, _, children in res]
+
+    def export_chrome(self, path, pid=None):
+        """Writes the events kept as Chrome trace event JSON"""
+        pid = os.getpid() if pid is None else pid
+        events = [{'name': name, 'cat': 'zone', 'ph': 'X', 'pid': pid, 'tid': self.tid,
+                   'ts': (start - self.epoch) / 1000, 'dur': dur / 1000}
+                  for name, start, dur, _ in self.events()]
+        # parents after their children in the ring, viewers want them sorted
+        events.sort(key=lambda e: (e['ts'], -e['dur']))
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+
+# profiler of the game loop thread of the process: the arcade thread in the
+# client, the event loop in the server
+PROFILER = Profiler()
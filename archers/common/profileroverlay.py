@@ -0,0 +1,77 @@
+"""
+On-screen breakdown of the last frames recorded by a Profiler: one stacked
+bar per frame and zone (on_update, on_draw), a colour per child zone, and
+the mean of each child over those frames. Toggled with P in the client.
+"""
+import arcade
+
+FRAMES = 60          # frames shown
+REFRESH = 15         # frames between two refreshes of the bars
+BAR_WIDTH = 3
+MS_HEIGHT = 5        # pixels per ms
+SCALE_MS = 12        # bars are clipped there
+MARGIN = 10
+COLORS = (arcade.color.RED, arcade.color.YELLOW, arcade.color.CYAN, arcade.color.ORANGE,
+          arcade.color.VIOLET, arcade.color.WHITE, arcade.color.PINK, arcade.color.LIME)
+OTHER_COLOR = arcade.color.GRAY  # parent time not in a child zone
+
+
+class ProfilerOverlay:
+
+    def __init__(self, profiler, zones=('on_update', 'on_draw'), frames=FRAMES):
+        self.profiler = profiler
+        self.zones = zones
+        self.frames = frames
+        self.colors = {}
+        self.shapes = None
+        self.texts = []
+        self._countdown = 0
+
+    def color(self, name):
+        c = self.colors.get(name)
+        if c is None:
+            c = self.colors[name] = COLORS[len(self.colors) % len(COLORS)]
+        return c
+
+    def refresh(self, height):
+        shapes = arcade.ShapeElementList()
+        texts = []
+        top = height - MARGIN
+        for zone in self.zones:
+            frames = self.profiler.recent(zone, self.frames)
+            bottom = top - 14
+            means = {}
+            for k, (dur, children) in enumerate(frames):
+                x = MARGIN + k * BAR_WIDTH + BAR_WIDTH / 2
+                y = bottom - 8
+                floor = y - SCALE_MS * MS_HEIGHT
+                rest = dur
+                for name, child in sorted(children.items()):
+                    h = min(child / 1e6 * MS_HEIGHT, y - floor)
+                    shapes.append(arcade.create_rectangle_filled(x, y - h / 2, BAR_WIDTH, h, self.color(name)))
+                    y -= h
+                    rest -= child
+                    means[name] = means.get(name, 0) + child
+                h = min(max(rest, 0) / 1e6 * MS_HEIGHT, y - floor)
+                shapes.append(arcade.create_rectangle_filled(x, y - h / 2, BAR_WIDTH, h, OTHER_COLOR))
+            n = len(frames) or 1
+            total = sum(dur for dur, _ in frames) / n / 1e6
+            x = MARGIN
+            for name, ns in [(zone, total * 1e6 * n)] + sorted(means.items()):
+                # the zone in white, its children in the colour of their bars
+                color = arcade.color.WHITE if name == zone else self.color(name)
+                text = arcade.Text('%s %.2f' % (name, ns / n / 1e6), x, bottom, color, 10)
+                texts.append(text)
+                x += text.content_width + 8
+            top = bottom - 8 - SCALE_MS * MS_HEIGHT - MARGIN
+        self.shapes = shapes
+        self.texts = texts
+
+    def draw(self, height):
+        if self._countdown <= 0:
+            self.refresh(height)
+            self._countdown = REFRESH
+        self._countdown -= 1
+        self.shapes.draw()
+        for text in self.texts:
+            text.draw()
@@ -1,8 +1,10 @@
 import arcade
+from common.textures import get_texture
 from common.helpers import FACE_RIGHT, FACE_LEFT, FACE_UP, FACE_DOWN
 
 PROJECTILE_SPEED = 400
 MAX_DIS = 1000
+POOL_SIZE = 32  # projectile sprites preallocated by ProjectileManager
 
 class Projectile(arcade.Sprite):
 
@@ -15,7 +17,9 @@ class Projectile(arcade.Sprite):
     def setup(self, id, src_id, scale=1.5, facing=FACE_RIGHT, position=None, max_dis=MAX_DIS):
         self.id = id
         self.src_id = src_id  # the id of the source object that created this projectile
-        self.texture = arcade.load_texture('pics/arrow.png')
+        if self.texture is None:
+            # pooled sprites keep their texture
+            self.texture = get_texture('pics/arrow.png')
         self.scale = scale
         self.width = self.texture.width * self.scale
         self.height = self.texture.height * self.scale
@@ -25,6 +29,9 @@ class Projectile(arcade.Sprite):
         self.max_dis = max_dis
         self.dis_x = 0
         self.dis_y = 0
+        self.change_x = 0
+        self.change_y = 0
+        self.angle = 0
         if self.facing == FACE_LEFT:
             self.turn_left(180)
         elif self.facing == FACE_UP:
@@ -66,3 +73,53 @@ class Projectile(arcade.Sprite):
     @src_player_id.setter
     def src_player_id(self, value):
         self._src_player_id = value
+
+
+class ProjectileManager:
+    """
+    Owns the projectile sprites: a dedicated SpriteList, an id -> sprite
+    index and a free list of Projectile sprites reused from one shot to the
+    next, so firing doesn't allocate sprites or reload textures.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE):
+        self.sprites = arcade.SpriteList()
+        self._index = {}  # projectile id -> Projectile
+        self._free = [Projectile() for _ in range(pool_size)]
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, projectile_id):
+        return self._index.get(projectile_id)
+
+    def spawn(self, id, src_id, facing=FACE_RIGHT, position=None, **kwargs):
+        sprite = self._free.pop() if self._free else Projectile()
+        sprite.setup(id, src_id, facing=facing, position=position, **kwargs)
+        self._index[id] = sprite
+        self.sprites.append(sprite)
+        return sprite
+
+    def despawn(self, projectile_id):
+        sprite = self._index.pop(projectile_id, None)
+        if sprite is None:
+            return False
+        self.sprites.remove(sprite)
+        self._free.append(sprite)
+        return True
+
+    def despawn_expired(self):
+        # collect first, then remove, the list is never mutated while iterated
+        expired = [s.id for s in self.sprites if s.is_too_far()]
+        for projectile_id in expired:
+            self.despawn(projectile_id)
+        return expired
+
+    def update(self):
+        self.sprites.update()
+
+    def update_animation(self, dt):
+        self.sprites.update_animation(dt)
+
+    def draw(self):
+        self.sprites.draw()
@@ -4,11 +4,19 @@ Module for interacting on the network via a Async Protocol
 import asyncio
 import logging
 import os
+import time
+import warnings
 from base64 import b64encode
 from hashlib import sha1
 
 import umsgpack
 
+from common.logsetup import HotLog
+
+# Largest UDP payload. Snapshots outgrow the former 8K limit past ~150
+# players; above the path MTU they are sent as IP fragments.
+MAX_MESSAGE_SIZE = 65507 - 21
+
 
 class MalformedMessage(Exception):
     pass
@@ -97,6 +105,9 @@ class RemoteEndpoint(Endpoint):
 
 
 class EndpointHelper:
+    # object with a create_datagram_endpoint() like the event loop's to
+    # open the endpoints on instead of UDP sockets, see common.loopback
+    fabric = None
 
     def __init__(self, protocol, post_connect, logger=None):
         self._protocol = protocol
@@ -115,7 +126,10 @@ class EndpointHelper:
         else:
             self._logger.debug("local_addr = %s" % str(kwargs['local_addr']))
         kwargs['protocol_factory'] = lambda: self._protocol(endpoint)
-        transport, protocol = await loop.create_datagram_endpoint(**kwargs)
+        create_datagram_endpoint = loop.create_datagram_endpoint
+        if self.fabric is not None:
+            create_datagram_endpoint = self.fabric.create_datagram_endpoint
+        transport, protocol = await create_datagram_endpoint(**kwargs)
         if self._post_connect:
             self._post_connect()
         return endpoint, protocol
@@ -140,23 +154,59 @@ class EndpointHelper:
             **kwargs)
 
 class RPCProtocol(asyncio.DatagramProtocol):
+    # common.metrics.Registry getting the handler durations as 'rpc.<name>'
+    # histograms, or None
+    metrics = None
 
     def __init__(self, endpoint, logger=None, wait_timeout=5):
         self._endpoint = endpoint
         self._wait_timeout = wait_timeout
         self._outstanding = {}
         self._logger = logger or logging.getLogger(__name__)
+        # per datagram logs, and the warnings a bad peer could flood
+        self._hot_log = HotLog(self._logger)
+        # traffic counters, last_tx_bytes is the size of the last datagram sent
+        self.rx_packets = 0
+        self.rx_bytes = 0
+        self.tx_packets = 0
+        self.tx_bytes = 0
+        self.last_tx_bytes = 0
+
+    @property
+    def outstanding(self):
+        """number of requests waiting for their response"""
+        return len(self._outstanding)
+
+    async def _call(self, funcname, func, address, args):
+        # handlers may be plain functions or coroutines (asyncio.coroutine
+        # is gone since Python 3.11)
+        metrics = self.metrics
+        if metrics is not None:
+            t0 = time.perf_counter()
+        response = func(address, *args)
+        if asyncio.iscoroutine(response):
+            response = await response
+        if metrics is not None:
+            metrics.histogram('rpc.' + funcname).record(time.perf_counter() - t0)
+        return response
+
+    def _count_tx(self, txdata):
+        self.tx_packets += 1
+        self.tx_bytes += len(txdata)
+        self.last_tx_bytes = len(txdata)
 
     def connection_made(self, transport):
         self._endpoint.transport = transport
 
     def datagram_received(self, data, addr):
-        self._logger.debug("received datagram from %s", addr)
+        self._hot_log.debug("received datagram from %s", addr)
+        self.rx_packets += 1
+        self.rx_bytes += len(data)
         asyncio.ensure_future(self._solve_datagram(data, addr))
 
     async def _solve_datagram(self, datagram, address):
         if len(datagram) < 22:
-            self._logger.warning("received datagram too small from %s,"
+            self._hot_log.warning("received datagram too small from %s,"
                         " ignoring", address)
             return
 
@@ -174,19 +224,20 @@ class RPCProtocol(asyncio.DatagramProtocol):
             asyncio.ensure_future(self._accept_request2(msg_id, data, address))
         else:
             # don't do anything
-            self._logger.debug("Received unknown message from %s, ignoring", address)
+            self._hot_log.debug("Received unknown message from %s, ignoring", address)
 
     def _accept_response(self, msg_id, data, address):
-        msgargs = (b64encode(msg_id), address)
         if msg_id not in self._outstanding:
-            self._logger.warning("received unknown message %s "
-                        "from %s; ignoring", *msgargs)
+            self._hot_log.warning("received unknown message %s "
+                        "from %s; ignoring", b64encode(msg_id), address)
             return
-        self._logger.debug("received response %s for message "
-                  "id %s from %s", data, *msgargs)
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._hot_log.debug("received response %s for message "
+                      "id %s from %s", data, b64encode(msg_id), address)
         future, timeout = self._outstanding[msg_id]
         timeout.cancel()
-        future.set_result((True, data))
+        if not future.done():  # the caller may have been cancelled
+            future.set_result((True, data))
         del self._outstanding[msg_id]
 
     async def _accept_request(self, msg_id, data, address):
@@ -196,16 +247,16 @@ class RPCProtocol(asyncio.DatagramProtocol):
         func = getattr(self, "rpc_%s" % funcname, None)
         if func is None or not callable(func):
             msgargs = (self.__class__.__name__, funcname)
-            self._logger.warning("%s has no callable method "
+            self._hot_log.warning("%s has no callable method "
                         "rpc_%s; ignoring request", *msgargs)
             return
 
-        if not asyncio.iscoroutinefunction(func):
-            func = asyncio.coroutine(func)
-        response = await func(address, *args)
-        self._logger.debug("sending response %s for msg id %s to %s",
-                  response, b64encode(msg_id), address)
+        response = await self._call(funcname, func, address, args)
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._hot_log.debug("sending response %s for msg id %s to %s",
+                      response, b64encode(msg_id), address)
         txdata = b'\x01' + msg_id + umsgpack.packb(response)
+        self._count_tx(txdata)
         self._endpoint.send(txdata, address)
 
     async def _accept_request2(self, msg_id, data, address):
@@ -216,19 +267,19 @@ class RPCProtocol(asyncio.DatagramProtocol):
         func = getattr(self, "rpc_%s" % funcname, None)
         if func is None or not callable(func):
             msgargs = (self.__class__.__name__, funcname)
-            self._logger.warning("%s has no callable method "
+            self._hot_log.warning("%s has no callable method "
                         "rpc_%s; ignoring request", *msgargs)
             return
 
-        if not asyncio.iscoroutinefunction(func):
-            func = asyncio.coroutine(func)
-        response = await func(address, *args)
+        response = await self._call(funcname, func, address, args)
 
     def _timeout(self, msg_id):
         args = (b64encode(msg_id), self._wait_timeout)
         self._logger.error("Did not received reply for msg "
                   "id %s within %i seconds", *args)
-        self._outstanding[msg_id][0].set_result((False, None))
+        future = self._outstanding[msg_id][0]
+        if not future.done():
+            future.set_result((False, None))
         del self._outstanding[msg_id]
 
     def __getattr__(self, name):
@@ -260,15 +311,17 @@ class RPCProtocol(asyncio.DatagramProtocol):
                 func_type = 0x00
             msg_id = sha1(os.urandom(32)).digest()
             data = umsgpack.packb([name, args])
-            if len(data) > 8192:
+            if len(data) > MAX_MESSAGE_SIZE:
                 raise MalformedMessage("Total length of function "
-                                       "name and arguments cannot exceed 8K")
+                                       "name and arguments cannot exceed %d" % MAX_MESSAGE_SIZE)
             if func_type == 0x02:
                 txdata = b'\x02' + msg_id + data
             else:
                 txdata = b'\x00' + msg_id + data
-            self._logger.debug("calling remote function %s on %s (msgid %s)",
-                      name, address, b64encode(msg_id))
+            if self._logger.isEnabledFor(logging.DEBUG):
+                self._hot_log.debug("calling remote function %s on %s (msgid %s)",
+                          name, address, b64encode(msg_id))
+            self._count_tx(txdata)
             self._endpoint.send(txdata)
 
             if func_type != 0x02:
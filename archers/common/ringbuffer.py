@@ -0,0 +1,144 @@
+import time
+
+# Overflow policies
+DROP_OLDEST = 1  # overwrite the oldest item (the consumer skips it)
+DROP_NEWEST = 2  # refuse the new item
+BLOCK = 3        # wait until the consumer makes room
+
+
+class RingBufferFull(Exception):
+    pass
+
+
+class RingBuffer:
+    """
+    Preallocated single-producer/single-consumer ring buffer.
+
+    One thread appends, one thread pops, neither takes a lock. The producer
+    owns the tail index, the consumer owns the head index and each slot is
+    tagged with the sequence number of the item it holds (written last by
+    the producer), so the consumer can tell when a slot has been
+    overwritten under DROP_OLDEST while it was reading it.
+
+    Indexing, iteration and len() follow the deque interface used so far:
+    index 0 is the oldest item still available, -1 the newest.
+    """
+
+    __slots__ = ['_capacity', '_items', '_seqs', '_head', '_tail',
+                 'policy', 'block_timeout', 'dropped', 'high_water']
+
+    def __init__(self, capacity, policy=DROP_OLDEST, block_timeout=None):
+        if capacity <= 0:
+            raise ValueError('capacity must be a positive integer')
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError('unknown overflow policy %r' % policy)
+        self._capacity = capacity
+        self._items = [None] * capacity
+        self._seqs = [-1] * capacity
+        self._head = 0  # consumer
+        self._tail = 0  # producer
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.high_water = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    # producer side
+
+    def append(self, item):
+        """Returns False if the item was dropped (DROP_NEWEST)."""
+        tail = self._tail
+        cap = self._capacity
+        if tail - self._head >= cap:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return False
+            elif self.policy == BLOCK:
+                self._wait_for_room(tail)
+            else:
+                self.dropped += 1
+        i = tail % cap
+        self._seqs[i] = -1
+        self._items[i] = item
+        self._seqs[i] = tail
+        self._tail = tail + 1
+        used = tail + 1 - self._head
+        if used > self.high_water:
+            self.high_water = min(used, cap)
+        return True
+
+    def _wait_for_room(self, tail):
+        deadline = None
+        if self.block_timeout is not None:
+            deadline = time.perf_counter() + self.block_timeout
+        while tail - self._head >= self._capacity:
+            if deadline is not None and time.perf_counter() > deadline:
+                raise RingBufferFull('consumer did not make room in %.3fs' % self.block_timeout)
+            time.sleep(0.0005)
+
+    # consumer side
+
+    def popleft(self):
+        while True:
+            tail = self._tail
+            head = self._head
+            if head >= tail:
+                raise IndexError('pop from an empty RingBuffer')
+            if tail - head > self._capacity:
+                # overrun by the producer (DROP_OLDEST)
+                head = tail - self._capacity
+            i = head % self._capacity
+            item = self._items[i]
+            if self._seqs[i] != head:
+                # overwritten while reading, skip ahead
+                self._head = head + 1
+                continue
+            self._head = head + 1
+            return item
+
+    def clear(self):
+        self._head = self._tail
+
+    # read-only access, safe from the consumer thread
+
+    def __len__(self):
+        return min(self._tail - self._head, self._capacity)
+
+    def __bool__(self):
+        return self._tail > self._head
+
+    def __getitem__(self, idx):
+        tail = self._tail
+        head = max(self._head, tail - self._capacity)
+        n = tail - head
+        if idx < 0:
+            idx += n
+        if idx < 0 or idx >= n:
+            raise IndexError('RingBuffer index out of range')
+        seq = head + idx
+        i = seq % self._capacity
+        item = self._items[i]
+        if self._seqs[i] != seq:
+            # overwritten meanwhile, the newest value is as good
+            return self.__getitem__(-1)
+        return item
+
+    def __iter__(self):
+        tail = self._tail
+        head = max(self._head, tail - self._capacity)
+        for seq in range(head, tail):
+            i = seq % self._capacity
+            item = self._items[i]
+            if self._seqs[i] == seq:
+                yield item
+
+    def stats(self):
+        return {'len': len(self), 'capacity': self._capacity,
+                'dropped': self.dropped, 'high_water': self.high_water}
+
+    def __repr__(self):
+        return 'RingBuffer(%r, capacity=%d, dropped=%d, high_water=%d)' % (
+            list(self), self._capacity, self.dropped, self.high_water)
@@ -0,0 +1,143 @@
+"""
+Process-wide texture registry: every texture and sprite sheet is loaded
+once and shared by all the sprites using it.
+"""
+import threading
+import logging
+from pathlib import Path
+import arcade
+from common.helpers import getSpriteFromSpriteSheet
+from common.helpers import FACE_RIGHT, FACE_LEFT, FACE_UP, FACE_DOWN
+
+LOG = logging.getLogger(__name__)
+
+PLAYER_SHEET = 'playercharacter.png'
+PLAYER_FRAME_SIZE = 64
+ARROW = 'arrow.png'
+
+# Player animations, PlayerTextures.sequences is keyed by (animation, facing)
+ANIM_STAND = 0
+ANIM_WALK = 1
+ANIM_TAKE_BOW = 2
+ANIM_FIRE_BOW = 3
+
+_textures = {}  # filename -> arcade.Texture
+_sheets = {}  # (filename, width, height) -> [arcade.Texture]
+_player_textures = {}  # picsdir -> PlayerTextures
+_lock = threading.RLock()
+
+
+def get_texture(filename):
+    key = str(filename)
+    texture = _textures.get(key)
+    if texture is None:
+        with _lock:
+            texture = _textures.get(key)
+            if texture is None:
+                texture = arcade.load_texture(key)
+                _textures[key] = texture
+    return texture
+
+
+def get_sprite_sheet(filename, width, height):
+    key = (str(filename), width, height)
+    frames = _sheets.get(key)
+    if frames is None:
+        with _lock:
+            frames = _sheets.get(key)
+            if frames is None:
+                frames = getSpriteFromSpriteSheet(filename, width=width, height=height)
+                _sheets[key] = frames
+    return frames
+
+
+class PlayerTextures:
+    """Frame tables of the player character sprite sheet"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        # stand right = 15, stand left = 5
+        self.stand_right = [frames[15]]
+        self.stand_left = [frames[5]]
+        # walk up, left, down, right
+        self.walk_up = frames[60:65]
+        self.walk_left = frames[65:70]
+        self.walk_down = frames[70:75]
+        self.walk_right = frames[75:80]
+        # stand take bow
+        self.stand_up_take_bow = frames[120:125]
+        self.stand_left_take_bow = frames[125:130]
+        self.stand_down_take_bow = frames[130:135]
+        self.stand_right_take_bow = frames[135:140]
+        # stand fire bow
+        self.stand_up_fire_bow = frames[140:145]
+        self.stand_left_fire_bow = frames[145:150]
+        self.stand_down_fire_bow = frames[150:155]
+        self.stand_right_fire_bow = frames[155:160]
+
+        self.stand = {
+            FACE_LEFT: self.stand_left[0],
+            FACE_RIGHT: self.stand_right[0],
+            FACE_UP: self.walk_up[0],
+            FACE_DOWN: self.walk_down[0]
+        }
+        self.walk = {
+            FACE_LEFT: self.walk_left,
+            FACE_RIGHT: self.walk_right,
+            FACE_UP: self.walk_up,
+            FACE_DOWN: self.walk_down
+        }
+        self.take_bow = {
+            FACE_LEFT: self.stand_left_take_bow,
+            FACE_RIGHT: self.stand_right_take_bow,
+            FACE_UP: self.stand_up_take_bow,
+            FACE_DOWN: self.stand_down_take_bow
+        }
+        self.fire_bow = {
+            FACE_LEFT: self.stand_left_fire_bow,
+            FACE_RIGHT: self.stand_right_fire_bow,
+            FACE_UP: self.stand_up_fire_bow,
+            FACE_DOWN: self.stand_down_fire_bow
+        }
+        # (animation, facing) -> frame sequence
+        self.sequences = {}
+        for anim, table in ((ANIM_WALK, self.walk), (ANIM_TAKE_BOW, self.take_bow),
+                            (ANIM_FIRE_BOW, self.fire_bow)):
+            for facing, seq in table.items():
+                self.sequences[anim, facing] = tuple(seq)
+        for facing, texture in self.stand.items():
+            self.sequences[ANIM_STAND, facing] = (texture,)
+
+
+def get_player_textures(picsdir):
+    key = str(picsdir)
+    textures = _player_textures.get(key)
+    if textures is None:
+        with _lock:
+            textures = _player_textures.get(key)
+            if textures is None:
+                frames = get_sprite_sheet(Path(picsdir) / PLAYER_SHEET,
+                                          PLAYER_FRAME_SIZE, PLAYER_FRAME_SIZE)
+                textures = PlayerTextures(frames)
+                _player_textures[key] = textures
+    return textures
+
+
+def _preload(picsdir):
+    get_player_textures(picsdir)
+    get_texture(Path(picsdir) / ARROW)
+    LOG.debug('textures preloaded from %s', picsdir)
+
+
+def preload(picsdir, background=True):
+    """
+    Load all the game textures. With background=True this runs in a thread
+    and returns it; a sprite asking for a texture meanwhile waits for it on
+    the registry lock instead of loading it a second time.
+    """
+    if not background:
+        _preload(picsdir)
+        return None
+    thread = threading.Thread(target=_preload, args=(picsdir,), daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,164 @@
+"""
+Sampled end-to-end latency traces of the player inputs, from the key press
+to the first frame drawn with the position the server computed for it.
+
+Stages, each on the monotonic clock (time.perf_counter) of its side:
+
+    key          ArcadeGame queues the input, a sampled one gets a trace id
+    sent         set_player_state sends it, with the trace id
+    srv_recv     rpc_ff_set_player_state queues it on the server
+    srv_update   the ServerState.update() applying it moves the player
+    srv_publish  publish_game_state sends the snapshot, then the server
+                 stage durations to the client (ff_trace)
+    recv         set_own_state finds the input acknowledged in a snapshot
+    update       on_update applies the first correction queued after recv
+                 to the local sprite
+    drawn        the next on_draw
+
+The client Tracer writes the completed traces as JSON lines, tracereport.py
+breaks them down per stage.
+"""
+import json
+import random
+import threading
+import time
+
+TRACE_SAMPLE = 0.1   # fraction of the inputs traced
+TRACE_TIMEOUT = 5.0  # forget the traces not completed by then (lost input)
+
+KEY = 'key'
+SENT = 'sent'
+RECV = 'recv'
+UPDATE = 'update'
+DRAWN = 'drawn'
+CLIENT_STAGES = (KEY, SENT, RECV, UPDATE, DRAWN)
+
+# name, description, in report order
+INTERVALS = (
+    ('input_queue', 'key press -> sent'),
+    ('network', 'both ways on the wire and in the socket queues'),
+    ('server_tick', 'server queued -> applied by update()'),
+    ('server_publish', 'applied -> snapshot sent'),
+    ('client_recv', 'snapshot received -> correction applied to the sprite'),
+    ('render', 'on_update -> on_draw'),
+    ('total', 'key press -> drawn (received for headless clients)'),
+)
+
+
+def breakdown(record):
+    """Durations (ms) of the INTERVALS of a trace record, the ones it has"""
+    s = record['stages_ms']
+    srv_tick, srv_publish = record['server_ms']
+    res = {'input_queue': s[SENT] - s[KEY],
+           'network': s[RECV] - s[SENT] - srv_tick - srv_publish,
+           'server_tick': srv_tick,
+           'server_publish': srv_publish}
+    if UPDATE in s:
+        res['client_recv'] = s[UPDATE] - s[RECV]
+    if DRAWN in s:
+        res['render'] = s[DRAWN] - s[UPDATE]
+    res['total'] = s[DRAWN if DRAWN in s else RECV] - s[KEY]
+    return res
+
+
+class Tracer:
+    """
+    Client side traces in flight. start() is called by the thread queuing
+    the inputs, sent()/acked()/server() by the network thread and frame()
+    by the render thread, hence the lock. Only the sampled inputs take it.
+
+    output: text file the completed traces are written to, may be shared.
+    render: False for headless clients, the traces end at RECV.
+    """
+
+    def __init__(self, output=None, sample=TRACE_SAMPLE, render=True, player_id=None, seed=None):
+        self.output = output
+        self.sample = sample
+        self.render = render
+        self.player_id = player_id
+        self.rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._traces = {}    # trace id -> {stage: perf_counter()}
+        self._unacked = []   # (seq, trace id) in sending order
+        self.active = 0      # traces in flight
+        self.completed = 0
+        self.timed_out = 0
+
+    @property
+    def waiting(self):
+        """True while a traced input waits for its acknowledgement"""
+        return bool(self._unacked)
+
+    def start(self):
+        """Returns the trace id of a new input, or None if it isn't sampled"""
+        if self.rnd.random() >= self.sample:
+            return None
+        now = time.perf_counter()
+        trace_id = self.rnd.getrandbits(31)
+        with self._lock:
+            self._expire(now)
+            self._traces[trace_id] = {KEY: now}
+            self.active = len(self._traces)
+        return trace_id
+
+    def sent(self, trace_id, seq):
+        now = time.perf_counter()
+        with self._lock:
+            rec = self._traces.get(trace_id)
+            if rec is not None:
+                rec[SENT] = now
+                rec['seq'] = seq
+                self._unacked.append((seq, trace_id))
+
+    def acked(self, seq):
+        """The server has applied the inputs up to seq"""
+        now = time.perf_counter()
+        with self._lock:
+            unacked = self._unacked
+            while unacked and unacked[0][0] <= seq:
+                _, trace_id = unacked.pop(0)
+                rec = self._traces.get(trace_id)
+                if rec is not None:
+                    rec[RECV] = now
+                    self._complete(trace_id, rec)
+
+    def server(self, trace_id, durations):
+        """Server stage durations (s): received -> update, update -> publish"""
+        with self._lock:
+            rec = self._traces.get(trace_id)
+            if rec is not None:
+                rec['server'] = durations
+                self._complete(trace_id, rec)
+
+    def frame(self, done, stage, before=None):
+        """Marks stage on the traces which went through done, if before
+        (perf_counter time) is given only on the ones which did so before"""
+        now = time.perf_counter()
+        with self._lock:
+            for trace_id, rec in list(self._traces.items()):
+                if done in rec and stage not in rec and (before is None or rec[done] <= before):
+                    rec[stage] = now
+                    self._complete(trace_id, rec)
+
+    def _complete(self, trace_id, rec):
+        if (DRAWN if self.render else RECV) not in rec or 'server' not in rec:
+            return
+        del self._traces[trace_id]
+        self.active = len(self._traces)
+        self.completed += 1
+        if self.output is None:
+            return
+        t0 = rec[KEY]
+        record = {'trace': trace_id, 'player': self.player_id, 'seq': rec.get('seq'),
+                  'stages_ms': {s: (rec[s] - t0) * 1000 for s in CLIENT_STAGES if s in rec},
+                  'server_ms': [d * 1000 for d in rec['server']]}
+        self.output.write(json.dumps(record) + '\n')
+
+    def _expire(self, now):
+        for trace_id, rec in list(self._traces.items()):
+            if now - rec[KEY] > TRACE_TIMEOUT:
+                del self._traces[trace_id]
+                self.timed_out += 1
+        unacked = [(seq, t) for seq, t in self._unacked if t in self._traces]
+        if len(unacked) != len(self._unacked):
+            self._unacked = unacked
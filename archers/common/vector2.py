@@ -1,12 +1,30 @@
 import math
 import operator
+from array import array
+
+np = None  # numpy, imported by the first Vector2Array which uses it
+
+
+def _numpy():
+    # Vector2 is imported by the server and the bots, which don't need numpy
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
 
 class Vector2(object):
 
     __slots__ = ['x', 'y']
 
     def __init__(self, x, y=None):
-        if isinstance(x, tuple) or isinstance(x, list):
+        if y is not None:
+            self.x = x
+            self.y = y
+        elif isinstance(x, tuple) or isinstance(x, list):
             self.x = x[0]
             self.y = x[1]
         elif isinstance(x, Vector2):
@@ -56,17 +74,27 @@ class Vector2(object):
     def is_nonzero(self):
         return self.x != 0.0 or self.y != 0.0
 
+    # Operators take the scalar and Vector2 paths before falling back to
+    # duck typing, and build their result with _vec() which skips __init__.
+
     def __add__(self, other):
-        if isinstance(other, Vector2):
-            return Vector2(self.x + other.x, self.y + other.y)
+        cls = other.__class__
+        if cls is float or cls is int:
+            return _vec(self.x + other, self.y + other)
+        if cls is Vector2:
+            return _vec(self.x + other.x, self.y + other.y)
         elif hasattr(other, "__getitem__"):
-            return Vector2(self.x + other[0], self.y + other[1])
+            return _vec(self.x + other[0], self.y + other[1])
         else:
-            return Vector2(self.x + other, self.y + other)
+            return _vec(self.x + other, self.y + other)
     __radd__ = __add__
 
     def __iadd__(self, other):
-        if isinstance(other, Vector2):
+        cls = other.__class__
+        if cls is float or cls is int:
+            self.x += other
+            self.y += other
+        elif cls is Vector2:
             self.x += other.x
             self.y += other.y
         elif hasattr(other, "__getitem__"):
@@ -78,21 +106,31 @@ class Vector2(object):
         return self
 
     def __sub__(self, other):
-        if isinstance(other, Vector2):
-            return Vector2(self.x - other.x, self.y - other.y)
+        cls = other.__class__
+        if cls is float or cls is int:
+            return _vec(self.x - other, self.y - other)
+        if cls is Vector2:
+            return _vec(self.x - other.x, self.y - other.y)
         elif (hasattr(other, "__getitem__")):
-            return Vector2(self.x - other[0], self.y - other[1])
+            return _vec(self.x - other[0], self.y - other[1])
         else:
-            return Vector2(self.x - other, self.y - other)
+            return _vec(self.x - other, self.y - other)
     def __rsub__(self, other):
-        if isinstance(other, Vector2):
-            return Vector2(other.x - self.x, other.y - self.y)
+        cls = other.__class__
+        if cls is float or cls is int:
+            return _vec(other - self.x, other - self.y)
+        if cls is Vector2:
+            return _vec(other.x - self.x, other.y - self.y)
         if (hasattr(other, "__getitem__")):
-            return Vector2(other[0] - self.x, other[1] - self.y)
+            return _vec(other[0] - self.x, other[1] - self.y)
         else:
-            return Vector2(other - self.x, other - self.y)
+            return _vec(other - self.x, other - self.y)
     def __isub__(self, other):
-        if isinstance(other, Vector2):
+        cls = other.__class__
+        if cls is float or cls is int:
+            self.x -= other
+            self.y -= other
+        elif cls is Vector2:
             self.x -= other.x
             self.y -= other.y
         elif (hasattr(other, "__getitem__")):
@@ -104,16 +142,23 @@ class Vector2(object):
         return self
 
     def __mul__(self, other):
-        if isinstance(other, Vector2):
-            return Vector2(self.x*other.x, self.y*other.y)
+        cls = other.__class__
+        if cls is float or cls is int:
+            return _vec(self.x*other, self.y*other)
+        if cls is Vector2:
+            return _vec(self.x*other.x, self.y*other.y)
         if (hasattr(other, "__getitem__")):
-            return Vector2(self.x*other[0], self.y*other[1])
+            return _vec(self.x*other[0], self.y*other[1])
         else:
-            return Vector2(self.x*other, self.y*other)
+            return _vec(self.x*other, self.y*other)
     __rmul__ = __mul__
 
     def __imul__(self, other):
-        if isinstance(other, Vector2):
+        cls = other.__class__
+        if cls is float or cls is int:
+            self.x *= other
+            self.y *= other
+        elif cls is Vector2:
             self.x *= other.x
             self.y *= other.y
         elif (hasattr(other, "__getitem__")):
@@ -124,17 +169,68 @@ class Vector2(object):
             self.y *= other
         return self
 
+    # In-place variants, no allocation
+
+    def set(self, x, y):
+        self.x = x
+        self.y = y
+        return self
+
+    def add_xy(self, x, y):
+        self.x += x
+        self.y += y
+        return self
+
+    def sub_xy(self, x, y):
+        self.x -= x
+        self.y -= y
+        return self
+
+    def scale(self, value):
+        self.x *= value
+        self.y *= value
+        return self
+
+    def lerp(self, other, range):
+        # in-place get_interpolated_to
+        self.x += (other[0] - self.x)*range
+        self.y += (other[1] - self.y)*range
+        return self
+
+    # Out-parameter variants: the result goes in out (a Vector2) if given,
+    # in a new Vector2 otherwise
+
+    def get_sum(self, other, out=None):
+        if out is None:
+            return _vec(self.x + other[0], self.y + other[1])
+        out.x = self.x + other[0]
+        out.y = self.y + other[1]
+        return out
+
+    def get_difference(self, other, out=None):
+        if out is None:
+            return _vec(self.x - other[0], self.y - other[1])
+        out.x = self.x - other[0]
+        out.y = self.y - other[1]
+        return out
+
+    def get_scaled(self, value, out=None):
+        if out is None:
+            return _vec(self.x*value, self.y*value)
+        out.x = self.x*value
+        out.y = self.y*value
+        return out
+
     def __floordiv__(self, other):
         raise
 
     def __truediv__(self, other):
         # check if other is of type Vector2
         if isinstance(other, Vector2):
-            return Vector2(operator.truediv(self.x, other.x),
+            return _vec(operator.truediv(self.x, other.x),
                          operator.truediv(self.y, other.y))
         # must be a float
-        return Vector2(operator.truediv(self.x, other),
-                         operator.truediv(self.y, other))
+        return _vec(self.x / other, self.y / other)
 
     def __abs__(self):
         return Vector2(abs(self.x), abs(self.y))
@@ -143,10 +239,10 @@ class Vector2(object):
         return Vector2(-self.x, -self.y)
 
     def get_length_sqrd(self):
-        return self.x**2 + self.y**2
+        return self.x*self.x + self.y*self.y
 
     def get_length(self):
-        return math.sqrt(self.x**2 + self.y**2)
+        return math.sqrt(self.x*self.x + self.y*self.y)
 
     def __setlength(self, value):
         length = self.get_length()
@@ -226,7 +322,9 @@ class Vector2(object):
         return float(self.x*other[0] + self.y*other[1])
 
     def get_distance(self, other):
-        return math.sqrt((self.x - other[0])**2 + (self.y - other[1])**2)
+        dx = self.x - other[0]
+        dy = self.y - other[1]
+        return math.sqrt(dx*dx + dy*dy)
 
     def get_dist_sqrd(self, other):
         return (self.x - other[0])**2 + (self.y - other[1])**2
@@ -234,8 +332,14 @@ class Vector2(object):
     def cross(self, other):
         return self.x*other[1] - self.y*other[0]
 
-    def get_interpolated_to(self, other, range):
-        return Vector2(self.x + (other[0] - self.x)*range, self.y + (other[1] - self.y)*range)
+    def get_interpolated_to(self, other, range, out=None):
+        x = self.x + (other[0] - self.x)*range
+        y = self.y + (other[1] - self.y)*range
+        if out is None:
+            return _vec(x, y)
+        out.x = x
+        out.y = y
+        return out
 
     def get_converted_to_basis(self, x_vector, y_vector):
         x = self.dot(x_vector)/x_vector.get_length_sqrd()
@@ -255,6 +359,156 @@ class Vector2(object):
     as_list = property(__get_list_xy)
 
 
+_new = object.__new__
+
+
+def _vec(x, y):
+    # Vector2(x, y) without going through __init__
+    v = _new(Vector2)
+    v.x = x
+    v.y = y
+    return v
+
+
+class Vector2Array(object):
+    """
+    Packed array of 2D vectors for bulk operations, stored in one
+    contiguous buffer: a (n, 2) float64 NumPy array when numpy is available
+    (use_numpy=None), an array('d') of x0, y0, x1, y1... otherwise.
+
+    Operations take another Vector2Array of the same length, a single
+    (x, y) or a scalar, and work in place unless out is given.
+    """
+
+    __slots__ = ['data', '_np']
+
+    def __init__(self, values=(), use_numpy=None):
+        if use_numpy is None:
+            use_numpy = _numpy() is not None
+        elif use_numpy and _numpy() is None:
+            raise ImportError('Vector2Array(use_numpy=True) needs numpy')
+        self._np = use_numpy
+        if use_numpy:
+            self.data = np.array([tuple(v) for v in values], dtype=float).reshape(-1, 2)
+        else:
+            self.data = array('d')
+            for v in values:
+                self.data.append(v[0])
+                self.data.append(v[1])
+
+    @classmethod
+    def zeros(cls, n, use_numpy=None):
+        res = cls(use_numpy=use_numpy)
+        if res._np:
+            res.data = np.zeros((n, 2))
+        else:
+            res.data = array('d', bytes(16 * n))
+        return res
+
+    def copy(self):
+        res = Vector2Array(use_numpy=self._np)
+        res.data = self.data.copy() if self._np else array('d', self.data)
+        return res
+
+    def __len__(self):
+        return len(self.data) if self._np else len(self.data) // 2
+
+    def __getitem__(self, i):
+        if self._np:
+            x, y = self.data[i]
+            return Vector2(float(x), float(y))
+        if i < 0:
+            i += len(self)
+        return Vector2(self.data[2*i], self.data[2*i + 1])
+
+    def __setitem__(self, i, value):
+        if self._np:
+            self.data[i] = (value[0], value[1])
+            return
+        if i < 0:
+            i += len(self)
+        self.data[2*i] = value[0]
+        self.data[2*i + 1] = value[1]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _operand(self, other):
+        # other as something that broadcasts against data
+        if isinstance(other, Vector2Array):
+            return other.data
+        if hasattr(other, "__getitem__"):
+            return other[0], other[1]
+        return other
+
+    def _out(self, out):
+        if out is None:
+            return self
+        if len(out) != len(self):
+            raise ValueError('out must have the same length')
+        return out
+
+    def _apply(self, other, op, out):
+        out = self._out(out)
+        if self._np:
+            getattr(np, op)(self.data, self._operand(other), out=out.data)
+            return out
+        a = self.data
+        o = out.data
+        pyop = getattr(operator, op)
+        if isinstance(other, Vector2Array):
+            b = other.data
+            for i in range(len(a)):
+                o[i] = pyop(a[i], b[i])
+        else:
+            if hasattr(other, "__getitem__"):
+                bx, by = other[0], other[1]
+            else:
+                bx = by = other
+            for i in range(0, len(a), 2):
+                o[i] = pyop(a[i], bx)
+                o[i + 1] = pyop(a[i + 1], by)
+        return out
+
+    def add(self, other, out=None):
+        return self._apply(other, 'add', out)
+
+    def sub(self, other, out=None):
+        return self._apply(other, 'subtract' if self._np else 'sub', out)
+
+    def scale(self, value, out=None):
+        return self._apply(value, 'multiply' if self._np else 'mul', out)
+
+    def lerp(self, other, t, out=None):
+        # self + (other - self) * t
+        out = self._out(out)
+        if self._np:
+            b = self._operand(other)
+            tmp = np.subtract(b, self.data)
+            tmp *= t
+            np.add(self.data, tmp, out=out.data)
+            return out
+        a = self.data
+        o = out.data
+        if isinstance(other, Vector2Array):
+            b = other.data
+            for i in range(len(a)):
+                o[i] = a[i] + (b[i] - a[i])*t
+        else:
+            bx, by = other[0], other[1]
+            for i in range(0, len(a), 2):
+                o[i] = a[i] + (bx - a[i])*t
+                o[i + 1] = a[i + 1] + (by - a[i + 1])*t
+        return out
+
+    def lengths(self):
+        if self._np:
+            return np.sqrt(np.einsum('ij,ij->i', self.data, self.data))
+        a = self.data
+        return [math.sqrt(a[i]*a[i] + a[i + 1]*a[i + 1]) for i in range(0, len(a), 2)]
+
+
 
 if __name__ == "__main__":
     # init w single tuple
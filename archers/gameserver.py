@@ -4,14 +4,17 @@ import asyncio
 import time
 import random
 from common.protocol import EndpointHelper, RPCProtocol
-from common.helpers import MOVE_MAP, apply_movement, MeasureDuration
+from common.core import MOVE_MAP, apply_movement, mask_to_keys, MeasureDuration
 from common.vector2 import Vector2
-from common.datacls import PlayerData, GameData, Event, ProjectileData
-from dataclasses import asdict
+from common.datacls import PlayerData, GameData, Event, ProjectileData, INPUT_HISTORY_SIZE
 from collections import deque
-from common.helpers import TOPIC_NEWPLAYER, PROJECTILE
+from common.core import TOPIC_NEWPLAYER, PROJECTILE, SERVER_PORT
+from common import inputlog, logsetup, metrics
+from common.profiler import PROFILER
 
 LOG = logging.getLogger('gameserver')
+# per packet logs
+HOT_LOG = logsetup.HotLog(LOG)
 
 #LOGLEVEL = logging.INFO
 #LOGLEVEL = logging.DEBUG
@@ -23,6 +26,23 @@ SERVER_TICKRATE = 1/60
 WWIDTH = 800
 WHEIGHT = 600
 
+# localhost HTTP port of the metrics (see common.metrics)
+STATS_PORT = 1280
+
+# Events published per tick, whichever limit is hit first
+EVENTS_PER_TICK = 64
+EVENTS_BUDGET_S = 0.004
+
+# Inputs of a player queued for update(), which applies one per tick; the
+# inputs beyond this are applied together in the same tick
+INPUT_QUEUE_MAX = INPUT_HISTORY_SIZE * 2
+
+Z_TICK = PROFILER.zone('tick')
+Z_PUBLISH = PROFILER.zone('publish')
+Z_ENCODE = PROFILER.zone('encode')
+Z_SEND = PROFILER.zone('send')
+Z_EVENTS = PROFILER.zone('events')
+
 class PlayerClientInfo:
     def __init__(self, playerid, addr, endpoint=None, protocol=None):
         self.playerid = playerid
@@ -32,6 +52,11 @@ class PlayerClientInfo:
         self.endpoint = endpoint
         self.protocol = protocol
         self.ready = False
+        # address the client sends its requests from
+        self.sender = None
+        # clock sync estimates reported by the client
+        self.rtt = None
+        self.clock_offset = None
 
 
 
@@ -41,6 +66,16 @@ class RPCServerProtocol(RPCProtocol):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._count = 0
+        # address -> [datagrams, bytes] received from it
+        self.rx_by_addr = {}
+
+    def datagram_received(self, data, addr):
+        counts = self.rx_by_addr.get(addr)
+        if counts is None:
+            counts = self.rx_by_addr[addr] = [0, 0]
+        counts[0] += 1
+        counts[1] += len(data)
+        super().datagram_received(data, addr)
 
     @classmethod
     def set_server_state(cls, value):
@@ -50,45 +85,94 @@ class RPCServerProtocol(RPCProtocol):
         else:
             raise
 
-    def rpc_ff_set_player_state(self, sender, player_state):
+    def _record(self, kind, now, sender, *args):
+        recorder = self.gs_state.server_state.recorder
+        if recorder is not None:
+            recorder.record(kind, self.gs_state.game_state.tick, now, [list(sender), *args])
+
+    def rpc_ff_set_player_state(self, sender, player_state, history=None, trace_id=None):
+        # history: [seq, key mask] of the inputs before this one the client
+        # hasn't seen acknowledged yet, oldest first, in case they were lost
         if self.gs_state is None:
             raise
+        now = time.time()
+        if history:
+            self._record(inputlog.SET_PLAYER_STATE, now, sender, player_state, history)
+        else:
+            self._record(inputlog.SET_PLAYER_STATE, now, sender, player_state)
         self._count += 1
         if (self._count > 1000):
             self._count = 0
-        LOG.info("RPCServer received: [%s], from %s:%i" % (player_state, sender[0], sender[1]))
-        _, p = self.gs_state.game_state.get_player_from_id(player_state['id'])
-        p.keys_pressed = player_state['keys_pressed'].copy()
-        p.speed = player_state['speed']
-        self.gs_state.game_state.updated_at = time.time()
+        HOT_LOG.info("RPCServer received: [%s], from %s:%i", player_state, *sender)
+        player_state = PlayerData.from_wire(player_state)
+        _, p = self.gs_state.game_state.get_player_from_id(player_state.id)
+        if p is None:
+            # late input from a player who already left
+            self.gs_state.server_state.metrics.counter('late_inputs').inc()
+            return
+        server_state = self.gs_state.server_state
+        # queued for update(), acknowledged in the snapshots once applied
+        inputs = server_state.pending_inputs.get(p.id)
+        last = inputs[-1][0] if inputs else p.seq
+        seq = player_state.seq
+        if seq <= last:
+            # a resend, or overtaken by a later input
+            server_state.metrics.counter('duplicate_inputs').inc()
+            return
+        if inputs is None:
+            inputs = server_state.pending_inputs[p.id] = deque()
+        if history:
+            for hseq, mask in history:
+                if last < hseq < seq:
+                    if hseq > last + 1:
+                        # lost along with all the packets carrying them
+                        server_state.metrics.counter('lost_inputs').inc(hseq - last - 1)
+                    inputs.append((hseq, mask_to_keys(mask)))
+                    server_state.metrics.counter('recovered_inputs').inc()
+                    last = hseq
+        if seq > last + 1:
+            server_state.metrics.counter('lost_inputs').inc(seq - last - 1)
+        inputs.append((seq, player_state.keys_pressed))
+        p.speed = player_state.speed
+        self.gs_state.game_state.updated_at = now
+        if trace_id is not None:
+            # sampled input, see common.tracing
+            server_state.traces.append([p.id, trace_id, time.perf_counter(), None, seq])
         return
 
     def rpc_create_player(self, sender, player_id, player_port):
         if self.gs_state is None:
             raise
-        LOG.info("RPCServer received: [%s], from %s:%i" % (player_id, sender[0], sender[1]))
+        now = time.time()
+        self._record(inputlog.CREATE_PLAYER, now, sender, player_id, player_port)
+        LOG.info("RPCServer received: [%s], from %s:%i", player_id, *sender)
         _player_remote_addr = (sender[0], player_port)
         p = PlayerClientInfo(player_id, _player_remote_addr)
+        p.sender = sender
         self.gs_state.server_state.remotes.append(p)
-        rand_pos = [random.randint(100, WWIDTH), random.randint(100, WHEIGHT)]
-        player = PlayerData(id=player_id, ts=time.time(), position=rand_pos, keys_pressed={}, speed=0)
+        rnd = self.gs_state.server_state.rnd
+        rand_pos = [rnd.randint(100, WWIDTH), rnd.randint(100, WHEIGHT)]
+        player = PlayerData(id=player_id, ts=now, position=rand_pos, keys_pressed={}, speed=0)
         self.gs_state.game_state.players.append(player)
-        LOG.info('nb players = %d' % len(self.gs_state.game_state.players))
+        LOG.info('nb players = %d', len(self.gs_state.game_state.players))
 
-        self.gs_state.server_state.eventq.append(Event(self._count, time.time(), TOPIC_NEWPLAYER, (player_id,)))
+        self.gs_state.server_state.eventq.append(Event(self._count, now, TOPIC_NEWPLAYER, (player_id,)))
 
-        return asdict(player)
+        return player.to_wire()
 
     def rpc_delete_player(self, sender, player_id):
         if self.gs_state is None:
             raise
-        LOG.info("RPCServer received: [%s], from %s:%i" % (player_id, sender[0], sender[1]))
+        self._record(inputlog.DELETE_PLAYER, time.time(), sender, player_id)
+        LOG.info("RPCServer received: [%s], from %s:%i", player_id, *sender)
         for i, p in enumerate(self.gs_state.server_state.remotes):
             if p.playerid == player_id:
                 del(self.gs_state.server_state.remotes[i])
+                self.gs_state.server_state.pending_inputs.pop(player_id, None)
+                self.rx_by_addr.pop(p.sender, None)
                 idx, p = self.gs_state.game_state.get_player_from_id(player_id)
                 del(self.gs_state.game_state.players[idx])
-                LOG.info('Player %d removed' % player_id)
+                LOG.info('Player %d removed', player_id)
                 break
         else:
             return False
@@ -100,32 +184,82 @@ class RPCServerProtocol(RPCProtocol):
         res = None
         idx, p = self.gs_state.game_state.get_player_from_id(player_id)
         if p:
-            res = p.position
+            # the seq acknowledges the inputs applied, as in the snapshots
+            res = [p.position, p.seq]
         return res
 
+    def rpc_clock_sync(self, sender, t0, player_id=None, rtt=None, offset=None):
+        t1 = time.time()
+        if self.gs_state is None:
+            raise
+        if player_id is not None and rtt is not None:
+            for p in self.gs_state.server_state.remotes:
+                if p.playerid == player_id:
+                    p.rtt = rtt
+                    p.clock_offset = offset
+                    break
+        return [t0, t1, time.time()]
+
+    def rpc_get_server_stats(self, sender):
+        if self.gs_state is None:
+            raise
+        return self.gs_state.server_state.get_stats()
+
     def rpc_get_game_state(self, sender):
         if self.gs_state is None:
             raise
-        return asdict(self.gs_state.game_state)
+        return self.gs_state.game_state.to_wire()
 
     def rpc_ff_process_client_events(self, sender, data):
-        if self.gs_state is None or not data['params'][0]:
+        evt = Event.from_wire(data)
+        if self.gs_state is None or not evt.params[0]:
             raise RuntimeError('Not supposed to happend')
-        obj_meta_data = data['params'][0]
+        self._record(inputlog.CLIENT_EVENT, time.time(), sender, data)
+        obj_meta_data = evt.params[0]
         #print(obj_meta_data)
         if obj_meta_data['klass'] == PROJECTILE:
-            projectile = ProjectileData(**obj_meta_data['obj_as_dict'])
-            print(projectile)
+            projectile = ProjectileData.from_wire(obj_meta_data['obj'])
+            HOT_LOG.info('projectile %s', projectile)
 
 class ServerState:
-    def __init__(self, game_state):
+    def __init__(self, game_state, port=SERVER_PORT, seed=None, recorder=None):
         self._running = False
-        self.local_addr = ('0.0.0.0', 1234)
+        self.local_addr = ('0.0.0.0', port)
+        # spawn positions, seeded so a recorded session can be replayed
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.rnd = random.Random(self.seed)
+        # common.inputlog.InputRecorder logging the inputs, or None
+        self.recorder = recorder
+        # player id -> deque of (seq, keys) received, until update()
+        # applies them
+        self.pending_inputs = {}
+        # [player id, trace id, received, updated, seq] of the traced
+        # inputs waiting for their snapshot
+        self.traces = []
+        self.metrics = metrics.Registry()
+        self.metrics.add_collector('server', self.get_stats)
+        self.metrics.add_collector('remotes', self.get_remote_stats)
         self.default_remote_addr_port = 4321
         self.remotes = []  # for server to client(s) publish_game_state
         self.local_endpoint = None
+        self.local_protocol = None
         self._count = 0
         self.eventq = deque()
+        # eventq depth left after each publish, and its maximum
+        self.eventq_backlog = 0
+        self.eventq_max_backlog = 0
+        # duration of the simulation updates and of the publishes (ms)
+        self.ticks = 0
+        self.tick_ms = 0.0
+        self.tick_ms_max = 0.0
+        self.tick_ms_total = 0.0
+        self.publishes = 0
+        self.publish_ms = 0.0
+        self.publish_ms_max = 0.0
+        self.publish_ms_total = 0.0
+        # size of the last snapshot datagram sent, and its maximum
+        self.snapshot_bytes = 0
+        self.snapshot_bytes_max = 0
         self._game_state = game_state
 
     @property
@@ -141,79 +275,212 @@ class ServerState:
         if self.local_endpoint:
             self.local_endpoint.close()
             self.local_endpoint = None
+        if self.recorder is not None:
+            self.recorder.close(self._game_state)
         self._running = False
 
+    def get_stats(self):
+        return {
+            'players': len(self._game_state.players),
+            'remotes': len(self.remotes),
+            'ticks': self.ticks,
+            'tick_ms': self.tick_ms,
+            'tick_ms_max': self.tick_ms_max,
+            'tick_ms_avg': self.tick_ms_total / self.ticks if self.ticks else 0.0,
+            'publishes': self.publishes,
+            'publish_ms': self.publish_ms,
+            'publish_ms_max': self.publish_ms_max,
+            'publish_ms_avg': self.publish_ms_total / self.publishes if self.publishes else 0.0,
+            'snapshot_bytes': self.snapshot_bytes,
+            'snapshot_bytes_max': self.snapshot_bytes_max,
+            'eventq_backlog': self.eventq_backlog,
+            'eventq_max_backlog': self.eventq_max_backlog,
+            'eventq': len(self.eventq),
+            'outstanding_rpcs': sum(p.protocol.outstanding for p in self.remotes if p.protocol)
+                                + (self.local_protocol.outstanding if self.local_protocol else 0),
+        }
+
+    def get_remote_stats(self):
+        """Traffic per remote: datagrams received from its requesting socket,
+        sent by its publishing endpoint (the RPC responses aren't counted)"""
+        rx = self.local_protocol.rx_by_addr if self.local_protocol else {}
+        res = []
+        for p in self.remotes:
+            rx_packets, rx_bytes = rx.get(p.sender, (0, 0))
+            proto = p.protocol
+            res.append({'player': p.playerid, 'addr': '%s:%d' % p.addr,
+                        'rx_packets': rx_packets, 'rx_bytes': rx_bytes,
+                        'tx_packets': proto.tx_packets if proto else 0,
+                        'tx_bytes': proto.tx_bytes if proto else 0,
+                        'rtt': p.rtt})
+        return res
+
     def update(self):
+        now = time.time()
+        if self.recorder is not None:
+            self.recorder.tick(self._game_state.tick, now)
+        self._game_state.tick += 1
+        pending_inputs = self.pending_inputs
+        if pending_inputs:
+            for p in self._game_state.players:
+                inputs = pending_inputs.get(p.id)
+                if inputs is None:
+                    continue
+                # in seq order, one per tick so that each key transition of
+                # a burst lasts a tick. p.seq is the last input applied, the
+                # acks never cover one that wasn't
+                n = len(inputs) - INPUT_QUEUE_MAX
+                if n > 1:
+                    self.metrics.counter('merged_inputs').inc(n - 1)
+                for _ in range(max(n, 1)):
+                    p.seq, p.keys_pressed = inputs.popleft()
+                if not inputs:
+                    del pending_inputs[p.id]
+        if self.traces:
+            t = time.perf_counter()
+            seqs = {p.id: p.seq for p in self._game_state.players}
+            for trace in self.traces:
+                if trace[3] is None and seqs.get(trace[0], trace[4]) >= trace[4]:
+                    trace[3] = t
         if len(self._game_state.players) == 0:
             return
         self._count += 1
         _last_update = self._game_state.updated_at
-        dt = time.time() - _last_update
+        dt = now - _last_update
         for p in self._game_state.players:
             if p.position and p.keys_pressed:
                 curr_pos = Vector2(p.position)
                 new_pos = apply_movement(p.speed, dt, curr_pos, p.keys_pressed)
                 p.position = new_pos.as_list
                 if ((self._count % 100) == 0):
-                    LOG.debug('%d:' % p.id, ' p.pos:', p.position)
+                    LOG.debug('%d: p.pos: %s', p.id, p.position)
                     self._count = 0
-                self._game_state.updated_at = time.time()
+                self._game_state.updated_at = now
 
 async def run_every_x_s(seconds, gs_state):
     i = 0
+    tick_histogram = gs_state.server_state.metrics.histogram('tick')
+    lag_histogram = gs_state.server_state.metrics.histogram('loop_lag')
     while True:
         dur = 0
-        with MeasureDuration() as m:
-            gs_state.server_state.update()
+        server_state = gs_state.server_state
+        with Z_TICK, MeasureDuration() as m:
+            server_state.update()
+        ms = m.get_duration_ms()
+        server_state.ticks += 1
+        server_state.tick_ms = ms
+        server_state.tick_ms_total += ms
+        if ms > server_state.tick_ms_max:
+            server_state.tick_ms_max = ms
+        tick_histogram.record(m.duration)
         dur = seconds - m.duration
         if (i % 100) == 0:
-            LOG.debug('seconds %f' % dur)
+            LOG.debug('seconds %f', dur)
         i += 1
+        t_sleep = time.perf_counter()
         await asyncio.sleep(dur)
+        # how late the loop woke us up
+        lag = time.perf_counter() - t_sleep - max(dur, 0)
+        lag_histogram.record(lag if lag > 0 else 0.0)
 
 async def init_local_endpoint(gs_state):
     endpoint_helper = EndpointHelper(RPCServerProtocol, lambda: RPCServerProtocol.set_server_state(gs_state))
-    endpoint, _ = await endpoint_helper.open_local_endpoint(*gs_state.server_state.local_addr)
+    endpoint, protocol = await endpoint_helper.open_local_endpoint(*gs_state.server_state.local_addr)
+    gs_state.server_state.local_protocol = protocol
     return endpoint
 
 async def init_remote_endpoint(remote_addr):
     endpoint_helper = EndpointHelper(RPCServerProtocol, None)
-    LOG.info("init_remote_endpoint: %s" % str(remote_addr))
+    LOG.info("init_remote_endpoint: %s", remote_addr)
     endpoint, protocol = await endpoint_helper.open_remote_endpoint(*remote_addr)
     return endpoint, protocol
 
 async def main(gs_state):
+    RPCServerProtocol.metrics = gs_state.server_state.metrics
     local_endpoint = await init_local_endpoint(gs_state)
     LOG.info('Local endpoint created')
     gs_state.server_state.running = True
     gs_state.server_state.local_endpoint = local_endpoint
     await run_every_x_s(SERVER_TICKRATE, gs_state)
 
+def take_updated_traces(server_state):
+    """Removes the traces applied by update() from server_state.traces,
+    returns them by player id"""
+    updated, pending = {}, []
+    for trace in server_state.traces:
+        if trace[3] is None:
+            pending.append(trace)
+        else:
+            updated.setdefault(trace[0], []).append(trace)
+    server_state.traces = pending
+    return updated
+
+def send_traces(p, traces):
+    # server stage durations of the traced inputs of p, right after the
+    # snapshot carrying them
+    t = time.perf_counter()
+    for _, trace_id, received, updated, _ in traces:
+        p.protocol.ff_trace(p.addr, trace_id, [updated - received, t - updated])
+
 async def publish_game_state(gs_state):
     publish_state = True
     publish_event = True
+    server_state = gs_state.server_state
+    publish_histogram = server_state.metrics.histogram('publish')
     while True:
+        t0 = time.perf_counter()
 
-        # Publish game state
+        # endpoints of the new players first, the zones can't span an await
         for p in gs_state.server_state.remotes:
-
             if not p.ready:
                 p.endpoint, p.protocol = await init_remote_endpoint(p.addr)
-                LOG.info("#1 Remote endpoint (%d) created for player %d (%s)" % (id(p), p.playerid, p.addr))
+                LOG.info("#1 Remote endpoint (%d) created for player %d (%s)", id(p), p.playerid, p.addr)
                 p.ready = True
 
-            if publish_state and p.ready and gs_state.game_state:
-                p.protocol.ff_listen_for_game_state_or_event(p.addr, asdict(gs_state.game_state))
-
-        # Publish event(s)
-        e = None
-        if len(gs_state.server_state.eventq) > 0:
-            e = gs_state.server_state.eventq.popleft()
-
-        if e:
-            for p in gs_state.server_state.remotes:
-                if publish_event and p.ready:
-                    p.protocol.ff_listen_for_game_state_or_event(p.addr, asdict(e))
+        with Z_PUBLISH:
+            # Publish game state, each client finds its own authoritative
+            # position and last applied input seq in it
+            gs_state.game_state.srv_time = time.time()
+            game_state = gs_state.game_state
+            with Z_ENCODE:
+                state = game_state.to_wire() if publish_state else None
+            traces = take_updated_traces(server_state) if server_state.traces else None
+            with Z_SEND:
+                for p in gs_state.server_state.remotes:
+                    if publish_state and p.ready and gs_state.game_state:
+                        p.protocol.ff_listen_for_game_state_or_event(p.addr, game_state.evt, state)
+                        server_state.snapshot_bytes = p.protocol.last_tx_bytes
+                        if server_state.snapshot_bytes > server_state.snapshot_bytes_max:
+                            server_state.snapshot_bytes_max = server_state.snapshot_bytes
+                        if traces and p.playerid in traces:
+                            send_traces(p, traces.pop(p.playerid))
+
+            # Publish event(s)
+            eventq = gs_state.server_state.eventq
+            deadline = time.perf_counter() + EVENTS_BUDGET_S
+            n = 0
+            with Z_EVENTS:
+                while eventq and n < EVENTS_PER_TICK:
+                    evt = eventq.popleft()
+                    e = evt.to_wire()
+                    for p in gs_state.server_state.remotes:
+                        if publish_event and p.ready:
+                            p.protocol.ff_listen_for_game_state_or_event(p.addr, evt.evt, e)
+                    n += 1
+                    if time.perf_counter() > deadline:
+                        break
+        gs_state.server_state.eventq_backlog = len(eventq)
+        if len(eventq) > gs_state.server_state.eventq_max_backlog:
+            gs_state.server_state.eventq_max_backlog = len(eventq)
+
+        duration = time.perf_counter() - t0
+        publish_histogram.record(duration)
+        ms = duration * 1000
+        server_state.publishes += 1
+        server_state.publish_ms = ms
+        server_state.publish_ms_total += ms
+        if ms > server_state.publish_ms_max:
+            server_state.publish_ms_max = ms
 
         await asyncio.sleep(SERVER_TICKRATE)
 
@@ -234,19 +501,47 @@ class GameServerState:
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=LOGLEVEL)
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--record', metavar='FILE',
+                        help='log the inputs to FILE, to run them again with replay.py')
+    parser.add_argument('--seed', type=int, help='seed of the spawn positions')
+    parser.add_argument('--stats-port', type=int, default=STATS_PORT,
+                        help='localhost HTTP port serving the metrics as JSON, 0 to disable')
+    parser.add_argument('--stats-file', help='write the metrics to this JSON file periodically')
+    parser.add_argument('--log-level', default=logging.getLevelName(LOGLEVEL),
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--profile', metavar='FILE',
+                        help='profile the tick and publish zones, written to FILE as Chrome trace JSON at exit')
+    args = parser.parse_args()
+    log_listener = logsetup.setup(args.log_level)
     loop = asyncio.get_event_loop()
     loop.set_debug(False)
 
     game_st = GameData()
-    server_st = ServerState(game_st)
+    server_st = ServerState(game_st, port=args.port, seed=args.seed)
+    if args.record:
+        server_st.recorder = inputlog.InputRecorder(args.record, seed=server_st.seed,
+                                                    tickrate=SERVER_TICKRATE, started=time.time())
     gserver_st = GameServerState(game_st, server_st)
+    if args.profile:
+        PROFILER.enable()
     loop.create_task(main(gserver_st))
     loop.create_task(publish_game_state(gserver_st))
+    if args.stats_port:
+        loop.run_until_complete(metrics.serve_stats(server_st.metrics, args.stats_port))
+    if args.stats_file:
+        loop.create_task(metrics.dump_every(server_st.metrics, args.stats_file))
 
     try:
         loop.run_forever()
     except KeyboardInterrupt:
         server_st.stop()
+        if args.stats_file:
+            metrics.dump(server_st.metrics, args.stats_file)
+        if args.profile:
+            PROFILER.export_chrome(args.profile)
 
     loop.close()
+    log_listener.stop()
@@ -1,25 +1,46 @@
 #!/usr/bin/env python
+import argparse
 import logging
-import sys
 import time
 from pathlib import Path
 from common.arcadegame import ArcadeGame
 from common.helpers import MeasureDuration
+from common.core import SERVER_PORT
 from common.datacls import GameData, GameState, ClientGameData, PlayerData, ClientPlayerData
 from common import gamethreads
+from common import textures
+from common import logsetup
+from common.tracing import Tracer, TRACE_SAMPLE
+from common.profiler import PROFILER
 
 WWIDTH = 800
 WHEIGHT = 600
 
 def main():
-    playerid = int(sys.argv[1])   # player id should be an int
-    remote_address = sys.argv[2]  # server ip address string for client to server coms
-    local_address_port = int(sys.argv[3])  # listening port (int) for server to client coms
+    parser = argparse.ArgumentParser()
+    parser.add_argument('playerid', type=int)
+    parser.add_argument('remote_address', help='server ip address for client to server coms')
+    parser.add_argument('local_address_port', type=int, help='listening port for server to client coms')
+    parser.add_argument('remote_port', type=int, nargs='?', default=SERVER_PORT,
+                        help='server port, e.g. the one of a netproxy.py in front of the server')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='append latency traces of sampled inputs to FILE (see tracereport.py)')
+    parser.add_argument('--trace-sample', type=float, default=TRACE_SAMPLE)
+    parser.add_argument('--profile', metavar='FILE',
+                        help='profile the frame zones, written to FILE as Chrome trace JSON at exit '
+                             '(P toggles the overlay either way)')
+    args = parser.parse_args()
+    playerid = args.playerid
+    remote_address = args.remote_address
+    local_address_port = args.local_address_port
+    remote_port = args.remote_port
     with MeasureDuration() as m:
         time.sleep(0.001)
     print(m.get_duration_ms())
-    logging.basicConfig(level=logging.ERROR)
+    logsetup.setup(logging.ERROR)
     picsdir = Path('pics')
+    # load the sprite sheets while the window is being created
+    textures.preload(picsdir)
 
     gamestate = GameState()
     playerdata = PlayerData(id=playerid,ts=None,position=None,
@@ -28,21 +49,32 @@ def main():
 
     cgame = ArcadeGame(WWIDTH, WHEIGHT, picsdir)
     cgame.set_update_rate(1/60)
-    cgamedata = ClientGameData(remote_address=remote_address,local_address_port=local_address_port)
+    cgamedata = ClientGameData(remote_address=remote_address,remote_port=remote_port,
+        local_address_port=local_address_port)
     cplayerdata = ClientPlayerData(id=playerid,ts=None,position=None,
         keys_pressed=None, speed=None)
     cgamedata.players.append(cplayerdata)
+    trace_file = None
+    if args.trace:
+        trace_file = open(args.trace, 'a', buffering=1)
+        cgamedata.tracer = Tracer(trace_file, sample=args.trace_sample, player_id=playerid)
     cgame.setup(gamestate, cgamedata)
 
     cgame_thread_manager = gamethreads.GameThreadManager(gamestate, cgamedata)
     cgame.set_game_thread_manager(cgame_thread_manager)
     cgame_thread_manager.run()
 
+    if args.profile:
+        PROFILER.enable()
     try:
         cgame.run()
     except KeyboardInterrupt:
         pass
     cgame_thread_manager.stop()
+    if trace_file:
+        trace_file.close()
+    if args.profile:
+        PROFILER.export_chrome(args.profile)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""
+UDP proxy between the clients (main.py, bots.py) and gameserver.py that
+impairs the traffic like a WAN link would: per direction delay, jitter,
+loss bursts, duplication, reordering and bandwidth caps, read from a
+profile file. Logs the stats of each client flow.
+
+    python gameserver.py &
+    python netproxy.py netprofiles/wan.json &
+    python main.py 1 127.0.0.1 4321 1235
+    python bots.py -n 50 --server-port 1235
+
+A profile is a JSON object of LinkProfile fields (see common.loopback)
+applied to both directions, "up" (client to server) and "down" (server to
+client) objects override them for one direction:
+
+    {"latency": 0.04, "jitter": 0.01, "down": {"bandwidth": 250000}}
+
+The server pushes the game state to the port the client gave in
+create_player, the proxy rewrites that argument to the port of the flow
+socket so the pushes go through it as well.
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import random
+import socket
+import time
+import umsgpack
+from common.core import SERVER_PORT
+from common.loopback import Link, LinkProfile, LinkStats
+
+LISTEN_PORT = 1235
+REPORT_PERIOD = 5.0
+FLOW_TIMEOUT = 60.0   # forget a client silent for that long
+SEED = None
+
+# RPCProtocol datagram layout: type byte, 20 bytes msg id, msgpack [name, args]
+REQUEST = b'\x00'
+RESPONSE = b'\x01'
+HEADER_SIZE = 21
+
+LOG = logging.getLogger('netproxy')
+
+
+def load_profiles(path):
+    """Returns the (up, down) LinkProfiles of a profile file"""
+    with open(path) as f:
+        doc = json.load(f)
+    names = {f.name for f in dataclasses.fields(LinkProfile)}
+    for key in doc:
+        if key not in names and key not in ('up', 'down'):
+            raise ValueError('%s: unknown profile field %s' % (path, key))
+    both = {k: v for k, v in doc.items() if k in names}
+    return tuple(LinkProfile(**{**both, **doc.get(direction, {})}) for direction in ('up', 'down'))
+
+
+def rewrite_player_port(datagram, port):
+    """If datagram is a create_player request, returns it with port as the
+    player port and that port, else (datagram, None)"""
+    if datagram[:1] != REQUEST or b'create_player' not in datagram[HEADER_SIZE:HEADER_SIZE + 16]:
+        return datagram, None
+    name, args = umsgpack.unpackb(datagram[HEADER_SIZE:])
+    if name != 'create_player' or len(args) != 2:
+        return datagram, None
+    player_id, player_port = args
+    return datagram[:HEADER_SIZE] + umsgpack.packb([name, [player_id, port]]), player_port
+
+
+class Flow:
+    """The datagrams of one client: its own socket towards the server and
+    an impaired Link in each direction"""
+
+    def __init__(self, client, sock, up, down):
+        self.client = client          # address the client sends from
+        self.listen = None            # address the client gets the pushes on
+        self.sock = sock
+        self.port = sock.getsockname()[1]
+        self.transport = None
+        self.pending = []             # datagrams due before the transport is up
+        self.up = Link(up)
+        self.down = Link(down)
+        self.created = self.last_seen = time.time()
+
+
+class FlowProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, proxy, flow):
+        self.proxy = proxy
+        self.flow = flow
+
+    def datagram_received(self, data, addr):
+        self.proxy.from_server(self.flow, data)
+
+
+class NetProxy(asyncio.DatagramProtocol):
+
+    def __init__(self, server, up, down, bind_host='127.0.0.1', seed=SEED):
+        self.server = server
+        self.up_profile = up
+        self.down_profile = down
+        self.bind_host = bind_host
+        self.rnd = random.Random(seed)
+        self.flows = {}  # client address -> Flow
+        self.closed = LinkStats(), LinkStats()  # up and down totals of the expired flows
+        self.transport = None
+        self.loop = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_event_loop()
+
+    def datagram_received(self, data, addr):
+        flow = self.flows.get(addr)
+        if flow is None:
+            flow = self.open_flow(addr)
+        flow.last_seen = time.time()
+        data, player_port = rewrite_player_port(data, flow.port)
+        if player_port is not None:
+            flow.listen = (addr[0], player_port)
+            LOG.info('flow %s:%d: pushes to port %d go through port %d', *addr, player_port, flow.port)
+        for when in flow.up.schedule(self.loop.time(), len(data), self.rnd):
+            self.loop.call_at(when, self._send_up, flow, data)
+
+    def open_flow(self, client):
+        # bound now so the port is known for rewrite_player_port, not
+        # connected: the pushes come from other server ports
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((self.bind_host, 0))
+        flow = Flow(client, sock, self.up_profile, self.down_profile)
+        self.flows[client] = flow
+        self.loop.create_task(self._connect(flow))
+        LOG.info('flow %s:%d: new, server side port %d', *client, flow.port)
+        return flow
+
+    async def _connect(self, flow):
+        flow.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: FlowProtocol(self, flow), sock=flow.sock)
+        for data in flow.pending:
+            self._send_up(flow, data)
+        flow.pending = None
+
+    def _send_up(self, flow, data):
+        if flow.transport is None:
+            if flow.pending is not None:
+                flow.pending.append(data)
+            return
+        if flow.transport.is_closing():
+            flow.up.stats.lost += 1
+            return
+        flow.up.stats.delivered += 1
+        flow.up.stats.bytes += len(data)
+        flow.transport.sendto(data, self.server)
+
+    def from_server(self, flow, data):
+        flow.last_seen = time.time()
+        # responses go back to the requesting socket, pushes to the listening one
+        addr = flow.client if data[:1] == RESPONSE else flow.listen
+        if addr is None:
+            flow.down.stats.sent += 1
+            flow.down.stats.lost += 1
+            return
+        for when in flow.down.schedule(self.loop.time(), len(data), self.rnd):
+            self.loop.call_at(when, self._send_down, flow, data, addr)
+
+    def _send_down(self, flow, data, addr):
+        if self.transport.is_closing():
+            return
+        flow.down.stats.delivered += 1
+        flow.down.stats.bytes += len(data)
+        self.transport.sendto(data, addr)
+
+    def expire(self, timeout=FLOW_TIMEOUT):
+        now = time.time()
+        for client, flow in list(self.flows.items()):
+            if now - flow.last_seen > timeout:
+                LOG.info('flow %s:%d: expired', *client)
+                for total, link in zip(self.closed, (flow.up, flow.down)):
+                    for k in LinkStats.__slots__:
+                        setattr(total, k, getattr(total, k) + getattr(link.stats, k))
+                if flow.transport is not None:
+                    flow.transport.close()
+                else:
+                    flow.sock.close()
+                del self.flows[client]
+
+    def stats(self):
+        """Per flow and total stats, as a JSON friendly dict"""
+        flows = {}
+        up, down = LinkStats(), LinkStats()
+        for link, total in zip((up, down), self.closed):
+            for k in LinkStats.__slots__:
+                setattr(link, k, getattr(total, k))
+        for client, flow in self.flows.items():
+            flows['%s:%d' % client] = {
+                'listen': '%s:%d' % flow.listen if flow.listen else None,
+                'age': time.time() - flow.created,
+                'up': flow.up.stats.as_dict(), 'down': flow.down.stats.as_dict()}
+            for total, link in ((up, flow.up), (down, flow.down)):
+                for k in LinkStats.__slots__:
+                    setattr(total, k, getattr(total, k) + getattr(link.stats, k))
+        return {'flows': flows, 'up': up.as_dict(), 'down': down.as_dict()}
+
+
+def format_link(s, window_bytes, window):
+    return 'sent %6d lost %5d (%4.1f%%) qdrop %4d dup %4d  %7.1f KB/s' % (
+        s['sent'], s['lost'], 100 * s['lost'] / max(s['sent'], 1), s['queue_dropped'],
+        s['duplicated'], window_bytes / window / 1024)
+
+
+async def report_every(proxy, period, output=None):
+    last = {}
+    t_last = time.perf_counter()
+    while True:
+        await asyncio.sleep(period)
+        proxy.expire()
+        now = time.perf_counter()
+        window = now - t_last
+        stats = proxy.stats()
+        print('[%s] %d flow(s)' % (time.strftime('%H:%M:%S'), len(stats['flows'])))
+        for name, flow in sorted(stats['flows'].items()):
+            for direction in ('up', 'down'):
+                s = flow[direction]
+                prev = last.get((name, direction), 0)
+                print('  %-21s %-4s %s' % (name, direction, format_link(s, s['bytes'] - prev, window)))
+                last[name, direction] = s['bytes']
+        if output:
+            with open(output, 'w') as f:
+                json.dump(stats, f, indent=2)
+        t_last = now
+
+
+async def serve(args, up, down):
+    loop = asyncio.get_running_loop()
+    proxy = NetProxy((args.server, args.server_port), up, down, seed=args.seed)
+    await loop.create_datagram_endpoint(lambda: proxy, local_addr=(args.host, args.port))
+    print('proxying %s:%d -> %s:%d\n  up   %s\n  down %s' % (
+        args.host, args.port, args.server, args.server_port, up, down))
+    try:
+        await report_every(proxy, args.report, args.output)
+    finally:
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(proxy.stats(), f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('profile', nargs='?', help='profile file (JSON), no impairment if omitted')
+    parser.add_argument('--host', default='0.0.0.0', help='address the clients connect to')
+    parser.add_argument('--port', type=int, default=LISTEN_PORT, help='port the clients connect to')
+    parser.add_argument('--server', default='127.0.0.1', help='game server address')
+    parser.add_argument('--server-port', type=int, default=SERVER_PORT)
+    parser.add_argument('--report', type=float, default=REPORT_PERIOD, help='stats period (s)')
+    parser.add_argument('-o', '--output', help='also write the stats to this JSON file')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('-v', '--verbose', action='store_true', help='log the flows')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    up, down = load_profiles(args.profile) if args.profile else (LinkProfile(), LinkProfile())
+    try:
+        asyncio.run(serve(args, up, down))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
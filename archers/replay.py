@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Replays an input log recorded by the game server (gameserver.py --record)
+headlessly and as fast as possible: the recorded inputs go through the
+server RPC handlers and each TICK record runs ServerState.update() on the
+recorded clock, so a session, or an incident, runs again identically.
+
+    python gameserver.py --record session.log
+    python replay.py session.log                # ticks/s, checks the final state
+    python replay.py session.log --until 3000   # stop at a tick, print the players
+    python replay.py --synthesize synth.log -n 200 --ticks 3600
+
+Reports the replay throughput in ticks per second.
+"""
+import argparse
+import logging
+import random
+import time
+import gameserver
+from common import inputlog
+from common.core import MOVE_MAP
+from common.datacls import GameData, PlayerData
+from common.loopback import VirtualClock
+
+SEED = 1234
+SYNTH_PLAYERS = 100
+SYNTH_TICKS = 600
+INPUT_RATE = 0.05  # probability a player changes its keys on a tick
+SPEED = 100
+
+
+def headless_server(seed, recorder=None):
+    """ServerState and an RPCServerProtocol bound to it, without endpoints"""
+    game_state = GameData()
+    server_state = gameserver.ServerState(game_state, seed=seed, recorder=recorder)
+    gs_state = gameserver.GameServerState(game_state, server_state)
+    protocol = gameserver.RPCServerProtocol(None)
+    protocol.gs_state = gs_state
+    return gs_state, protocol
+
+
+def replay(path, until=None):
+    """Runs the log at path, returns a dict of results"""
+    clock = VirtualClock(0.0)
+    with inputlog.InputLog(path) as log, clock.patch(gameserver):
+        gs_state, protocol = headless_server(log.header['seed'])
+        server_state = gs_state.server_state
+        handlers = {
+            inputlog.SET_PLAYER_STATE: protocol.rpc_ff_set_player_state,
+            inputlog.CREATE_PLAYER: protocol.rpc_create_player,
+            inputlog.DELETE_PLAYER: protocol.rpc_delete_player,
+            inputlog.CLIENT_EVENT: protocol.rpc_ff_process_client_events,
+        }
+        ticks = records = 0
+        expected = None
+        t0 = time.perf_counter()
+        for kind, tick, t, payload in log:
+            records += 1
+            if kind == inputlog.TICK:
+                if until is not None and tick >= until:
+                    break
+                clock.now = t
+                server_state.update()
+                ticks += 1
+            elif kind in handlers:
+                clock.now = t
+                sender, *args = payload
+                handlers[kind](tuple(sender), *args)
+            elif kind == inputlog.END:
+                expected = payload
+        wall = time.perf_counter() - t0
+    digest = inputlog.players_digest(gs_state.game_state)
+    return {'ticks': ticks, 'records': records, 'wall_s': wall,
+            'ticks_per_s': ticks / wall if wall else 0.0,
+            'players': len(gs_state.game_state.players),
+            'digest': digest, 'expected_digest': expected,
+            'game_state': gs_state.game_state}
+
+
+def synthesize(path, players=SYNTH_PLAYERS, ticks=SYNTH_TICKS, seed=SEED):
+    """Records a session of players random walking for ticks ticks, driven
+    through the server handlers on a virtual clock"""
+    rnd = random.Random(seed)
+    clock = VirtualClock(0.0)
+    recorder = inputlog.InputRecorder(path, seed=seed, tickrate=gameserver.SERVER_TICKRATE,
+                                      started=0.0, synthetic=True)
+    with clock.patch(gameserver):
+        gs_state, protocol = headless_server(seed, recorder)
+        for i in range(players):
+            protocol.rpc_create_player(('127.0.0.1', 40000 + i), i, 5000 + i)
+        seqs = [0] * players
+        for _ in range(ticks):
+            clock.advance(gameserver.SERVER_TICKRATE)
+            for i in range(players):
+                if rnd.random() < INPUT_RATE:
+                    seqs[i] += 1
+                    keys = {k: rnd.random() < 0.3 for k in MOVE_MAP}
+                    state = PlayerData(id=i, ts=clock.now, position=[0, 0], keys_pressed=keys,
+                                       speed=SPEED, seq=seqs[i])
+                    protocol.rpc_ff_set_player_state(('127.0.0.1', 40000 + i), state.to_wire())
+            gs_state.server_state.update()
+    recorder.close(gs_state.game_state)
+    return recorder.records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('log', nargs='?', help='input log to replay')
+    parser.add_argument('--until', type=int, help='stop at this tick and print the players')
+    parser.add_argument('--repeat', type=int, default=1, help='replay that many times, keep the best')
+    parser.add_argument('--synthesize', metavar='FILE', help='record a synthetic session to FILE')
+    parser.add_argument('-n', '--players', type=int, default=SYNTH_PLAYERS)
+    parser.add_argument('--ticks', type=int, default=SYNTH_TICKS)
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.synthesize:
+        n = synthesize(args.synthesize, args.players, args.ticks, args.seed)
+        print('%s: %d records' % (args.synthesize, n))
+        args.log = args.log or args.synthesize
+    if not args.log:
+        parser.error('no log to replay')
+
+    res = min((replay(args.log, args.until) for _ in range(args.repeat)), key=lambda r: r['wall_s'])
+    print('%d ticks, %d records, %d players in %.3f s: %.0f ticks/s' % (
+        res['ticks'], res['records'], res['players'], res['wall_s'], res['ticks_per_s']))
+    if args.until is not None:
+        for p in res['game_state'].players:
+            print('  ', p)
+        return 0
+    if res['expected_digest'] is None:
+        print('no END record (server not stopped cleanly), final state not checked')
+    elif res['expected_digest'] != res['digest']:
+        print('final state differs from the recording: %s != %s' % (res['digest'], res['expected_digest']))
+        return 1
+    else:
+        print('final state matches the recording')
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,62 @@
+import pytest
+
+from common import jitterbuffer
+from common.arcadegame import ArcadeGame, CORRECTION_BLEND
+from common.batchinterp import HAVE_NUMPY, RemoteSnapshots
+from common.datacls import ClientPlayerData, PlayerData
+from common.entities import EntityTable
+from common.loopback import VirtualClock
+from common.playercharacter import PlayerCharacter
+
+pytestmark = pytest.mark.skipif(not HAVE_NUMPY, reason='needs numpy')
+
+START = {1: (100.0, 100.0), 2: (300.0, 50.0), 3: (0.0, 0.0)}
+
+
+def entities():
+    table = EntityTable()
+    for pid, (x, y) in START.items():
+        sprite = PlayerCharacter(pid, 'pics')
+        sprite.center_x = x
+        sprite.center_y = y
+        table.add(ClientPlayerData(id=pid, ts=0.0, position=[x, y], keys_pressed=None, speed=None), sprite)
+    return table
+
+
+def player(pid, x, y):
+    return PlayerData(id=pid, ts=0.0, position=[x, y], keys_pressed={}, speed=0)
+
+
+def snapshots(k):
+    # player 3 is in none of them and stays where it is
+    return [player(1, 100.0 + 10 * k, 100.0), player(2, 300.0, 50.0 - 5 * k)]
+
+
+def test_batch_matches_scalar():
+    game = ArcadeGame.__new__(ArcadeGame)
+    scalar = entities()
+    batch = entities()
+    snaps = RemoteSnapshots()
+    for k in range(4):
+        srv_time = k * 0.05
+        local_time = srv_time + 0.02
+        players = snapshots(k)
+        snaps.push(srv_time, players, k, local_time)
+        for p in players:
+            scalar.get(p.id).data.snap_buffer.push(srv_time, p.position, k, local_time)
+
+    clock = VirtualClock(0.24)
+    for frame in range(3):
+        with clock.patch(jitterbuffer):
+            for e in scalar:
+                game.update_calc_pos_client(1 / 60, e)
+        snaps.update_sprites(batch, local_now=clock.now, blend=CORRECTION_BLEND)
+        for e in scalar:
+            b = batch.get(e.id)
+            assert e.sprite.change_x == pytest.approx(b.sprite.change_x)
+            assert e.sprite.change_y == pytest.approx(b.sprite.change_y)
+            assert e.data.position == pytest.approx(b.data.position)
+            e.sprite.update()
+            b.sprite.update()
+            assert e.sprite.position == pytest.approx(b.sprite.position)
+        clock.advance(1 / 60)
@@ -0,0 +1,32 @@
+from common.clocksync import ClockSync
+
+
+def test_offset_and_rtt():
+    cs = ClockSync()
+    assert not cs.synced
+    # server clock 100s ahead, 20ms each way, 1ms of processing
+    assert cs.add_sample(0.0, 100.020, 100.021, 0.041)
+    assert cs.synced
+    assert abs(cs.offset - 100.0) < 1e-9 and abs(cs.rtt - 0.040) < 1e-9
+
+
+def test_min_rtt_sample_wins():
+    cs = ClockSync()
+    cs.add_sample(0.0, 100.020, 100.021, 0.041)
+    # a slower sample with asymmetric delay doesn't win
+    cs.add_sample(1.0, 101.080, 101.081, 1.101)
+    assert abs(cs.offset - 100.0) < 1e-9
+
+
+def test_negative_rtt_rejected():
+    cs = ClockSync()
+    assert not cs.add_sample(1.0, 100.0, 100.5, 1.1)
+    assert not cs.synced
+
+
+def test_conversions():
+    t = [5.0]
+    cs = ClockSync(clock=lambda: t[0])
+    cs.add_sample(0.0, 100.020, 100.021, 0.041)
+    assert abs(cs.server_now() - 105.0) < 1e-9
+    assert abs(cs.to_local(cs.to_server(3.0)) - 3.0) < 1e-9
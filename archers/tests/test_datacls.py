@@ -0,0 +1,66 @@
+from common.datacls import ClientPlayerData, Event, GameData, PlayerData, ProjectileData
+
+
+def player(pid, x=1.0, y=2.0):
+    return PlayerData(id=pid, ts=3.5, position=[x, y], keys_pressed={65362: True}, speed=100,
+                      facing=2, seq=7)
+
+
+def test_player_round_trip():
+    p = player(1)
+    t = p.to_wire()
+    assert t == (1, 3.5, [1.0, 2.0], {65362: True}, 100, 2, 7)
+    assert PlayerData.from_wire(t) == p
+    assert PlayerData.WIRE_FIELDS == ('id', 'ts', 'position', 'keys_pressed', 'speed', 'facing', 'seq')
+
+
+def test_projectile_round_trip():
+    p = ProjectileData(id=4, src_id=1, ts=0.5, position=[10.0, 20.0], speed=400, facing=3)
+    assert ProjectileData.from_wire(p.to_wire()) == p
+
+
+def test_skipped_field():
+    e = Event(id=1, ts=2, topic='root.game.new_player', params=(3,), evt=5)
+    t = e.to_wire()
+    assert t == (1, 2, 'root.game.new_player', (3,))
+    assert 'evt' not in Event.WIRE_FIELDS
+    # the skipped field comes back with its default
+    assert Event.from_wire(t).evt == 1
+
+
+def test_nested_records():
+    gd = GameData(players=[player(1), player(2, 5.0, 6.0)], updated_at=9.0, evt=0, tick=12,
+                  srv_time=100.25)
+    t = gd.to_wire()
+    assert t == ([player(1).to_wire(), player(2, 5.0, 6.0).to_wire()], 9.0, 12, 100.25)
+    back = GameData.from_wire(t)
+    assert back == gd
+    assert all(type(p) is PlayerData for p in back.players)
+
+
+def test_subclass_sends_base_fields():
+    p = ClientPlayerData(id=1, ts=3.5, position=[1.0, 2.0], keys_pressed={65362: True}, speed=100,
+                         facing=2, seq=7, last_ack_seq=5)
+    assert p.to_wire() == player(1).to_wire()
+
+
+def test_update_from_wire_in_place():
+    p = player(1)
+    position = p.position
+    keys = p.keys_pressed
+    p.update_from_wire((1, 4.0, (8.0, 9.0), {65364: True}, 50, 1, 8))
+    assert p.position is position and position == [8.0, 9.0]
+    assert p.keys_pressed is keys and keys == {65364: True}
+    assert (p.ts, p.speed, p.facing, p.seq) == (4.0, 50, 1, 8)
+
+
+def test_set_from_wire_reuses_records():
+    gd = GameData()
+    index = {}
+    gd.set_from_wire(([player(1).to_wire(), player(2).to_wire()], 0.0, 1, 10.0), index)
+    first = gd.players[0]
+    gd.set_from_wire(([player(1, 3.0, 4.0).to_wire()], 0.0, 2, 10.05), index)
+    assert gd.players == [first] and first.position == [3.0, 4.0]
+    assert (gd.tick, gd.srv_time) == (2, 10.05)
+    # player 2 left, its record is forgotten
+    assert list(index) == [1]
@@ -0,0 +1,61 @@
+from common.datacls import GameData, GameState, PlayerData, ClientGameData, SRV_EVENTQ_SIZE
+from common.datacls import Event
+from common.gamethreads import RPCServer2ClientProtocol
+
+
+def snapshot(tick, x):
+    players = [PlayerData(id=1, ts=0.0, position=[x, 0], keys_pressed={}, speed=100)]
+    return GameData(players=players, tick=tick).to_wire()
+
+
+def test_nothing_published():
+    gamestate = GameState()
+    assert gamestate.acquire_gamedata() is None
+
+
+def test_acquire_latest():
+    gamestate = GameState()
+    gamestate.apply_snapshot(snapshot(1, 10))
+    gamestate.apply_snapshot(snapshot(2, 20))
+    gd = gamestate.acquire_gamedata()
+    assert gd.tick == 2 and gd.players[0].position == [20, 0]
+    # nothing new until the next snapshot
+    assert gamestate.acquire_gamedata() is None
+    assert gamestate.gamedata is gd
+
+
+def test_front_not_written():
+    gamestate = GameState()
+    gamestate.apply_snapshot(snapshot(1, 10))
+    front = gamestate.acquire_gamedata()
+    for tick in range(2, 6):
+        gamestate.apply_snapshot(snapshot(tick, tick * 10))
+        assert front.tick == 1 and front.players[0].position == [10, 0]
+    assert gamestate.acquire_gamedata().tick == 5
+
+
+def test_records_reused():
+    gamestate = GameState()
+    seen = set()
+    for tick in range(1, 10):
+        gamestate.apply_snapshot(snapshot(tick, tick))
+        gd = gamestate.acquire_gamedata()
+        assert gd.players[0].position == [tick, 0]
+        seen.add(id(gd.players[0]))
+    # one record per buffer
+    assert len(seen) <= 3
+
+
+def test_full_event_queue():
+    # snapshots don't go through the server event queue: with the queue
+    # full they still reach the render thread
+    gamestate = GameState()
+    cgamedata = ClientGameData()
+    for i in range(SRV_EVENTQ_SIZE):
+        cgamedata.srv_eventq.append(Event(i, 0.0, 'topic', ()))
+    proto = RPCServer2ClientProtocol(None)
+    proto.gamestate = gamestate
+    proto.cgamedata = cgamedata
+    for tick in (1, 2, 3):
+        proto.rpc_ff_listen_for_game_state_or_event(('127.0.0.1', 1234), 0, snapshot(tick, tick))
+        assert gamestate.acquire_gamedata().tick == tick
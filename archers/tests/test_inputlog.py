@@ -0,0 +1,58 @@
+import pytest
+
+import gameserver
+import replay
+from common import inputlog
+from common.datacls import Event
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'session.log'
+    recorder = inputlog.InputRecorder(path, seed=7, tickrate=0.02)
+    recorder.tick(1, 0.02)
+    recorder.record(inputlog.SET_PLAYER_STATE, 1, 0.025, [['127.0.0.1', 40000], [1, 2]])
+    recorder.close()
+    assert recorder.records == 3
+    with inputlog.InputLog(path) as log:
+        assert log.header == {'seed': 7, 'tickrate': 0.02}
+        records = list(log)
+    assert records == [(inputlog.HEADER, 0, 0.0, {'seed': 7, 'tickrate': 0.02}),
+                       (inputlog.TICK, 1, 0.02, None),
+                       (inputlog.SET_PLAYER_STATE, 1, 0.025, [['127.0.0.1', 40000], [1, 2]])]
+
+
+def test_truncated_record(tmp_path):
+    path = tmp_path / 'crashed.log'
+    recorder = inputlog.InputRecorder(path, seed=7)
+    recorder.tick(1, 0.02)
+    recorder.tick(2, 0.04)
+    recorder.close()
+    data = path.read_bytes()
+    # cut in the middle of the last record header
+    path.write_bytes(data[:-5])
+    with inputlog.InputLog(path) as log:
+        assert [r[0] for r in log] == [inputlog.HEADER, inputlog.TICK]
+
+
+def test_not_an_input_log(tmp_path):
+    path = tmp_path / 'other.log'
+    path.write_bytes(b'something else entirely\n')
+    with pytest.raises(ValueError):
+        inputlog.InputLog(path)
+
+
+def test_replay_reproduces_session(tmp_path):
+    path = tmp_path / 'synth.log'
+    replay.synthesize(path, players=20, ticks=120, seed=3)
+    res = replay.replay(path)
+    assert res['ticks'] == 120 and res['players'] == 20
+    assert res['expected_digest'] is not None
+    assert res['digest'] == res['expected_digest']
+
+
+def test_client_event_without_game_state():
+    protocol = gameserver.RPCServerProtocol(None)
+    evt = Event(id=1, ts=0, topic='root.game.player.0.fire_weapon', params=({'klass': 10},))
+    # refused before anything is recorded
+    with pytest.raises(RuntimeError):
+        protocol.rpc_ff_process_client_events(('127.0.0.1', 40000), evt.to_wire())
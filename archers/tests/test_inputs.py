@@ -0,0 +1,140 @@
+from collections import deque
+
+import pytest
+
+from common.core import KEY_DOWN, KEY_LEFT, KEY_RIGHT, KEY_UP, keys_to_mask
+from common.datacls import ClientGameData, ClientPlayerData, PlayerData
+from common.gamethreads import GameThreadManager, acknowledge_inputs
+from gameserver import INPUT_QUEUE_MAX
+from replay import headless_server
+
+SENDER = ('127.0.0.1', 40000)
+PID = 1
+# key state of each seq, cycling
+KEYS = [{KEY_UP: up, KEY_DOWN: False, KEY_LEFT: left, KEY_RIGHT: False}
+        for up, left in ((True, False), (True, True), (False, True), (False, False),
+                         (True, False), (False, True))]
+
+
+@pytest.fixture
+def server():
+    gs_state, protocol = headless_server(seed=1)
+    protocol.rpc_create_player(SENDER, PID, 5000)
+    return gs_state, protocol
+
+
+def send(protocol, seq, history=None):
+    state = PlayerData(id=PID, ts=0.0, position=[0, 0], keys_pressed=KEYS[(seq - 1) % len(KEYS)], speed=100,
+                       seq=seq)
+    if history is None:
+        protocol.rpc_ff_set_player_state(SENDER, state.to_wire())
+    else:
+        history = [[s, keys_to_mask(KEYS[(s - 1) % len(KEYS)])] for s in history]
+        protocol.rpc_ff_set_player_state(SENDER, state.to_wire(), history)
+
+
+def applied(gs_state, ticks):
+    # (seq, keys) of the player after each tick
+    server_state = gs_state.server_state
+    _, p = gs_state.game_state.get_player_from_id(PID)
+    res = []
+    for _ in range(ticks):
+        server_state.update()
+        res.append((p.seq, dict(p.keys_pressed)))
+    return res
+
+
+def counters(gs_state):
+    return gs_state.server_state.metrics.snapshot()['counters']
+
+
+def test_inputs_applied_in_order(server):
+    gs_state, protocol = server
+    for seq in range(1, 7):
+        send(protocol, seq)
+    # a burst isn't cut short: one input per tick, none skipped
+    assert applied(gs_state, 7) == [(s, KEYS[s - 1]) for s in range(1, 7)] + [(6, KEYS[5])]
+    assert not gs_state.server_state.pending_inputs
+
+
+def test_lost_packets_recovered_from_history(server):
+    gs_state, protocol = server
+    send(protocol, 1)
+    # the packets of seq 2 and 3 are lost, 4 carries them in its history
+    send(protocol, 4, history=[1, 2, 3])
+    assert counters(gs_state) == {'recovered_inputs': 2}
+    assert applied(gs_state, 4) == [(s, KEYS[s - 1]) for s in range(1, 5)]
+
+
+def test_resends_dropped(server):
+    gs_state, protocol = server
+    send(protocol, 1)
+    send(protocol, 2, history=[1])
+    send(protocol, 2, history=[1])
+    assert counters(gs_state) == {'duplicate_inputs': 1}
+    assert applied(gs_state, 2) == [(1, KEYS[0]), (2, KEYS[1])]
+    # already applied
+    send(protocol, 1)
+    assert counters(gs_state) == {'duplicate_inputs': 2}
+    assert applied(gs_state, 1) == [(2, KEYS[1])]
+
+
+def test_inputs_lost_with_their_history(server):
+    gs_state, protocol = server
+    send(protocol, 1)
+    # 2 and 3 went out of the history before 5 was sent
+    send(protocol, 5, history=[4])
+    assert counters(gs_state) == {'recovered_inputs': 1, 'lost_inputs': 2}
+    assert applied(gs_state, 3) == [(1, KEYS[0]), (4, KEYS[3]), (5, KEYS[4])]
+
+
+def test_get_player_state_acknowledges(server):
+    gs_state, protocol = server
+    send(protocol, 1)
+    send(protocol, 2)
+    applied(gs_state, 1)
+    position, seq = protocol.rpc_get_player_state(SENDER, PID)
+    assert seq == 1 and len(position) == 2
+
+
+def test_acknowledge_inputs():
+    cgamedata = ClientGameData()
+    player = ClientPlayerData(id=PID, ts=0.0, position=[0, 0], keys_pressed=None, speed=None)
+    assert acknowledge_inputs(cgamedata, player, 3)
+    assert player.last_ack_seq == 3
+    # reordered, older than the last one
+    assert not acknowledge_inputs(cgamedata, player, 2)
+    assert player.last_ack_seq == 3
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    def ff_set_player_state(self, addr, *args):
+        self.sent.append(args)
+
+
+def test_history_sent_before_the_input():
+    manager = GameThreadManager.__new__(GameThreadManager)
+    manager.protocol = Recorder()
+    manager.remote_address = ('127.0.0.1', 1234)
+    player = ClientPlayerData(id=PID, ts=0.0, position=[0, 0], keys_pressed=KEYS[2], speed=100,
+                              seq=3, input_history=deque([(2, 5), (3, 4)]))
+    manager.send_player_state(player)
+    args, = manager.protocol.sent
+    assert args == (player.to_wire(), [[2, 5]])
+
+
+
+def test_burst_over_the_cap(server):
+    gs_state, protocol = server
+    burst = INPUT_QUEUE_MAX * 3
+    for seq in range(1, burst + 1):
+        send(protocol, seq)
+    res = applied(gs_state, INPUT_QUEUE_MAX + 1)
+    # the inputs beyond the cap are applied at once, then one per tick
+    assert [seq for seq, _ in res] == list(range(burst - INPUT_QUEUE_MAX, burst + 1))
+    assert all(keys == KEYS[(seq - 1) % len(KEYS)] for seq, keys in res)
+    assert not gs_state.server_state.pending_inputs
+    assert counters(gs_state) == {'merged_inputs': burst - INPUT_QUEUE_MAX - 1}
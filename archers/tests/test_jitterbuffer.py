@@ -0,0 +1,53 @@
+from common.jitterbuffer import JitterBuffer, MAX_EXTRAPOLATION, MIN_INTERP_DELAY
+
+
+def steady(jb, n=5, interval=0.05, transit=0.02):
+    for i in range(n):
+        jb.push(i * interval, (i * 10.0, 0.0), tick=i, local_time=i * interval + transit)
+
+
+def test_empty():
+    assert JitterBuffer().sample(1.0) == (False, None)
+
+
+def test_interpolation():
+    jb = JitterBuffer(adaptive=False, interp_delay=0.1)
+    steady(jb)
+    # render time = 0.25 - 0.02 - 0.1 = 0.13 -> x = 26
+    ok, pos = jb.sample(0.25)
+    assert ok and abs(pos[0] - 26.0) < 1e-9 and pos[1] == 0.0
+
+
+def test_extrapolation_capped():
+    jb = JitterBuffer(adaptive=False, interp_delay=0.1)
+    steady(jb)
+    ok, pos = jb.sample(10.0)
+    assert abs(pos[0] - (40.0 + 200.0 * MAX_EXTRAPOLATION)) < 1e-9
+    assert jb.extrapolated == 1
+
+
+def test_late_snapshot_refused():
+    jb = JitterBuffer()
+    steady(jb)
+    assert not jb.push(0.1, (0, 0), local_time=0.3) and jb.late == 1
+    assert len(jb) == 5
+
+
+def test_fixed_clock_offset():
+    jb = JitterBuffer(adaptive=False, interp_delay=0.1)
+    jb.set_clock_offset(0.5)
+    steady(jb)
+    assert jb.offset == 0.5
+    # render time = 0.73 - 0.5 - 0.1 = 0.13
+    assert abs(jb.sample(0.73)[1][0] - 26.0) < 1e-9
+    jb.set_clock_offset(None)
+    assert jb.offset is None
+
+
+def test_delay_follows_jitter():
+    smooth, jittery = JitterBuffer(), JitterBuffer()
+    for i in range(200):
+        smooth.push(i * 0.05, (0, 0), local_time=i * 0.05 + 0.02)
+        jittery.push(i * 0.05, (0, 0), local_time=i * 0.05 + 0.02 + (0.03 if i % 2 else 0.0))
+    assert MIN_INTERP_DELAY <= smooth.interp_delay < jittery.interp_delay
+    assert jittery.jitter > 0.02
@@ -0,0 +1,57 @@
+import io
+import logging
+
+import pytest
+
+from common import logsetup
+from common.logsetup import HotLog
+
+
+@pytest.fixture
+def root_logger():
+    # setup() replaces the root handlers, put them back afterwards
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    for h in handlers:
+        root.addHandler(h)
+    root.setLevel(level)
+
+
+def test_setup_and_hotlog(root_logger):
+    out = io.StringIO()
+    listener = logsetup.setup(logging.INFO, out, '%(message)s')
+    log = logging.getLogger('test')
+    t = [0.0]
+    hot = HotLog(log, every=2, rate=1, burst=2, clock=lambda: t[0])
+    for i in range(10):
+        hot.info('packet %d', i)    # 5 sampled, 2 in the burst
+    t[0] += 1.0
+    hot.info('packet %d', 10)       # sampled out
+    hot.info('packet %d', 11)
+    hot.debug('not built %s', None)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        log.exception('failed')
+    listener.stop()
+    lines = out.getvalue().splitlines()
+    assert lines[:3] == ['packet 1', 'packet 3', 'packet 11 (3 rate limited)']
+    assert lines[3] == 'failed' and 'ZeroDivisionError' in out.getvalue()
+
+
+def test_level_checked_first():
+    log = logging.getLogger('test.quiet')
+    log.setLevel(logging.WARNING)
+    hot = HotLog(log, clock=lambda: 0.0)
+    hot.info('dropped')
+    # below the level: neither sampled nor rate limited
+    assert hot.calls == 0 and hot.dropped == 0
+
+
+def test_stop_twice(root_logger):
+    listener = logsetup.setup(logging.INFO, io.StringIO())
+    logsetup.stop(listener)
+    logsetup.stop(listener)
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import random
+
+import pytest
+
+from common import clocksync
+from common.clocksync import ClockSync
+from common.loopback import (Link, LinkProfile, LoopbackFabric, VirtualClock, VirtualTimeLoop,
+                             install)
+from common.protocol import EndpointHelper, RPCProtocol
+
+SERVER = ('127.0.0.1', 1234)
+
+
+class Echo(RPCProtocol):
+    def rpc_echo(self, sender, value):
+        return value
+
+
+@pytest.fixture(autouse=True)
+def quiet_protocol():
+    # the lost requests log their timeouts
+    logger = logging.getLogger('common.protocol')
+    level = logger.level
+    logger.setLevel(logging.CRITICAL)
+    yield
+    logger.setLevel(level)
+
+
+def simulate(profile, seed, n=100):
+    clock = VirtualClock(start=0.0)
+    loop = VirtualTimeLoop(clock)
+    fabric = LoopbackFabric(profile, seed=seed)
+
+    async def main():
+        with install(fabric):
+            helper = EndpointHelper(Echo, None)
+            await helper.open_local_endpoint('0.0.0.0', SERVER[1])
+            _, client = await helper.open_remote_endpoint(*SERVER)
+        results = []
+        for i in range(n):
+            results.append(await client.echo(SERVER, i))
+        return results, loop.time()
+
+    try:
+        results, elapsed = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    return results, elapsed, fabric.stats()
+
+
+def test_latency():
+    results, elapsed, stats = simulate(LinkProfile(latency=0.05), seed=1, n=10)
+    assert results == [(True, i) for i in range(10)]
+    # one round trip per request, in virtual time
+    assert elapsed == pytest.approx(10 * 0.1)
+    assert stats['sent'] == stats['delivered'] == 20 and stats['lost'] == 0
+
+
+def test_same_seed_same_run():
+    profile = LinkProfile(latency=0.05, jitter=0.02, loss=0.2)
+    r1, elapsed, stats = simulate(profile, seed=1)
+    r2, elapsed2, stats2 = simulate(profile, seed=1)
+    assert r1 == r2 and stats == stats2 and elapsed == elapsed2
+    assert all(v == i for i, (ok, v) in enumerate(r1) if ok)
+    # the lost requests waited for their 5s timeout, without sleeping
+    assert stats['lost'] > 0 and elapsed > 5
+
+
+def test_bandwidth_queue():
+    link = Link(LinkProfile(bandwidth=1000, queue_limit=200))
+    rnd = random.Random(1)
+    assert link.schedule(0.0, 100, rnd) == [pytest.approx(0.1)]
+    assert link.schedule(0.0, 100, rnd) == [pytest.approx(0.2)]
+    assert link.schedule(0.0, 100, rnd) == [pytest.approx(0.3)]
+    # 0.3 s queued at 1000 B/s is above the 200 bytes limit
+    assert link.schedule(0.0, 100, rnd) == ()
+    assert link.stats.queue_dropped == 1
+
+
+def test_duplicate():
+    link = Link(LinkProfile(latency=0.01, duplicate=1.0))
+    assert link.schedule(1.0, 10, random.Random(1)) == [pytest.approx(1.01)] * 2
+    assert link.stats.duplicated == 1
+
+
+def test_profile_per_link():
+    fabric = LoopbackFabric(LinkProfile(latency=0.01))
+    slow = LinkProfile(latency=0.5)
+    fabric.set_profile(slow, dst=1234)
+    assert fabric._link(('127.0.0.1', 50000), SERVER).profile is slow
+    assert fabric._link(SERVER, ('127.0.0.1', 50000)).profile is fabric.default_profile
+
+
+def test_virtual_sleep():
+    loop = VirtualTimeLoop(VirtualClock(start=10.0))
+    try:
+        loop.run_until_complete(asyncio.sleep(3600))
+        assert loop.time() == pytest.approx(3610.0)
+    finally:
+        loop.close()
+
+
+def test_patch_reaches_existing_clocksync():
+    # created before the patch, and without a clock of its own
+    cs = ClockSync()
+    cs.add_sample(0.0, 100.020, 100.021, 0.041)
+    clock = VirtualClock(start=5.0)
+    with clock.patch(clocksync):
+        assert cs.now() == 5.0
+        assert cs.server_now() == pytest.approx(105.0)
+        clock.advance(1.0)
+        assert cs.now() == 6.0
+    assert cs.now() != 6.0
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+from common.metrics import PERCENTILES, RESOLUTION, Histogram, Registry, dump, serve_stats
+
+
+def test_percentile_accuracy():
+    rnd = random.Random(1)
+    h = Histogram()
+    values = sorted(rnd.expovariate(1 / 0.002) for _ in range(100000))
+    for v in values:
+        h.record(v)
+    for p in PERCENTILES:
+        exact = values[int(len(values) * p / 100) - 1]
+        assert abs(h.percentile(p) - exact) <= exact * 0.033 + RESOLUTION, p
+
+
+def test_exact_small_values():
+    h = Histogram()
+    for us in range(1, 11):
+        h.record(us * RESOLUTION)
+    assert h.count == 10
+    assert h.percentile(50) == pytest.approx(5 * RESOLUTION)
+    assert h.percentile(100) == pytest.approx(10 * RESOLUTION)
+    assert h.min == pytest.approx(RESOLUTION) and h.max == pytest.approx(10 * RESOLUTION)
+
+
+def test_huge_value_clamped():
+    h = Histogram()
+    h.record(1e9)
+    # counted in the last bucket, max keeps the value
+    assert h.counts[-1] == 1 and h.max == 1e9
+    assert h.percentile(99) == h.bucket_upper(len(h.counts) - 1)
+
+
+def test_empty_and_reset():
+    h = Histogram()
+    assert h.percentile(99) == 0.0
+    assert h.summary()['mean'] == 0.0
+    h.record(0.5)
+    h.reset()
+    assert h.count == 0 and h.min is None and not any(h.counts)
+
+
+def test_snapshot():
+    registry = Registry()
+    registry.counter('datagrams_in').inc()
+    registry.counter('datagrams_in').inc(2)
+    registry.histogram('tick').record(0.002)
+    registry.add_collector('server', lambda: {'players': 12})
+    snap = registry.snapshot()
+    assert snap['counters'] == {'datagrams_in': 3}
+    assert snap['histograms_ms']['tick']['count'] == 1
+    assert snap['histograms_ms']['tick']['max'] == pytest.approx(2.0)
+    assert snap['server'] == {'players': 12}
+    # the same instances are handed out by name
+    assert registry.histogram('tick') is registry.histograms['tick']
+    json.dumps(snap)
+
+
+def test_dump(tmp_path):
+    registry = Registry()
+    registry.counter('ticks').inc(5)
+    path = tmp_path / 'stats.json'
+    dump(registry, path)
+    assert json.loads(path.read_text())['counters'] == {'ticks': 5}
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_serve_stats():
+    registry = Registry()
+    registry.counter('ticks').inc(5)
+
+    async def get(path):
+        server = await serve_stats(registry, 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET %s HTTP/1.0\r\n\r\n' % path)
+            response = await reader.read()
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return head.split(b'\r\n')[0], json.loads(body)
+
+    status, body = asyncio.run(get(b'/'))
+    assert status == b'HTTP/1.0 200 OK' and body['counters'] == {'ticks': 5}
+    status, body = asyncio.run(get(b'/other'))
+    assert status == b'HTTP/1.0 404 Not Found' and body == {}
@@ -0,0 +1,70 @@
+import json
+
+from common.profiler import Profiler
+
+
+def frames(p, n=3):
+    frame, child, other = p.zone('frame'), p.zone('child'), p.zone('other')
+    for _ in range(n):
+        with frame:
+            with child:
+                pass
+            with child:
+                pass
+            with other:
+                pass
+
+
+def test_disabled():
+    p = Profiler(capacity=8)
+    frames(p)
+    assert p.count == 0 and list(p.events()) == []
+
+
+def test_zones_reused():
+    p = Profiler()
+    assert p.zone('frame') is p.zone('frame')
+
+
+def test_events_wrap_around():
+    p = Profiler(capacity=8, enabled=True)
+    frames(p)
+    assert p.count == 12
+    events = list(p.events())
+    assert len(events) == 8
+    # in exit order, children before their parent
+    assert [e[0] for e in events][-4:] == ['child', 'child', 'other', 'frame']
+    assert [e[3] for e in events][-4:] == [1, 1, 1, 0]
+
+
+def test_recent():
+    p = Profiler(enabled=True)
+    frames(p)
+    recent = p.recent('frame', 2)
+    assert len(recent) == 2
+    for dur, children in recent:
+        assert set(children) == {'child', 'other'}
+        assert sum(children.values()) <= dur
+    assert len(p.recent('frame', 10)) == 3
+
+
+def test_enable_drops_open_zones():
+    p = Profiler(enabled=True)
+    z = p.zone('z')
+    z.__enter__()
+    p.enable()
+    # entered before enable(), not recorded
+    z.__exit__(None, None, None)
+    assert p.count == 0
+
+
+def test_export_chrome(tmp_path):
+    p = Profiler(enabled=True)
+    frames(p, 1)
+    path = tmp_path / 'trace.json'
+    assert p.export_chrome(path, pid=1) == 4
+    events = json.loads(path.read_text())['traceEvents']
+    # sorted for the viewers: the parent first
+    assert events[0]['name'] == 'frame'
+    assert all(e['ph'] == 'X' and e['pid'] == 1 for e in events)
+    assert [e['ts'] for e in events] == sorted(e['ts'] for e in events)
@@ -0,0 +1,29 @@
+from common.helpers import FACE_UP
+from common.projectile import ProjectileManager, MAX_DIS
+
+
+def test_sprites_reused():
+    manager = ProjectileManager(pool_size=1)
+    first = manager.spawn(1, 0, position=(0, 0))
+    assert manager.get(1) is first and len(manager) == 1
+    assert manager.despawn(1) and not manager.despawn(1)
+    assert manager.spawn(2, 0, position=(10, 10)) is first
+    assert manager.get(1) is None and len(manager.sprites) == 1
+
+
+def test_pool_grows():
+    manager = ProjectileManager(pool_size=1)
+    sprites = {id(manager.spawn(i, 0, position=(0, 0))) for i in range(3)}
+    assert len(sprites) == 3 and len(manager) == 3
+
+
+def test_expired():
+    manager = ProjectileManager(pool_size=2)
+    manager.spawn(1, 0, position=(0, 0))
+    manager.spawn(2, 0, facing=FACE_UP, position=(0, 0), max_dis=MAX_DIS * 2)
+    for _ in range(150):
+        manager.update_animation(0.02)
+        manager.update()
+    # 1200 px travelled, only the first one is past its range
+    assert manager.despawn_expired() == [1]
+    assert len(manager) == 1 and manager.get(2) is not None
@@ -0,0 +1,58 @@
+import threading
+import pytest
+from common.ringbuffer import RingBuffer, RingBufferFull, DROP_OLDEST, DROP_NEWEST, BLOCK
+
+
+def test_drop_oldest():
+    rb = RingBuffer(2)
+    rb.append(1)
+    rb.append(2)
+    assert rb.append(3)
+    assert list(rb) == [2, 3] and rb.dropped == 1 and rb.high_water == 2
+    assert rb[0] == 2 and rb[-1] == 3 and len(rb) == 2
+    assert rb.popleft() == 2 and rb.popleft() == 3
+    with pytest.raises(IndexError):
+        rb.popleft()
+
+
+def test_drop_newest():
+    rb = RingBuffer(1, policy=DROP_NEWEST)
+    assert rb.append('a') and not rb.append('b')
+    assert rb.popleft() == 'a' and rb.dropped == 1
+    assert not rb
+
+
+def test_block_timeout():
+    rb = RingBuffer(1, policy=BLOCK, block_timeout=0.01)
+    rb.append(1)
+    with pytest.raises(RingBufferFull):
+        rb.append(2)
+
+
+def test_block_waits_for_consumer():
+    rb = RingBuffer(1, policy=BLOCK, block_timeout=5)
+    rb.append(1)
+    popped = []
+    consumer = threading.Timer(0.02, lambda: popped.append(rb.popleft()))
+    consumer.start()
+    rb.append(2)
+    consumer.join()
+    assert popped == [1] and list(rb) == [2] and rb.dropped == 0
+
+
+def test_wraps_around():
+    rb = RingBuffer(3, policy=DROP_NEWEST)
+    out = []
+    for i in range(10):
+        assert rb.append(i)
+        if i % 2:
+            out.append(rb.popleft())
+            out.append(rb.popleft())
+    assert out == list(range(10)) and rb.high_water == 2
+
+
+def test_bad_arguments():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+    with pytest.raises(ValueError):
+        RingBuffer(4, policy=DROP_OLDEST + DROP_NEWEST + BLOCK)
@@ -0,0 +1,98 @@
+import io
+import json
+import time
+
+import pytest
+
+from common import tracing
+from common.arcadegame import ArcadeGame
+from common.datacls import ClientPlayerData
+from common.entities import PlayerEntity
+from common.playercharacter import PlayerCharacter
+from common.tracing import DRAWN, KEY, RECV, SENT, UPDATE, Tracer, breakdown
+
+
+def traced(render=True):
+    out = io.StringIO()
+    tracer = Tracer(out, sample=1.0, render=render, player_id=3, seed=1)
+    trace_id = tracer.start()
+    tracer.sent(trace_id, 7)
+    return tracer, trace_id, out
+
+
+def test_sampling():
+    tracer = Tracer(sample=0.0)
+    assert tracer.start() is None and tracer.active == 0
+
+
+def test_complete_trace():
+    tracer, trace_id, out = traced()
+    assert tracer.waiting
+    tracer.acked(6)
+    assert tracer.waiting
+    tracer.acked(7)
+    assert not tracer.waiting
+    tracer.server(trace_id, [0.01, 0.002])
+    tracer.frame(RECV, UPDATE)
+    assert tracer.completed == 0
+    tracer.frame(UPDATE, DRAWN)
+    assert tracer.completed == 1 and tracer.active == 0
+    record = json.loads(out.getvalue())
+    assert record['trace'] == trace_id and record['player'] == 3 and record['seq'] == 7
+    assert list(record['stages_ms']) == [KEY, SENT, RECV, UPDATE, DRAWN]
+    assert record['server_ms'] == pytest.approx([10.0, 2.0])
+
+
+def test_frame_before():
+    tracer, trace_id, out = traced()
+    queued_at = time.perf_counter()
+    tracer.acked(7)
+    tracer.server(trace_id, [0.01, 0.002])
+    # the correction applied was queued before this input was acked
+    tracer.frame(RECV, UPDATE, queued_at)
+    tracer.frame(UPDATE, DRAWN)
+    assert tracer.completed == 0
+    tracer.frame(RECV, UPDATE, time.perf_counter())
+    tracer.frame(UPDATE, DRAWN)
+    assert tracer.completed == 1
+
+
+def test_headless_ends_at_recv():
+    tracer, trace_id, out = traced(render=False)
+    tracer.server(trace_id, [0.01, 0.002])
+    tracer.acked(7)
+    assert tracer.completed == 1
+    assert list(json.loads(out.getvalue())['stages_ms']) == [KEY, SENT, RECV]
+
+
+def test_timeout(monkeypatch):
+    tracer, trace_id, out = traced()
+    now = time.perf_counter() + tracing.TRACE_TIMEOUT + 1
+    monkeypatch.setattr(tracing.time, 'perf_counter', lambda: now)
+    tracer.start()
+    assert tracer.timed_out == 1 and not tracer.waiting
+
+
+def test_breakdown():
+    record = {'stages_ms': {KEY: 0.0, SENT: 1.0, RECV: 41.0, UPDATE: 50.0, DRAWN: 55.0},
+              'server_ms': [10.0, 2.0]}
+    assert breakdown(record) == {'input_queue': 1.0, 'network': 28.0, 'server_tick': 10.0,
+                                 'server_publish': 2.0, 'client_recv': 9.0, 'render': 5.0,
+                                 'total': 55.0}
+    del record['stages_ms'][UPDATE], record['stages_ms'][DRAWN]
+    assert breakdown(record)['total'] == 41.0 and 'render' not in breakdown(record)
+
+
+def test_correction_reported():
+    # UPDATE is stamped on the frames update_calc_pos_client applies a
+    # server correction to the local sprite
+    game = ArcadeGame.__new__(ArcadeGame)
+    sprite = PlayerCharacter(0, 'pics')
+    data = ClientPlayerData(id=0, ts=0.0, position=[0.0, 0.0], keys_pressed=None, speed=None)
+    entity = PlayerEntity(data, sprite, local=True)
+    data.pos_corr_buff.append([10.0, 0.0])
+    assert game.update_calc_pos_client(1 / 60, entity)
+    assert sprite.change_x == pytest.approx(5.0)
+    # without a correction queued (nor keys pressed) nothing is applied
+    data.pos_corr_buff.clear()
+    assert not game.update_calc_pos_client(1 / 60, PlayerEntity(data, sprite))
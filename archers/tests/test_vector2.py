@@ -0,0 +1,83 @@
+import math
+
+import pytest
+
+from common.vector2 import Vector2, Vector2Array
+
+
+def test_set():
+    v = Vector2(1., 2.)
+    assert v.set(3., 4.) is v and v == (3., 4.)
+
+
+def test_add_sub_xy():
+    v = Vector2(1., 2.)
+    assert v.add_xy(2., 3.) is v and v == (3., 5.)
+    assert v.sub_xy(1., 1.) is v and v == (2., 4.)
+
+
+def test_scale():
+    v = Vector2(1., 2.)
+    assert v.scale(2) is v and v == (2., 4.)
+
+
+def test_lerp():
+    v = Vector2(1., 2.)
+    assert v.lerp((3., 4.), 0.5) is v and v == (2., 3.)
+    assert v.lerp(Vector2(4., 5.), 0.) == (2., 3.)
+
+
+@pytest.mark.parametrize('call, expected', [
+    (lambda v, out: v.get_sum((1, 1), out), (2., 3.)),
+    (lambda v, out: v.get_difference((1, 1), out), (0., 1.)),
+    (lambda v, out: v.get_scaled(3, out), (3., 6.)),
+    (lambda v, out: v.get_interpolated_to((3., 4.), 0.5, out), (2., 3.)),
+])
+def test_out_parameter(call, expected):
+    v = Vector2(1., 2.)
+    out = Vector2(0, 0)
+    assert call(v, out) is out and out == expected
+    # without out, a new vector and v unchanged
+    res = call(v, None)
+    assert res is not v and res is not out and res == expected
+    assert type(res) is Vector2 and v == (1., 2.)
+
+
+@pytest.fixture(params=[False, True], ids=['array', 'numpy'])
+def use_numpy(request):
+    if request.param:
+        pytest.importorskip('numpy')
+    return request.param
+
+
+def test_array_basics(use_numpy):
+    va = Vector2Array([(0., 0.), (2., 4.)], use_numpy=use_numpy)
+    assert len(va) == 2
+    assert va[1] == (2., 4.) and va[-1] == (2., 4.)
+    va[0] = (1., 1.)
+    assert list(va) == [(1., 1.), (2., 4.)]
+    assert list(Vector2Array.zeros(3, use_numpy)) == [(0., 0.)] * 3
+    copy = va.copy()
+    copy[0] = (5., 5.)
+    assert va[0] == (1., 1.)
+
+
+def test_array_operations(use_numpy):
+    va = Vector2Array([(0., 0.), (2., 4.)], use_numpy=use_numpy)
+    vb = Vector2Array([(2., 2.), (4., 8.)], use_numpy=use_numpy)
+    out = Vector2Array.zeros(2, use_numpy)
+    assert va.lerp(vb, 0.5, out) is out and list(out) == [(1., 1.), (3., 6.)]
+    assert list(va.sub(vb, out)) == [(-2., -2.), (-2., -4.)]
+    assert list(va) == [(0., 0.), (2., 4.)]
+    # in place by default
+    assert va.add((1., 1.)) is va and list(va) == [(1., 1.), (3., 5.)]
+    assert list(va.add(vb)) == [(3., 3.), (7., 13.)]
+    assert list(va.scale(2)) == [(6., 6.), (14., 26.)]
+    assert list(va.lerp((0., 0.), 0.5)) == [(3., 3.), (7., 13.)]
+    assert list(va.lengths()) == pytest.approx([math.sqrt(18), math.sqrt(218)])
+
+
+def test_array_out_length(use_numpy):
+    va = Vector2Array([(0., 0.), (2., 4.)], use_numpy=use_numpy)
+    with pytest.raises(ValueError):
+        va.add((1., 1.), Vector2Array.zeros(3, use_numpy))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Per stage latency percentiles of the input traces written by
+main.py --trace or bots.py --trace (see common.tracing).
+
+    python bots.py -n 50 --trace traces.jsonl
+    python tracereport.py traces.jsonl [more.jsonl ...] [--json out.json]
+"""
+import argparse
+import json
+import sys
+from common.tracing import INTERVALS, breakdown
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_samples, p):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * p / 100))]
+
+
+def load(paths):
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    return records
+
+
+def report(records):
+    """name -> {'n', 'mean', 'p50', ..., 'max'} in ms"""
+    samples = {name: [] for name, _ in INTERVALS}
+    for record in records:
+        for name, ms in breakdown(record).items():
+            samples[name].append(ms)
+    res = {}
+    for name, values in samples.items():
+        if not values:
+            continue
+        values.sort()
+        res[name] = {'n': len(values), 'mean': sum(values) / len(values), 'max': values[-1]}
+        for p in PERCENTILES:
+            res[name]['p%d' % p] = percentile(values, p)
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('traces', nargs='+', help='JSON lines trace files')
+    parser.add_argument('--json', metavar='FILE', help='also write the breakdown to FILE')
+    args = parser.parse_args()
+
+    records = load(args.traces)
+    if not records:
+        print('no traces')
+        return 1
+    res = report(records)
+    players = {r['player'] for r in records}
+    print('%d traces from %d player(s), ms' % (len(records), len(players)))
+    print('%-16s %6s %8s %8s %8s %8s %8s  %s' % ('stage', 'n', 'mean', 'p50', 'p90', 'p99', 'max', ''))
+    for name, description in INTERVALS:
+        r = res.get(name)
+        if r is None:
+            continue
+        print('%-16s %6d %8.2f %8.2f %8.2f %8.2f %8.2f  %s' % (
+            name, r['n'], r['mean'], r['p50'], r['p90'], r['p99'], r['max'], description))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())